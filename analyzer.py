@@ -1,12 +1,21 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, Scrollbar, Listbox
-import subprocess
+import multiprocessing
 import os
-import json
-import pandas as pd
-import re
+import queue
+import threading
 import sys
 
+import compare
+import fleetstats
+import metrics
+import sorbatch
+from eventstore import EventStore, STORE_NAME
+from filelist import FILTER_FIELDS, FileSet, VirtualList, file_keys, scan_dump_files
+from traceview import TraceView
+from report import find_dump_files, process_json_and_extract, classify_events, write_xlsx_report, dump_trace_path, \
+    trace_events, DUMP_SUFFIXES
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for PyInstaller bundles. """
     if hasattr(sys, '_MEIPASS'):
@@ -16,253 +25,66 @@ def resource_path(relative_path):
 # Use the function to get the correct path
 rbOTDR_path = resource_path("rbOTDR.rb")
 
-def process_json_and_extract(file_paths):
-    """
-    Processes JSON files and extracts structured data for both stacked and wide report formats.
-    Returns a list of dictionaries with extracted fields to match the format of the XLSX report.
-    """
-    extracted_data = []
-    for file_path in file_paths:
-        try:
-            with open(file_path, 'r') as file:
-                json_data = json.load(file)
-
-                # Extract shot direction and fiber ID from filename
-                filename = json_data.get("filename", "")
-                shot_direction = " ".join(filename.split(" ")[:2])  # First two parts of the filename
-                fiber_id = re.search(r"\s(\d{3})\s", filename)
-                fiber_id = fiber_id.group(1) if fiber_id else ""
-
-                # Extract fields from JSON
-                distance_km = json_data.get("GenParams", {}).get("distance_km", "")
-                range_value = json_data.get("FxdParams", {}).get("range", "")  # Extract range value
-
-                # Get all events
-                events = json_data.get("KeyEvents", {})
-                event_data = []
-                max_distance = 0
-                for event_key, event_info in events.items():
-                    if event_key.startswith("event"):
-                        distance = float(event_info.get("distance", 0))
-                        if distance > max_distance:
-                            max_distance = distance
-                        event_data.append({
-                            "Event": event_key,
-                            "Distance": distance,
-                            "Splice_Loss": event_info.get("splice loss", ""),
-                            "Refl_Loss": event_info.get("refl loss", ""),
-                            "Comments": event_info.get("comments", ""),
-                        })
-
-                # Total shot distance (highest distance found in the events)
-                distance_km = max_distance if not distance_km else distance_km
-
-                # Prepare the record to match both wide and stacked formats
-                record = {
-                    "Shot_Direction": shot_direction,
-                    "Fiber_ID": fiber_id,
-                    "Range": range_value,  # Range will be on the left side, alongside Fiber_ID
-                    "Distance_KM": distance_km,  # Total shot distance
-                }
-
-                # Add event data as columns under the fiber ID block (for wide format)
-                event_counter = 1
-                for event in event_data:
-                    record[f"Event_{event_counter}"] = event["Event"]
-                    record[f"Event_{event_counter}_Distance"] = event["Distance"]
-                    record[f"Event_{event_counter}_Splice_Loss"] = event["Splice_Loss"]
-                    record[f"Event_{event_counter}_Refl_Loss"] = event["Refl_Loss"]
-                    record[f"Event_{event_counter}_Comments"] = event["Comments"]
-                    event_counter += 1
-
-                extracted_data.append(record)
-
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-
-    return extracted_data
-
-
-def apply_conditional_formatting(worksheet, df, workbook):
-    """
-    Applies conditional formatting to the Comments column or Event_X_Comments columns based on the report type.
-    """
-    # Formats
-    format_critical = workbook.add_format({'bg_color': '#FF0000', 'align': 'left', 'bold': True})  # Red
-    format_warning = workbook.add_format({'bg_color': '#FFA500', 'align': 'left', 'bold': True})  # Orange
-    format_pass = workbook.add_format({'bg_color': '#D9EAD3', 'align': 'left', 'bold': True})  # Green
-
-    # Check if it is a wide or stacked report
-    if "Comments" in df.columns:  # Stacked report
-        comments_col_idx = df.columns.get_loc("Comments")  # Get index of the Comments column
-        worksheet.conditional_format(
-            1, comments_col_idx, len(df), comments_col_idx,  # First data row to last data row
-            {'type': 'text', 'criteria': 'containing', 'value': 'Possible break', 'format': format_critical}
-        )
-        worksheet.conditional_format(
-            1, comments_col_idx, len(df), comments_col_idx,  # First data row to last data row
-            {'type': 'text', 'criteria': 'containing', 'value': 'Possible microbend', 'format': format_warning}
-        )
-        worksheet.conditional_format(
-            1, comments_col_idx, len(df), comments_col_idx,  # First data row to last data row
-            {'type': 'text', 'criteria': 'containing', 'value': 'Pass', 'format': format_pass}
-        )
-    else:  # Wide report
-        for col_idx, col_name in enumerate(df.columns):
-            if col_name.endswith("_Comments"):  # Apply formatting to Event_X_Comments columns
-                worksheet.conditional_format(
-                    1, col_idx, len(df), col_idx,  # First data row to last data row
-                    {'type': 'text', 'criteria': 'containing', 'value': 'Possible break', 'format': format_critical}
-                )
-                worksheet.conditional_format(
-                    1, col_idx, len(df), col_idx,  # First data row to last data row
-                    {'type': 'text', 'criteria': 'containing', 'value': 'Possible microbend', 'format': format_warning}
-                )
-                worksheet.conditional_format(
-                    1, col_idx, len(df), col_idx,  # First data row to last data row
-                    {'type': 'text', 'criteria': 'containing', 'value': 'Pass', 'format': format_pass}
-                )
+# Files read per message when importing into the JSON file list
+IMPORT_BATCH = 200
 
-def generate_stacked_report(extracted_data):
-    """
-    Generates the stacked report where events are stacked in rows.
-    This will add a blank row between different Fiber IDs to separate them.
-    """
-    stacked_data = []
-    last_fiber_id = None
-
-    for record in extracted_data:
-        shot_direction = record['Shot_Direction']
-        fiber_id = record['Fiber_ID']
-        range_value = record['Range']
-        distance_km = record['Distance_KM']
-
-        # If fiber ID changes, add a blank row to separate fibers
-        if fiber_id != last_fiber_id:
-            if last_fiber_id is not None:  # Skip the blank row before the first fiber
-                stacked_data.append({
-                    "Shot_Direction": "",
-                    "Fiber_ID": "",
-                    "Range": "",
-                    "Distance_KM": "",
-                    "Event": "",
-                    "Event_Distance": "",
-                    "Splice_Loss": "",
-                    "Refl_Loss": "",
-                    "Comments": ""
-                })
-            last_fiber_id = fiber_id
-
-        # For each event, create a new row
-        event_counter = 1
-        while f"Event_{event_counter}" in record:
-            event_data = {
-                "Shot_Direction": shot_direction,
-                "Fiber_ID": fiber_id,
-                "Range": range_value,
-                "Distance_KM": distance_km,
-                "Event": record[f"Event_{event_counter}"],
-                "Event_Distance": record[f"Event_{event_counter}_Distance"],
-                "Splice_Loss": record[f"Event_{event_counter}_Splice_Loss"],
-                "Refl_Loss": record[f"Event_{event_counter}_Refl_Loss"],
-                "Comments": record[f"Event_{event_counter}_Comments"]
-            }
-            stacked_data.append(event_data)
-            event_counter += 1
-
-    return pd.DataFrame(stacked_data)
-
-def generate_wide_report(extracted_data):
-    """
-    Generates the wide report where events are placed on the X-axis.
-    """
-    # Create DataFrame from extracted JSON data
-    df = pd.DataFrame(extracted_data)
-
-    # In the wide format, each event should have its own columns (Event, Distance, Splice Loss, etc.)
-    wide_report_data = []
-    for idx, row in df.iterrows():
-        shot_direction = row['Shot_Direction']
-        fiber_id = row['Fiber_ID']
-        range_value = row['Range']
-        distance_km = row['Distance_KM']
-
-        # Create a record for this fiber with all events in columns
-        event_data = {
-            "Shot_Direction": shot_direction,
-            "Fiber_ID": fiber_id,
-            "Range": range_value,  # Range appears only once on the left side
-            "Distance_KM": distance_km,
-        }
-
-        event_counter = 1
-        while f"Event_{event_counter}" in row:
-            event_data[f"Event_{event_counter}"] = row[f"Event_{event_counter}"]
-            event_data[f"Event_{event_counter}_Distance"] = row[f"Event_{event_counter}_Distance"]
-            event_data[f"Event_{event_counter}_Splice_Loss"] = row[f"Event_{event_counter}_Splice_Loss"]
-            event_data[f"Event_{event_counter}_Refl_Loss"] = row[f"Event_{event_counter}_Refl_Loss"]
-            event_data[f"Event_{event_counter}_Comments"] = row[f"Event_{event_counter}_Comments"]
-            event_counter += 1
-
-        wide_report_data.append(event_data)
-
-    return pd.DataFrame(wide_report_data)
-
-def generate_report():
+# Where the report's events come from, as offered in the JSON tab (see fiberData.py --events)
+EVENT_SOURCES = {"KeyEvents": "keyevents", "Trace analysis": "trace", "KeyEvents and trace analysis": "both"}
+
+# The JSON files chosen for the report; the list widget only shows them
+json_files = FileSet()
+
+def generate_report(store_path=None):
     """
-    Processes the selected JSON files, generates either a wide or stacked report, and saves it as an Excel file.
+    Processes the JSON files shown in the list (after filtering), or every shot in an event
+    store if store_path is given, generates either a wide or stacked report, and saves it as
+    an Excel file.
     """
-    file_paths = list(json_file_listbox.get(0, tk.END))
+    file_paths = list(json_files.view)
 
-    if not file_paths:
+    if store_path is None and not file_paths:
         messagebox.showerror("Error", "No files selected for processing.")
         return
 
     try:
-        extracted_data = process_json_and_extract(file_paths)
+        load_errors = []
+        run_metrics = metrics.Metrics()
+        if store_path is not None:
+            with run_metrics.span("store query"), EventStore(store_path) as store:
+                shots, events = store.query()
+        else:
+            with run_metrics.span("decode"):
+                shots, events = process_json_and_extract(file_paths, errors=load_errors, metrics=run_metrics)
+        run_metrics.count("shots", len(shots))
+        run_metrics.count("events", len(events))
+
+        events_mode = EVENT_SOURCES[event_source_var.get()]
+        if events_mode != "keyevents" and not shots.empty:
+            with run_metrics.span("trace analysis"):
+                events, _ = trace_events(shots, events, mode=events_mode)
 
-        if not extracted_data:
+        for error in load_errors:
+            print(f"Error processing {error['file']}: {error['error']}: {error['message']}")
+
+        if shots.empty:
             messagebox.showerror("Error", "No valid data extracted.")
             return
 
-        # Retrieve user-defined tolerances
-        user_pass_tolerance = pass_tolerance.get()
-        user_warning_tolerance = warning_tolerance.get()
-
-        # Analyze the entire run per shot direction and update comments
-        for record in extracted_data:
-            total_splice_loss = 0
-            total_distance = 0
-            critical_flag = False
-            warning_flag = False
-
-            # Analyze each event in the record
-            event_counter = 1
-            while f"Event_{event_counter}" in record:
-                splice_loss = float(record.get(f"Event_{event_counter}_Splice_Loss", 0) or 0)
-                if splice_loss > user_warning_tolerance:  # Critical
-                    record[f"Event_{event_counter}_Comments"] = "Possible break"
-                    critical_flag = True
-                elif splice_loss > user_pass_tolerance:  # Warning
-                    record[f"Event_{event_counter}_Comments"] = "Possible microbend"
-                    warning_flag = True
-                else:  # Pass
-                    record[f"Event_{event_counter}_Comments"] = "Pass"
-                event_counter += 1
-
-            # Consolidate the overall comment for the shot direction
-            if critical_flag:
-                record["Comments"] = "Critical issues detected (Possible break)"
-            elif warning_flag:
-                record["Comments"] = "Warnings detected (Possible microbend)"
-            else:
-                record["Comments"] = "Pass"
-
-        # Create DataFrame from extracted JSON data
-        if wide_report_var.get():
-            df = generate_wide_report(extracted_data)
-        else:
-            df = generate_stacked_report(extracted_data)
+        # Classify every event and consolidate the comment per shot direction
+        with run_metrics.span("classify"):
+            classify_events(shots, events, pass_tolerance.get(), warning_tolerance.get())
+
+        # Flag events that are new or grown since the baseline in the report's comments
+        if baseline_var.get():
+            baseline_folder = filedialog.askdirectory(title="Select Baseline Folder of JSON Files")
+            if baseline_folder:
+                with run_metrics.span("baseline compare"):
+                    baseline_shots, baseline_events = process_json_and_extract(
+                        find_dump_files(baseline_folder), errors=load_errors
+                    )
+                    _, changes = compare.compare_shots(shots, events, baseline_shots, baseline_events,
+                                                       errors=load_errors)
+                    print(f"{compare.flag_changes(events, changes)} event(s) new or grown since the baseline.")
 
         # Open file dialog to save the report
         save_path = filedialog.asksaveasfilename(
@@ -272,27 +94,40 @@ def generate_report():
         )
 
         if save_path:
-            with pd.ExcelWriter(save_path, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Sheet1')
-
-                workbook = writer.book
-                worksheet = writer.sheets['Sheet1']
-
-                # Adjust the width of each column
-                for idx, col in enumerate(df.columns):
-                    max_length = max(df[col].apply(lambda x: len(str(x))).max(), len(col))
-                    worksheet.set_column(idx, idx, max_length * 1.25, workbook.add_format({'align': 'left'}))
-
-                # Apply conditional formatting
-                apply_conditional_formatting(worksheet, df, workbook)
-
-            messagebox.showinfo("Success", f"Report saved to: {save_path}")
+            write_xlsx_report(
+                shots, events, save_path,
+                wide=wide_report_var.get(), split_by_cable=split_by_cable_var.get(), metrics=run_metrics
+            )
+            if fleet_stats_var.get() and store_path is None:
+                with run_metrics.span("fleet statistics"):
+                    stats = fleetstats.collect_stats(file_paths, pass_tolerance.get(), warning_tolerance.get())
+                    fleetstats.write_stats(stats, fleetstats.stats_path(save_path))
+            print(run_metrics.summary())
+            print(f"Metrics saved to: {run_metrics.write(metrics.metrics_path(save_path))}")
+            if load_errors:
+                messagebox.showwarning(
+                    "Partial Report",
+                    f"Report saved to: {save_path}\n{len(load_errors)} file(s) could not be read; see the console."
+                )
+            else:
+                messagebox.showinfo("Success", f"Report saved to: {save_path}")
         else:
             messagebox.showerror("Cancelled", "Report save cancelled.")
 
     except Exception as e:
         messagebox.showerror("Error", f"An unexpected error occurred: {e}")
 
+def generate_store_report():
+    """
+    Asks for an event store and generates the report from it instead of from JSON files.
+    """
+    store_path = filedialog.askopenfilename(
+        title="Select Event Store",
+        filetypes=[("Event Store", "*.sqlite")],
+    )
+    if store_path:
+        generate_report(store_path)
+
 def create_tolerances_tab(notebook):
     """
     Creates the Tolerances tab where users can input their own tolerances.
@@ -317,19 +152,6 @@ def create_tolerances_tab(notebook):
 
     tk.Label(tolerances_tab, text="Critical issues detected if splice loss exceeds Warning tolerance.").pack(pady=10)
 
-def select_files():
-    """
-    Opens a file dialog to select multiple JSON files.
-    """
-    file_paths = filedialog.askopenfilenames(
-        title="Select JSON files",
-        filetypes=[("JSON Files", "*.json")],
-    )
-    if file_paths:
-        json_file_listbox.delete(0, tk.END)  # Clear previous entries
-        for path in file_paths:
-            json_file_listbox.insert(tk.END, path)
-
 def create_json_processing_tab(notebook):
     """
     Creates the JSON Processing tab for the application.
@@ -339,28 +161,157 @@ def create_json_processing_tab(notebook):
 
     tk.Label(json_tab, text="JSON Processing Tab").pack(pady=5)
 
-    btn_select_files = tk.Button(json_tab, text="Select JSON Files", command=select_files)
-    btn_select_files.pack(pady=5)
+    json_import_events = queue.Queue()
+    json_import_cancel = [threading.Event()]
+    json_count_var = tk.StringVar(value="0 files")
+
+    def start_import(paths):
+        """
+        Reads the cable and fiber ID of each file in a background thread and posts them in
+        batches, so the tab stays responsive while a large folder is imported.
+        """
+        cancel = json_import_cancel[0]
+
+        def run_import():
+            batch = []
+            try:
+                for path in paths:
+                    if cancel.is_set():
+                        break
+                    batch.append((path,) + file_keys(path))
+                    if len(batch) >= IMPORT_BATCH:
+                        json_import_events.put(("files", cancel, batch))
+                        batch = []
+                json_import_events.put(("files", cancel, batch))
+            finally:
+                json_import_events.put(("done", cancel))
+
+        btn_select_files.config(state=tk.DISABLED)
+        btn_import_folder.config(state=tk.DISABLED)
+        threading.Thread(target=run_import, daemon=True).start()
+        json_tab.after(100, poll_import_events)
+
+    def poll_import_events():
+        """
+        Adds the files posted by the import thread to the list and updates the count.
+        """
+        finished = False
+        while True:
+            try:
+                event = json_import_events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "done":
+                finished = True
+            elif not event[1].is_set():  # skip files imported before the list was cleared
+                json_files.add(event[2])
+
+        update_list()
+        if finished:
+            btn_select_files.config(state=tk.NORMAL)
+            btn_import_folder.config(state=tk.NORMAL)
+        else:
+            json_count_var.set(json_count_var.get() + " (importing...)")
+            json_tab.after(100, poll_import_events)
+
+    def update_list():
+        json_file_list.set_items(json_files.view)
+        json_count_var.set(f"{len(json_files)} files, {len(json_files.view)} shown")
+
+    def select_files():
+        """
+        Opens a file dialog to select multiple JSON files.
+        """
+        file_paths = filedialog.askopenfilenames(
+            title="Select JSON files",
+            filetypes=[("JSON Files", "*.json *.json.gz")],
+        )
+        if file_paths:
+            start_import(list(file_paths))
+
+    def import_folder():
+        """
+        Adds every -dump.json file under a folder, including its subfolders.
+        """
+        folder = filedialog.askdirectory(title="Select Folder of JSON Files")
+        if folder:
+            start_import(scan_dump_files(folder))
+
+    def remove_selected():
+        json_files.remove(json_file_list.selected)
+        json_file_list.clear_selection()
+        update_list()
+
+    def clear_files():
+        json_import_cancel[0].set()
+        json_import_cancel[0] = threading.Event()
+        json_files.clear()
+        json_file_list.clear_selection()
+        update_list()
+
+    def apply_filter(*args):
+        json_files.set_filter(json_filter_field.get(), json_filter_var.get())
+        update_list()
+
+    json_button_frame = tk.Frame(json_tab)
+    json_button_frame.pack(pady=5)
+    btn_select_files = tk.Button(json_button_frame, text="Select JSON Files", command=select_files)
+    btn_select_files.pack(side=tk.LEFT, padx=5)
+    btn_import_folder = tk.Button(json_button_frame, text="Import Folder", command=import_folder)
+    btn_import_folder.pack(side=tk.LEFT, padx=5)
+    tk.Button(json_button_frame, text="Remove Selected", command=remove_selected).pack(side=tk.LEFT, padx=5)
+    tk.Button(json_button_frame, text="Clear", command=clear_files).pack(side=tk.LEFT, padx=5)
 
     btn_generate_report = tk.Button(json_tab, text="Generate Report", command=generate_report)
     btn_generate_report.pack(pady=5)
 
-    json_file_listbox_frame = tk.Frame(json_tab)
-    json_file_listbox_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+    btn_store_report = tk.Button(json_tab, text="Generate Report from Event Store", command=generate_store_report)
+    btn_store_report.pack(pady=5)
 
-    global json_file_listbox
-    json_file_listbox = tk.Listbox(json_file_listbox_frame, height=15, width=80)
-    json_scrollbar = Scrollbar(json_file_listbox_frame, orient=tk.VERTICAL, command=json_file_listbox.yview)
-    json_file_listbox.config(yscrollcommand=json_scrollbar.set)
+    json_filter_frame = tk.Frame(json_tab)
+    json_filter_frame.pack(pady=5)
+    tk.Label(json_filter_frame, text="Filter:").pack(side=tk.LEFT)
+    json_filter_field = ttk.Combobox(json_filter_frame, values=FILTER_FIELDS, state="readonly", width=10)
+    json_filter_field.set(FILTER_FIELDS[0])
+    json_filter_field.bind("<<ComboboxSelected>>", apply_filter)
+    json_filter_field.pack(side=tk.LEFT, padx=5)
+    json_filter_var = tk.StringVar()
+    json_filter_var.trace_add("write", apply_filter)
+    tk.Entry(json_filter_frame, textvariable=json_filter_var, width=30).pack(side=tk.LEFT, padx=5)
+    tk.Label(json_filter_frame, textvariable=json_count_var).pack(side=tk.LEFT, padx=5)
 
-    json_file_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-    json_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    json_file_list = VirtualList(json_tab, height=15, width=80, format_row=json_files.row)
+    json_file_list.pack(pady=10, fill=tk.BOTH, expand=True)
 
     global wide_report_var
     wide_report_var = tk.BooleanVar()
     chk_wide_report = tk.Checkbutton(json_tab, text="Generate Wide Report", variable=wide_report_var)
     chk_wide_report.pack(pady=10)
 
+    global split_by_cable_var
+    split_by_cable_var = tk.BooleanVar()
+    chk_split_by_cable = tk.Checkbutton(json_tab, text="One Sheet per Cable", variable=split_by_cable_var)
+    chk_split_by_cable.pack(pady=5)
+
+    global event_source_var
+    event_source_frame = tk.Frame(json_tab)
+    event_source_frame.pack(pady=5)
+    tk.Label(event_source_frame, text="Events from:").pack(side=tk.LEFT)
+    event_source_var = tk.StringVar(value=next(iter(EVENT_SOURCES)))
+    ttk.Combobox(event_source_frame, textvariable=event_source_var, values=list(EVENT_SOURCES), state="readonly",
+                 width=28).pack(side=tk.LEFT, padx=5)
+
+    global baseline_var
+    baseline_var = tk.BooleanVar()
+    chk_baseline = tk.Checkbutton(json_tab, text="Compare with a Baseline Folder (flag new and grown events)",
+                                  variable=baseline_var)
+    chk_baseline.pack(pady=5)
+
+    global fleet_stats_var
+    fleet_stats_var = tk.BooleanVar()
+    chk_fleet_stats = tk.Checkbutton(json_tab, text="Also Write Fleet Statistics (-stats.xlsx)", variable=fleet_stats_var)
+    chk_fleet_stats.pack(pady=5)
+
 def create_sor_parsing_tab(notebook):
     """
     Creates the .sor Parsing tab for the application.
@@ -380,9 +331,31 @@ def create_sor_parsing_tab(notebook):
     tk.Entry(sor_tab, textvariable=sor_output_var, width=60).pack(pady=5)
     tk.Button(sor_tab, text="Select Output Folder", command=lambda: sor_output_var.set(filedialog.askdirectory())).pack(pady=5)
 
+    tk.Label(sor_tab, text="Parallel Workers:").pack(pady=5)
+    sor_workers_var = tk.IntVar(value=sorbatch.default_workers())
+    tk.Spinbox(sor_tab, from_=1, to=256, textvariable=sor_workers_var, width=6).pack(pady=5)
+
+    sor_force_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(sor_tab, text="Re-parse all files (ignore cache)", variable=sor_force_var).pack(pady=5)
+
+    sor_traces_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(sor_tab, text="Export binary traces (-trace.bin)", variable=sor_traces_var).pack(pady=5)
+
+    sor_compact_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(sor_tab, text="Compact JSON output (smaller, faster to load)", variable=sor_compact_var).pack(pady=5)
+
+    sor_store_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(sor_tab, text=f"Add parsed files to the event store ({STORE_NAME})",
+                   variable=sor_store_var).pack(pady=5)
+
+    sor_progress_var = tk.StringVar(value="Idle")
+    sor_progress = ttk.Progressbar(sor_tab, orient=tk.HORIZONTAL, length=400, mode="determinate")
+    sor_events = queue.Queue()
+    sor_cancel = threading.Event()
+
     def parse_sor_files():
         """
-        Parses .sor files using the Ruby script.
+        Parses .sor files using the Ruby script, off the UI thread and across a pool of workers.
         """
         input_folder = sor_input_var.get()
         output_folder = sor_output_var.get()
@@ -392,49 +365,164 @@ def create_sor_parsing_tab(notebook):
             messagebox.showerror("Error", "Select valid input and output folders.")
             return
 
-        error_log = []
-
-        for root, _, files in os.walk(input_folder):
-            for file in files:
-                if file.endswith(".sor"):
-                    sor_file_path = os.path.join(root, file)
-                    try:
-                        result = subprocess.run(
-                            ["ruby", rbOTDR_path, sor_file_path, output_folder],
-                            check=True,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            text=True
-                        )
-                        print(f"Successfully parsed: {sor_file_path}")
-                    except FileNotFoundError:
-                        messagebox.showerror("Error", "Ruby interpreter not found. Ensure Ruby is installed and added to PATH.")
-                        return
-                    except subprocess.CalledProcessError as e:
-                        error_message = (
-                            f"Failed to parse {sor_file_path}.\n"
-                            f"Exit Code: {e.returncode}\n"
-                            f"Output: {e.stdout}\n"
-                            f"Error: {e.stderr}"
-                        )
-                        print(error_message)
-                        error_log.append(error_message)
-                    except Exception as e:
-                        error_message = f"Unexpected error with {sor_file_path}: {e}"
-                        print(error_message)
-                        error_log.append(error_message)
-
-        if error_log:
-            error_log_path = os.path.join(output_folder, "error_log.txt")
-            with open(error_log_path, "w") as log_file:
-                log_file.write("\n".join(error_log))
-            messagebox.showerror("Error", f"Some files failed to parse. See log at: {error_log_path}")
+        try:
+            workers = max(1, int(sor_workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = sorbatch.default_workers()
+
+        force = sor_force_var.get()
+        traces = sor_traces_var.get()
+        dump_format = "compact" if sor_compact_var.get() else "pretty"
+        store = sor_store_var.get()
+
+        sor_cancel.clear()
+        sor_error_listbox.delete(0, tk.END)
+        sor_progress.config(maximum=1, value=0)
+        sor_progress_var.set("Checking for new or changed files...")
+        btn_parse_sor.config(state=tk.DISABLED)
+        btn_cancel_sor.config(state=tk.NORMAL)
+
+        def progress(done, total, sor_file_path, error):
+            sor_events.put(("progress", done, total, sor_file_path, error))
+
+        def run_batch():
+            try:
+                run_metrics = metrics.Metrics()
+                with run_metrics.span("parse"):
+                    summary = sorbatch.parse_sor_incremental(
+                        input_folder, output_folder, rbOTDR_path,
+                        workers=workers, progress=progress, cancel_event=sor_cancel, force=force, traces=traces,
+                        metrics=run_metrics, dump_format=dump_format
+                    )
+                if store:
+                    sor_events.put(("status", "Updating the event store..."))
+                    with run_metrics.span("store"), EventStore(os.path.join(output_folder, STORE_NAME)) as event_store:
+                        summary["unstored"] = event_store.remove_missing()
+                        summary["stored"] = event_store.add_dumps(find_dump_files(output_folder), workers=workers)
+                print(run_metrics.summary())
+                print(f"Metrics saved to: {run_metrics.write(os.path.join(output_folder, metrics.METRICS_NAME))}")
+                sor_events.put(("done", summary, output_folder))
+            except sorbatch.RubyNotFoundError as e:
+                sor_events.put(("fatal", str(e)))
+            except Exception as e:
+                sor_events.put(("fatal", f"An unexpected error occurred: {e}"))
+
+        threading.Thread(target=run_batch, daemon=True).start()
+        sor_tab.after(100, poll_sor_events)
+
+    def poll_sor_events():
+        """
+        Drains progress messages posted by the batch thread and updates the tab.
+        """
+        finished = False
+        while True:
+            try:
+                event = sor_events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                _, done, total, sor_file_path, error = event
+                sor_progress.config(maximum=total, value=done)
+                sor_progress_var.set(f"Parsing {done} / {total}")
+                if error:
+                    print(error)
+                    sor_error_listbox.insert(tk.END, f"{os.path.basename(sor_file_path)}: {error.splitlines()[0]}")
+                else:
+                    print(f"Successfully parsed: {sor_file_path}")
+            elif event[0] == "status":
+                sor_progress_var.set(event[1])
+            elif event[0] == "done":
+                _, summary, output_folder = event
+                error_log = summary["errors"]
+                finished = True
+                cancelled = sor_cancel.is_set()
+                counts = (
+                    f"{summary['parsed']} parsed, {summary['skipped']} unchanged, "
+                    f"{summary['removed']} removed"
+                )
+                if "stored" in summary:
+                    counts += f", {summary['stored']} added to and {summary['unstored']} removed from the event store"
+                sor_progress_var.set(("Cancelled: " if cancelled else "Finished: ") + counts)
+                if error_log:
+                    error_log_path = sorbatch.write_error_log(error_log, output_folder)
+                    messagebox.showerror("Error", f"Some files failed to parse. See log at: {error_log_path}")
+                elif cancelled:
+                    messagebox.showinfo("Cancelled", ".sor parsing cancelled.")
+                else:
+                    messagebox.showinfo("Success", f".sor files parsed successfully ({counts}).")
+            elif event[0] == "fatal":
+                finished = True
+                sor_progress_var.set("Failed")
+                messagebox.showerror("Error", event[1])
+
+        if finished:
+            btn_parse_sor.config(state=tk.NORMAL)
+            btn_cancel_sor.config(state=tk.DISABLED)
         else:
-            messagebox.showinfo("Success", ".sor files parsed successfully.")
+            sor_tab.after(100, poll_sor_events)
 
-    # Add Parse Button
+    def cancel_sor_files():
+        """
+        Stops queued files from starting; files already being parsed are allowed to finish.
+        """
+        sor_cancel.set()
+        sor_progress_var.set("Cancelling...")
+
+    # Add Parse and Cancel Buttons
     btn_parse_sor = tk.Button(sor_tab, text="Parse .sor Files", command=parse_sor_files)
     btn_parse_sor.pack(pady=10)
+    btn_cancel_sor = tk.Button(sor_tab, text="Cancel", command=cancel_sor_files, state=tk.DISABLED)
+    btn_cancel_sor.pack(pady=5)
+
+    sor_progress.pack(pady=5)
+    tk.Label(sor_tab, textvariable=sor_progress_var).pack(pady=5)
+
+    sor_error_frame = tk.Frame(sor_tab)
+    sor_error_frame.pack(pady=5, fill=tk.BOTH, expand=True)
+    sor_error_listbox = tk.Listbox(sor_error_frame, height=6, width=80)
+    sor_error_scrollbar = Scrollbar(sor_error_frame, orient=tk.VERTICAL, command=sor_error_listbox.yview)
+    sor_error_listbox.config(yscrollcommand=sor_error_scrollbar.set)
+    sor_error_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    sor_error_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+def create_trace_viewer_tab(notebook):
+    """
+    Creates the Trace Viewer tab, which plots -trace.bin files with their KeyEvents.
+    """
+    trace_tab = ttk.Frame(notebook)
+    notebook.add(trace_tab, text="Trace Viewer")
+
+    def open_traces():
+        """
+        Opens -trace.bin files, or the traces next to selected -dump.json files, and overlays them.
+        """
+        file_paths = filedialog.askopenfilenames(
+            title="Select Traces",
+            filetypes=[("Traces", "*-trace.bin"), ("JSON Dumps", "*-dump.json *-dump.json.gz")],
+        )
+        failed = []
+        for path in file_paths:
+            if path.endswith(DUMP_SUFFIXES):
+                path = dump_trace_path(path)
+            try:
+                trace_view.add_trace(path)
+            except Exception as e:
+                failed.append(f"{os.path.basename(path)}: {e}")
+        if failed:
+            messagebox.showerror(
+                "Error",
+                "Some traces could not be opened (parse with binary trace export enabled):\n" + "\n".join(failed)
+            )
+
+    trace_button_frame = tk.Frame(trace_tab)
+    trace_button_frame.pack(pady=5)
+    tk.Button(trace_button_frame, text="Open Traces", command=open_traces).pack(side=tk.LEFT, padx=5)
+    tk.Button(trace_button_frame, text="Clear", command=lambda: trace_view.clear()).pack(side=tk.LEFT, padx=5)
+    tk.Label(trace_tab, text="Scroll to zoom, drag to pan, double-click to show the whole traces.").pack(pady=5)
+
+    trace_view = TraceView(trace_tab)
+    trace_view.pack(pady=5, fill=tk.BOTH, expand=True)
 
 def main():
     # Main application window
@@ -449,12 +537,15 @@ def main():
     # Add JSON Processing, .sor Parsing, and Tolerances tabs
     create_json_processing_tab(notebook)
     create_sor_parsing_tab(notebook)
+    create_trace_viewer_tab(notebook)
     create_tolerances_tab(notebook)
 
     # Run the application
     window.mainloop()
 
 if __name__ == "__main__":
+    # Needed for the JSON ingestion worker processes in PyInstaller builds
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
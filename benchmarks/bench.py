@@ -0,0 +1,276 @@
+"""
+Benchmark harness for the parse and report pipeline.
+
+Generates synthetic .sor files (see sorgen.py) and times, at each scale (number of shots):
+
+    parse           .sor -> -dump.json with the Ruby worker pool (on up to --parse-files files)
+    ingest          -dump.json -> shot and event tables (report.process_json_and_extract)
+    classify        Pass / microbend / break tolerance classification
+    xlsx-stacked    stacked XLSX report
+    xlsx-wide       wide XLSX report
+
+Larger scales reuse the parsed dumps as templates, renamed per shot, so a 100k-shot run
+does not need 100k Ruby parses. Every result is appended as one JSON line to the results
+file together with the commit, Python version and CPU count (peak_memory_mb is the peak
+of the benchmark process so far), and compared with the previous run of the same stage,
+scale and settings:
+
+    python benchmarks/bench.py --scales 100,10000 --work /tmp/sor-bench
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import metrics  # noqa: E402
+import sorbatch  # noqa: E402
+import sorgen  # noqa: E402
+
+STAGES = ["parse", "ingest", "classify", "xlsx-stacked", "xlsx-wide"]
+DEFAULT_SCALES = [100, 10000, 100000]
+# Kept between runs for the comparisons, but not committed (see .gitignore)
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.jsonl")
+
+# Files actually parsed per run; larger scales are filled from these dumps
+DEFAULT_PARSE_FILES = 1000
+
+def git_commit():
+    """
+    Returns the current commit of the repository (with "+dirty" for local changes), or None.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+dirty" if dirty else "")
+
+def environment(args):
+    """
+    Returns the fields recorded with every result so runs can be told apart.
+    """
+    try:
+        import orjson  # noqa: F401
+        has_orjson = True
+    except ImportError:
+        has_orjson = False
+    return {
+        "run": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "label": args.label,
+        "python": platform.python_version(),
+        "platform": platform.platform(terse=True),
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "orjson": has_orjson,
+        "trace_samples": args.samples,
+        "mean_events": args.events,
+        "dump_format": args.dump_format,
+    }
+
+def parse_stage(args, sor_folder, dump_folder):
+    """
+    Generates and parses up to --parse-files .sor files. Returns the result fields.
+    """
+    count = min(args.parse_files, max(args.scales))
+    existing = sorbatch.find_sor_files(sor_folder) if os.path.isdir(sor_folder) else []
+    if len(existing) != count:
+        shutil.rmtree(sor_folder, ignore_errors=True)
+        sorgen.write_job(sor_folder, count, samples=args.samples, events=args.events, mixed=True)
+    sor_files = sorbatch.find_sor_files(sor_folder)
+
+    shutil.rmtree(dump_folder, ignore_errors=True)
+    os.makedirs(dump_folder)
+    run_metrics = metrics.Metrics()
+    start = time.perf_counter()
+    errors = sorbatch.parse_sor_batch(sor_files, dump_folder, args.rbotdr, workers=args.workers,
+                                      metrics=run_metrics, dump_format=args.dump_format)
+    seconds = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f"{len(errors)} of {len(sor_files)} file(s) failed to parse; first: {errors[0]}")
+
+    total_bytes = sum(os.path.getsize(path) for path in sor_files)
+    startup = run_metrics.to_dict()["spans"].get("ruby startup", {}).get("total", 0.0)
+    return {"items": len(sor_files), "seconds": seconds, "bytes": total_bytes,
+            "mb_per_s": total_bytes / seconds / 1e6, "ruby_startup_seconds": startup}
+
+def fill_dumps(templates, folder, count, dump_format="pretty"):
+    """
+    Writes count dumps in the given format (see sorbatch.DUMP_FORMATS) into folder, cycling
+    through the template dumps and giving each shot its own file name, cable and fiber ID.
+    An existing folder of the right size is reused.
+    """
+    if os.path.isdir(folder) and len(os.listdir(folder)) == count:
+        return
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    decoded = []
+    for path in templates:
+        with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as f:
+            decoded.append(json.load(f))
+    for number in range(count):
+        dump = decoded[number % len(decoded)]
+        name = sorgen.job_file_name(number)
+        dump["filename"] = name
+        dump.setdefault("GenParams", {})["cable ID"] = f"CABLE-{number // sorgen.FIBERS_PER_CABLE + 1:04d}"
+        path = sorbatch.output_path(name, folder, dump_format)
+        if dump_format == "pretty":
+            with open(path, "w") as f:
+                json.dump(dump, f, indent=2)
+            continue
+        line = json.dumps(dump, separators=(",", ":")) + "\n"
+        with (gzip.open(path, "wt") if dump_format == "compact-gz" else open(path, "w")) as f:
+            f.write(line)
+
+def run_scale(args, report, templates, scale):
+    """
+    Runs the ingestion, classification and report stages on scale shots.
+    Yields (stage, result fields) as each stage finishes.
+    """
+    dump_folder = os.path.join(args.work, f"dumps-{scale}-{args.samples}x{args.events}-{args.dump_format}")
+    fill_dumps(templates, dump_folder, scale, args.dump_format)
+    file_paths = report.find_dump_files(dump_folder)
+
+    start = time.perf_counter()
+    shots, events = report.process_json_and_extract(file_paths, workers=args.workers)
+    seconds = time.perf_counter() - start
+    if "ingest" in args.stages:
+        total_bytes = sum(os.path.getsize(path) for path in file_paths)
+        yield "ingest", {"items": len(shots), "events": len(events), "seconds": seconds, "bytes": total_bytes,
+                         "mb_per_s": total_bytes / seconds / 1e6}
+
+    start = time.perf_counter()
+    report.classify_events(shots, events, 0.3, 0.6)
+    if "classify" in args.stages:
+        yield "classify", {"items": len(shots), "events": len(events), "seconds": time.perf_counter() - start}
+
+    for layout in ["stacked", "wide"]:
+        stage = f"xlsx-{layout}"
+        if stage not in args.stages:
+            continue
+        save_path = os.path.join(args.work, f"report-{scale}-{layout}.xlsx")
+        start = time.perf_counter()
+        report.write_xlsx_report(shots, events, save_path, wide=layout == "wide")
+        seconds = time.perf_counter() - start
+        yield stage, {"items": len(shots), "events": len(events), "seconds": seconds,
+                      "bytes": os.path.getsize(save_path)}
+        os.remove(save_path)
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_result(history, result):
+    """
+    Returns the latest earlier result of the same stage, scale and benchmark settings, or None.
+    """
+    keys = ["stage", "scale", "trace_samples", "mean_events", "workers", "dump_format"]
+    for old in reversed(history):
+        if old["run"] != result["run"] and all(old.get(key) == result.get(key) for key in keys):
+            return old
+    return None
+
+def report_line(result, previous):
+    line = (f"{result['stage']:<13} {result['scale']:>7} shots  {result['seconds']:9.3f} s  "
+            f"{result['rate']:10.1f} shots/s")
+    if previous:
+        change = (result["seconds"] - previous["seconds"]) / previous["seconds"] * 100 if previous["seconds"] else 0
+        line += f"  {change:+6.1f}% vs {previous['run']} ({previous.get('commit') or 'unknown'})"
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time parsing, ingestion, classification and report writing "
+                                                 "on synthetic .sor jobs.")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="comma-separated numbers of shots (default 100,10000,100000)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages (default: all)")
+    parser.add_argument("--parse-files", type=int, default=DEFAULT_PARSE_FILES,
+                        help=f"number of .sor files parsed; larger scales reuse their dumps "
+                             f"(default {DEFAULT_PARSE_FILES})")
+    parser.add_argument("--samples", type=int, default=sorgen.DEFAULT_SAMPLES, help="trace length in samples")
+    parser.add_argument("--events", type=int, default=sorgen.DEFAULT_EVENTS, help="mean events per shot")
+    parser.add_argument("--dump-format", choices=list(sorbatch.DUMP_FORMATS), default="pretty",
+                        help="dump format parsed to and ingested from (default pretty)")
+    parser.add_argument("-j", "--workers", type=int, default=sorbatch.default_workers(),
+                        help="parse and ingestion workers (default: CPU count)")
+    parser.add_argument("--dumps", help="use the -dump.json files in this folder as templates instead of parsing")
+    parser.add_argument("--work", help="folder for the generated files, kept and reused between runs "
+                                       "(default: a temporary folder)")
+    parser.add_argument("--results", default=DEFAULT_RESULTS,
+                        help="JSON lines file the results are appended to (default benchmarks/results.jsonl)")
+    parser.add_argument("--label", help="free-text note stored with the results, e.g. the change being measured")
+    parser.add_argument("--rbotdr", default=os.path.join(REPO_DIR, "rbOTDR.rb"), help="path to rbOTDR.rb")
+    args = parser.parse_args(argv)
+    args.scales = sorted(int(scale) for scale in args.scales.split(","))
+    args.stages = args.stages.split(",")
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    args.workers = max(1, args.workers)
+
+    temporary = args.work is None
+    args.work = args.work or tempfile.mkdtemp(prefix="sor-bench-")
+    os.makedirs(args.work, exist_ok=True)
+
+    # Imported after the arguments are checked, as in fiberData.py
+    import report
+
+    context = environment(args)
+    history = load_results(args.results)
+    results = []
+
+    def record(stage, scale, fields):
+        result = dict(context, stage=stage, scale=scale, **fields)
+        result["rate"] = result["items"] / result["seconds"] if result["seconds"] else 0.0
+        result["peak_memory_mb"] = metrics.peak_memory_mb()
+        results.append(result)
+        print(report_line(result, previous_result(history, result)), flush=True)
+
+    try:
+        if args.dumps:
+            templates = report.find_dump_files(args.dumps)
+        else:
+            sor_folder = os.path.join(args.work, f"sor-{args.samples}x{args.events}")
+            dump_folder = os.path.join(args.work, f"parsed-{args.dump_format}")
+            try:
+                fields = parse_stage(args, sor_folder, dump_folder)
+            except (sorbatch.RubyNotFoundError, RuntimeError) as e:
+                print(e, file=sys.stderr)
+                return 1
+            if "parse" in args.stages:
+                record("parse", fields["items"], fields)
+            templates = report.find_dump_files(dump_folder)
+        if not templates:
+            print("No -dump.json templates to build the jobs from.", file=sys.stderr)
+            return 1
+
+        for scale in args.scales:
+            for stage, fields in run_scale(args, report, templates, scale):
+                record(stage, scale, fields)
+    finally:
+        if results:
+            with open(args.results, "a") as f:
+                for result in results:
+                    f.write(json.dumps(result) + "\n")
+            print(f"Results appended to: {args.results}")
+        if temporary:
+            shutil.rmtree(args.work, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Synthetic Bellcore .sor generator for benchmarks.
+
+Writes valid SR-4731 version 1.x and 2.x files with Map, GenParams, SupParams, FxdParams,
+DataPts, KeyEvents and Cksum blocks and a correct CRC, with a configurable trace length and
+number of events. The trace is a noisy backscatter slope with a loss step at every event,
+spikes at reflective events and the noise floor past the fiber end, so the files exercise the
+parser, the trace analysis and the tolerance classification like field data would.
+
+    python benchmarks/sorgen.py OUTPUT --count 100 --samples 30000 --events 8
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+
+import numpy as np
+
+# Speed of light in km/usec, as in parts.rb
+SOL = 299792.458 / 1.0e6
+
+DEFAULT_SAMPLES = 30000
+DEFAULT_EVENTS = 8
+DEFAULT_INDEX = 1.468
+DEFAULT_SPACING_US = 0.01       # sample spacing; 0.01 usec is about 2 m per sample
+ATTENUATION_DB_KM = 0.35
+NOISE_FLOOR_DB = 28.0
+
+# Fibers per cable when a job of files is generated
+FIBERS_PER_CABLE = 288
+
+def crc16_ccitt(data):
+    """
+    Returns the CRC16-CCITT (FALSE) checksum the Cksum block stores, as checked by cksum.rb.
+    """
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+def _crc_entry(value):
+    value <<= 8
+    for _ in range(8):
+        value = ((value << 1) ^ 0x1021) & 0xFFFF if value & 0x8000 else (value << 1) & 0xFFFF
+    return value
+
+_CRC_TABLE = [_crc_entry(i) for i in range(256)]
+
+def _cstr(text):
+    return text.encode("latin-1") + b"\0"
+
+def _header(name, version):
+    # Version 2.x blocks start with their name; version 1.x blocks do not
+    return _cstr(name) if version == 2 else b""
+
+def _genparams(version, cable, fiber, site_a, site_b, wavelength):
+    block = _header("GenParams", version) + b"EN" + _cstr(cable) + _cstr(fiber)
+    if version == 2:
+        block += struct.pack("<H", 652)  # fiber type G.652
+    block += struct.pack("<H", wavelength) + _cstr(site_a) + _cstr(site_b) + _cstr("BENCH") + b"BC"
+    block += struct.pack("<i", 0)  # user offset
+    if version == 2:
+        block += struct.pack("<i", 0)  # user offset distance
+    return block + _cstr("Benchmark") + _cstr("synthetic trace")
+
+def _supparams(version):
+    fields = ["Synthetic", "OTDR-1", "SN0001", "MOD-1", "MSN0001", "1.0", "benchmarks/sorgen.py"]
+    return _header("SupParams", version) + b"".join(_cstr(field) for field in fields)
+
+def _fxdparams(version, samples, wavelength, timestamp):
+    spacing = round(DEFAULT_SPACING_US * 1e8)  # 1e-8 usec units
+    index = round(DEFAULT_INDEX * 1e5)
+    range_units = round(samples * DEFAULT_SPACING_US * SOL / DEFAULT_INDEX / 2e-5)
+    if version == 2:
+        block = struct.pack(
+            "<I2sHiiHHIIIHIHIiiHhHHHH2siiii",
+            timestamp, b"km", wavelength * 10, 0, 0, 1, 100, spacing, samples, index, 800, 1000, 30,
+            range_units, 0, 0, 0, 0, 0, 50, 400, 3000, b"ST", 0, 0, 0, 0
+        )
+    else:
+        block = struct.pack(
+            "<I2sHiHHIIIHIIiHhHHHH",
+            timestamp, b"km", wavelength * 10, 0, 1, 100, spacing, samples, index, 800, 1000,
+            range_units, 0, 0, 0, 0, 50, 400, 3000
+        )
+    return _header("FxdParams", version) + block
+
+def _trace(samples, events, end_index, rng):
+    """
+    Builds the DataPts values: loss in thousandths of a dB (the file stores the trace inverted).
+    """
+    km_per_sample = DEFAULT_SPACING_US * SOL / DEFAULT_INDEX
+    loss = np.arange(samples) * (ATTENUATION_DB_KM * km_per_sample)
+    for index, splice, reflective in events:
+        loss[index:] += splice
+        if reflective:
+            loss[index:index + 3] -= 4.0
+    loss[end_index:] = loss[end_index - 1] + NOISE_FLOOR_DB
+    noise = rng.normal(0.0, 0.004, samples) * (1.0 + np.arange(samples) / samples * 3)
+    values = np.clip((loss + noise) * 1000.0 + 1000.0, 0, 65535)
+    return values.astype("<u2")
+
+def _keyevents(version, events, end_index, rng):
+    # Event positions are stored as time of travel in 1e-4 usec units
+    spacing = DEFAULT_SPACING_US * 1e4
+    block = _header("KeyEvents", version) + struct.pack("<H", len(events) + 1)
+    rows = [(index, splice, reflective, "F") for index, splice, reflective in events]
+    rows.append((end_index, 0.0, True, "E"))
+    for number, (index, splice, reflective, kind) in enumerate(rows, start=1):
+        time = round(index * spacing)
+        refl = round(rng.uniform(-60.0, -40.0) * 1000) if reflective else 0
+        code = ("1" if reflective else "0") + kind + "9999LS"
+        block += struct.pack("<HIhhi8s", number, time, 350, round(splice * 1000), refl, code.encode())
+        if version == 2:
+            # end of previous, start of current, end of current, start of next, peak
+            block += struct.pack("<5I", max(time - 200, 0), max(time - 50, 0), time + 50, time + 200, time)
+        block += _cstr("")
+    total = round(sum(splice for _, splice, _ in events) * 1000)
+    end_time = round(end_index * spacing)
+    return block + struct.pack("<iiIHiI", total, 0, end_time, 30000, 0, end_time)
+
+def _mapblock(version, blocks):
+    names = [name for name, _ in blocks]
+    entries_size = sum(len(name) + 1 + 6 for name in names)
+    size = (len(_cstr("Map")) if version == 2 else 0) + 2 + 4 + 2 + entries_size
+    block_version = 200 if version == 2 else 100
+    block = _header("Map", version) + struct.pack("<HIH", block_version, size, len(names) + 1)
+    for name, data in blocks:
+        block += _cstr(name) + struct.pack("<HI", block_version, len(data))
+    return block
+
+def sor_bytes(version=2, samples=DEFAULT_SAMPLES, events=DEFAULT_EVENTS, seed=0, cable="CABLE-0001",
+              fiber="001", site_a="SiteA", site_b="SiteB", wavelength=1550, timestamp=1767225600):
+    """
+    Returns the bytes of one synthetic .sor file: version 1 or 2 of the format, a trace of
+    samples points and events KeyEvents before the fiber end (which is one more event).
+    """
+    if version not in (1, 2):
+        raise ValueError(f"Unsupported SOR version: {version}")
+    rng = np.random.default_rng(seed)
+    end_index = max(int(samples * 0.85), 2)
+    positions = np.sort(rng.choice(np.arange(1, end_index), size=min(events, end_index - 1), replace=False))
+    # Mostly good splices with a tail of microbends and breaks, every fourth event a connector
+    event_rows = [
+        (int(index), float(min(rng.exponential(0.12), 3.0)), number % 4 == 3)
+        for number, index in enumerate(positions)
+    ]
+
+    datapts = _trace(samples, event_rows, end_index, rng)
+    blocks = [
+        ("GenParams", _genparams(version, cable, fiber, site_a, site_b, wavelength)),
+        ("SupParams", _supparams(version)),
+        ("FxdParams", _fxdparams(version, samples, wavelength, timestamp)),
+        ("DataPts", _header("DataPts", version) + struct.pack("<IhIH", samples, 1, samples, 1000)
+         + datapts.tobytes()),
+        ("KeyEvents", _keyevents(version, event_rows, end_index, rng)),
+    ]
+    cksum_size = (len(_cstr("Cksum")) if version == 2 else 0) + 2
+    body = _mapblock(version, blocks + [("Cksum", b"\0" * cksum_size)])
+    body += b"".join(data for _, data in blocks) + _header("Cksum", version)
+    return body + struct.pack("<H", crc16_ccitt(body))
+
+def write_sor(path, **options):
+    """
+    Writes one synthetic .sor file; options are those of sor_bytes.
+    """
+    with open(path, "wb") as f:
+        f.write(sor_bytes(**options))
+    return path
+
+def job_file_name(number, site_a="SiteA", site_b="SiteB"):
+    """
+    Returns the file name of shot number in a generated job, in the "SiteA SiteB 001 ..." form
+    the report reads the direction and fiber ID from.
+    """
+    return f"{site_a} {site_b} {number % FIBERS_PER_CABLE + 1:03d} C{number // FIBERS_PER_CABLE + 1:04d}.sor"
+
+def write_job(folder, count, version=2, samples=DEFAULT_SAMPLES, events=DEFAULT_EVENTS, seed=0, mixed=False):
+    """
+    Writes count .sor files into folder, FIBERS_PER_CABLE fibers per cable; mixed=True
+    alternates between versions 1 and 2. Returns the paths written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for number in range(count):
+        path = os.path.join(folder, job_file_name(number))
+        write_sor(
+            path, version=(1 + number % 2) if mixed else version, samples=samples,
+            events=max(0, events + rng.randint(-2, 2)) if events else 0, seed=seed * 1000003 + number,
+            cable=f"CABLE-{number // FIBERS_PER_CABLE + 1:04d}", fiber=f"{number % FIBERS_PER_CABLE + 1:03d}"
+        )
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic Bellcore .sor files for benchmarks.")
+    parser.add_argument("output", help="folder to write the .sor files to")
+    parser.add_argument("-n", "--count", type=int, default=100, help="number of files (default 100)")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help=f"trace length in samples (default {DEFAULT_SAMPLES})")
+    parser.add_argument("--events", type=int, default=DEFAULT_EVENTS,
+                        help=f"mean number of events before the fiber end (default {DEFAULT_EVENTS})")
+    parser.add_argument("--version", type=int, choices=[1, 2], default=2, help="SOR format version (default 2)")
+    parser.add_argument("--mixed", action="store_true", help="alternate between versions 1 and 2")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    args = parser.parse_args(argv)
+
+    paths = write_job(args.output, args.count, version=args.version, samples=args.samples, events=args.events,
+                      seed=args.seed, mixed=args.mixed)
+    print(f"{len(paths)} file(s) written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import csv
+import os
+import warnings
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import report
+import traces
+from pairing import DEFAULT_MATCH_TOLERANCE_KM, match_nearest
+from report import column_values, dump_trace_path
+from reportwriter import StreamingReportWriter
+from traceanalysis import DEFAULT_WINDOW
+
+# Largest launch offset between a shot and its baseline searched by the cross-correlation
+DEFAULT_MAX_SHIFT_KM = 0.5
+# An event missing from the baseline is flagged from this loss (dB)
+DEFAULT_NEW_EVENT_DB = 0.1
+# An event already in the baseline is flagged when its loss grew by this much (dB)
+DEFAULT_GROWTH_DB = 0.1
+# Shot pairs aligned per vectorized batch
+DEFAULT_BATCH_SIZE = 32
+
+CHANGE_COMMENTS = ["", "Grown event", "New event"]
+
+BASELINE_PAIR_COLUMNS = ["Cable", "Fiber_ID", "Direction", "Shot_ID", "Baseline_Shot_ID"]
+CHANGE_COLUMNS = [
+    "Cable", "Fiber_ID", "Direction", "Shift_KM", "Fiber_Loss_Delta", "Event", "Event_Distance",
+    "Splice_Loss", "Baseline_Event", "Baseline_Splice_Loss", "Loss_Delta", "Comments",
+]
+
+def pair_baselines(shots, baseline_shots):
+    """
+    Matches every shot with the baseline shot of the same cable, fiber ID and direction
+    through a hash index on the baseline. When a key occurs more than once, on either side
+    (a re-shot fiber, or shots of one fiber at several wavelengths), the last shot wins as in
+    pairing.pair_shots, so each shot and each baseline shot is in at most one pair and the
+    last shot of a fiber is compared with the last baseline shot of it. Keep one wavelength
+    per folder to compare like with like. Returns one row per pair, in the order of the shots.
+    """
+    def cables(table):
+        return table["Cable"] if "Cable" in table.columns else pd.Series([""] * len(table), index=table.index)
+
+    index = {}
+    for shot_id, cable, fiber_id, direction in zip(baseline_shots["Shot_ID"], cables(baseline_shots),
+                                                   baseline_shots["Fiber_ID"], baseline_shots["Shot_Direction"]):
+        index[(cable, fiber_id, direction)] = shot_id
+
+    latest = {}
+    for shot_id, cable, fiber_id, direction in zip(shots["Shot_ID"], cables(shots), shots["Fiber_ID"],
+                                                   shots["Shot_Direction"]):
+        latest[(cable, fiber_id, direction)] = shot_id
+
+    rows = []
+    for shot_id, cable, fiber_id, direction in zip(shots["Shot_ID"], cables(shots), shots["Fiber_ID"],
+                                                   shots["Shot_Direction"]):
+        key = (cable, fiber_id, direction)
+        baseline_id = index.get(key)
+        if baseline_id is not None and latest[key] == shot_id:
+            rows.append((cable, fiber_id, direction, shot_id, baseline_id))
+
+    pairs = pd.DataFrame(rows, columns=BASELINE_PAIR_COLUMNS)
+    pairs["Shot_ID"] = pairs["Shot_ID"].astype("int64")
+    pairs["Baseline_Shot_ID"] = pairs["Baseline_Shot_ID"].astype("int64")
+    return pairs
+
+def _resample(trace, step_km):
+    """
+    Returns a (header, samples) trace linearly resampled onto a spacing of step_km,
+    for baselines taken at a different resolution than the current shot.
+    """
+    header, samples = trace
+    own_step = header["resolution"] * header["xscaling"] / 1000.0
+    if not len(samples) or abs(own_step - step_km) <= 1e-12 * max(step_km, 1e-12):
+        return trace
+    distances = np.arange(len(samples)) * own_step
+    grid = np.arange(int(distances[-1] / step_km) + 1) * step_km
+    resampled = dict(header, resolution=step_km * 1000.0, xscaling=1.0, num_points=len(grid))
+    return resampled, np.interp(grid, distances, np.asarray(samples, dtype=np.float64))
+
+def _differences(samples, skip, nfft):
+    """
+    First differences of each trace in an (n, nfft) zero-padded array, with the mean slope
+    removed and the first skip samples of each trace left out.
+    """
+    diff = np.zeros((len(samples), nfft))
+    for row, values in enumerate(samples):
+        if len(values) > skip[row] + 1:
+            part = np.diff(np.asarray(values[skip[row]:], dtype=np.float64))
+            diff[row, skip[row] + 1:len(values)] = part - part.mean()
+    return diff
+
+def align_traces(current, baseline, max_shift_km=DEFAULT_MAX_SHIFT_KM, window=DEFAULT_WINDOW):
+    """
+    Aligns a batch of baseline traces onto their current traces, given as two equal-length
+    lists of (header, samples). The launch offset is found for all pairs at once by FFT
+    cross-correlation of the first differences of the traces (so the dB level does not
+    matter), searching lags up to max_shift_km.
+
+    Returns (shifts, delta, step_km): shifts in samples (a baseline feature at sample i is
+    at i + shift in the current trace), and delta, the (n, max_len) loss delta along each
+    current trace in dB: baseline minus current, referenced to the first window past the
+    dead zone, so it grows by the extra loss of every new or grown event. delta is NaN
+    where the traces do not overlap.
+    """
+    step_km = np.array([header["resolution"] * header["xscaling"] / 1000.0 for header, _ in current])
+    baseline = [_resample(trace, step) for trace, step in zip(baseline, step_km)]
+    cur = [samples for _, samples in current]
+    base = [samples for _, samples in baseline]
+    n_pairs = len(cur)
+    length = max(len(samples) for samples in cur + base)
+    max_shift = np.maximum(1, np.round(max_shift_km / np.maximum(step_km, 1e-12))).astype(np.int64)
+
+    # The launch dead zone sits at sample 0 in both traces whatever the offset, so the first
+    # window + max_shift samples are left out or the correlation would lock onto it.
+    # Circular wrap-around only has to clear the lags searched, not the whole trace.
+    skip = window + max_shift
+    nfft = 1 << int(np.ceil(np.log2(max(length + int(max_shift.max()) + 1, 2))))
+    spectrum = np.fft.rfft(_differences(cur, skip, nfft), axis=1)
+    spectrum *= np.conj(np.fft.rfft(_differences(base, skip, nfft), axis=1))
+    correlation = np.fft.irfft(spectrum, nfft, axis=1)
+    lags = np.arange(-int(max_shift.max()), int(max_shift.max()) + 1)
+    scores = correlation[:, lags % nfft]
+    scores[np.abs(lags)[None, :] > max_shift[:, None]] = -np.inf
+    shifts = lags[np.argmax(scores, axis=1)]
+
+    # Baseline sample j - shift sits under current sample j
+    delta = np.full((n_pairs, max(len(samples) for samples in cur)), np.nan)
+    first = np.zeros(n_pairs, dtype=np.int64)
+    for row, shift in enumerate(shifts):
+        first[row], last = max(0, shift), min(len(cur[row]), len(base[row]) + shift)
+        if last > first[row]:
+            delta[row, first[row]:last] = np.subtract(base[row][first[row] - shift:last - shift],
+                                                      cur[row][first[row]:last], dtype=np.float64)
+
+    # Reference the delta to the first window past the dead zone, removing launch level changes
+    reference = _window_means(delta, np.arange(n_pairs), first + skip, 0, window)
+    delta -= np.nan_to_num(reference)[:, None]
+    return shifts, delta, step_km
+
+def _window_means(delta, rows, index, offset, window):
+    """
+    NaN-aware mean of delta[row, i + offset : i + offset + window] for many (row, i) at once,
+    gathering only the windows rather than scanning the traces. Windows with no finite
+    value give NaN.
+    """
+    columns = (np.asarray(index) + offset)[:, None] + np.arange(window)
+    inside = (columns >= 0) & (columns < delta.shape[1])
+    values = np.where(inside, delta[np.asarray(rows)[:, None], np.clip(columns, 0, delta.shape[1] - 1)], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # mean of an empty window
+        return np.nanmean(values, axis=1) if len(values) else np.zeros(0)
+
+def _compare_chunk(items, max_shift_km=DEFAULT_MAX_SHIFT_KM, window=DEFAULT_WINDOW):
+    """
+    Aligns a chunk of shot/baseline trace pairs, DEFAULT_BATCH_SIZE pairs at a time, and
+    measures the loss delta at their events; runs inside a worker. Each item is (pair,
+    trace path, baseline trace path, event distances in km, fiber end in km). Returns
+    (pair, (shift_km, fiber_delta, event_deltas), error) per item, in order.
+    """
+    results = []
+    for start in range(0, len(items), DEFAULT_BATCH_SIZE):
+        batch, loaded = [], []
+        for pair, trace_path, baseline_path, distances, end_km in items[start:start + DEFAULT_BATCH_SIZE]:
+            try:
+                loaded.append((traces.load_trace(trace_path), traces.load_trace(baseline_path)))
+                batch.append((pair, distances, end_km))
+            except Exception as e:
+                results.append((pair, None, {"file": trace_path, "error": type(e).__name__, "message": str(e)}))
+        if not batch:
+            continue
+
+        shifts, delta, step_km = align_traces([c for c, _ in loaded], [b for _, b in loaded], max_shift_km, window)
+        rows = np.arange(len(batch))
+
+        # Loss delta at the far end of each fiber
+        end_index = np.array([end_km for _, _, end_km in batch], dtype=np.float64) / step_km
+        end_index = np.nan_to_num(np.round(end_index), nan=delta.shape[1]).astype(np.int64)
+        fiber_delta = _window_means(delta, rows, end_index, -window, window)
+
+        # Rise of the delta across every event; the window after starts one window past the
+        # event, clear of a reflective spike
+        counts = [len(distances) for _, distances, _ in batch]
+        event_rows = np.repeat(rows, counts)
+        distances = np.concatenate([distances for _, distances, _ in batch] + [np.zeros(0)])
+        index = np.round(distances / step_km[event_rows]).astype(np.int64)
+        event_deltas = _window_means(delta, event_rows, index, window, window) - \
+            _window_means(delta, event_rows, index, -window, window)
+        event_deltas = np.split(event_deltas, np.cumsum(counts)[:-1])
+
+        for row, (pair, _, _) in enumerate(batch):
+            results.append((pair, (shifts[row] * step_km[row], fiber_delta[row], event_deltas[row]), None))
+    return results
+
+def compare_shots(shots, events, baseline_shots, baseline_events, max_shift_km=DEFAULT_MAX_SHIFT_KM,
+                  tolerance_km=DEFAULT_MATCH_TOLERANCE_KM, new_event_db=DEFAULT_NEW_EVENT_DB,
+                  growth_db=DEFAULT_GROWTH_DB, window=DEFAULT_WINDOW, errors=None, workers=None):
+    """
+    Compares every shot with its baseline (same cable, fiber ID and direction).
+
+    Where both shots have a -trace.bin, the traces are aligned by FFT cross-correlation in
+    batches of DEFAULT_BATCH_SIZE pairs spread over worker processes (see align_traces);
+    each event then gets Loss_Delta, the rise of the loss delta across it, and each fiber
+    Fiber_Loss_Delta, the delta at its farthest event. The launch offset found (Shift_KM)
+    is applied to the baseline KeyEvents before they are matched to the current ones within
+    tolerance_km, as in the bidirectional pairing; shots without traces are matched unshifted.
+
+    An event without a baseline match is a "New event" when its splice loss or Loss_Delta
+    reaches new_event_db; a matched one is a "Grown event" when its splice loss grew, or its
+    Loss_Delta reached, growth_db. Traces that cannot be read are compared on KeyEvents only;
+    if errors is a list, a dict with the file, error type and message is appended for each.
+    Returns (pairs, table) with one row per current event of every paired shot: the
+    CHANGE_COLUMNS plus the event's Shot_ID and Event_Number (see flag_changes). The
+    Comments column is empty for unchanged events.
+    """
+    pairs = pair_baselines(shots, baseline_shots)
+    n_pairs = len(pairs)
+    shift_km = np.zeros(n_pairs)
+    fiber_delta = np.full(n_pairs, np.nan)
+
+    # Current events of the paired shots, tagged with their pair and sorted by it
+    pair_of_shot = pd.Series(np.arange(n_pairs), index=pairs["Shot_ID"].to_numpy())
+    current = events[events["Shot_ID"].isin(pair_of_shot.index)]
+    order = np.argsort(pair_of_shot.loc[current["Shot_ID"]].to_numpy(), kind="stable")
+    current = current.iloc[order]
+    current_pair = pair_of_shot.loc[current["Shot_ID"]].to_numpy()
+    current_distance = current["Event_Distance"].to_numpy(dtype=np.float64)
+    loss_delta = np.full(len(current), np.nan)
+    starts = np.searchsorted(current_pair, np.arange(n_pairs), side="left")
+    ends = np.searchsorted(current_pair, np.arange(n_pairs), side="right")
+
+    # Trace pairs to align; each worker holds only one batch of delta vectors at a time
+    current_files = dict(zip(shots["Shot_ID"], shots["File"])) if "File" in shots.columns else {}
+    baseline_files = dict(zip(baseline_shots["Shot_ID"], baseline_shots["File"])) \
+        if "File" in baseline_shots.columns else {}
+    items = []
+    for pair, (shot_id, baseline_id) in enumerate(zip(pairs["Shot_ID"], pairs["Baseline_Shot_ID"])):
+        trace_path = dump_trace_path(current_files.get(shot_id, ""))
+        baseline_path = dump_trace_path(baseline_files.get(baseline_id, ""))
+        if os.path.exists(trace_path) and os.path.exists(baseline_path):
+            distances = current_distance[starts[pair]:ends[pair]]
+            items.append((pair, trace_path, baseline_path, distances, distances.max() if len(distances) else np.nan))
+
+    compare_chunk = partial(_compare_chunk, max_shift_km=max_shift_km, window=window)
+    for pair, result, error in report.extract_all(items, workers, compare_chunk):
+        if error:
+            if errors is not None:
+                errors.append(error)
+            continue
+        shift_km[pair], fiber_delta[pair], loss_delta[starts[pair]:ends[pair]] = result
+
+    # Match current events with the shifted baseline events, all pairs in one key space
+    # Each pair gets its own copy of its baseline shot's events
+    baseline = baseline_events.merge(
+        pd.DataFrame({"Shot_ID": pairs["Baseline_Shot_ID"].to_numpy(), "Pair": np.arange(n_pairs)}), on="Shot_ID"
+    )
+    baseline_pair = baseline["Pair"].to_numpy()
+    baseline_distance = baseline["Event_Distance"].to_numpy(dtype=np.float64) + shift_km[baseline_pair]
+    reach = np.nanmax(np.abs(np.concatenate([current_distance, baseline_distance, [0.0]])))
+    span = np.ceil(reach) + 2 * tolerance_km + 1
+    matched, matched_baseline = match_nearest(
+        current_pair * span + np.nan_to_num(current_distance),
+        baseline_pair * span + np.nan_to_num(baseline_distance),
+        tolerance_km
+    )
+
+    baseline_event = np.full(len(current), "", dtype=object)
+    baseline_loss = np.full(len(current), np.nan)
+    baseline_event[matched] = baseline["Event"].to_numpy()[matched_baseline]
+    baseline_loss[matched] = baseline["Splice_Loss"].to_numpy(dtype=np.float64)[matched_baseline]
+
+    splice_loss = current["Splice_Loss"].to_numpy(dtype=np.float64)
+    is_matched = np.zeros(len(current), dtype=bool)
+    is_matched[matched] = True
+    with np.errstate(invalid="ignore"):
+        grown = is_matched & ((splice_loss - baseline_loss >= growth_db) | (loss_delta >= growth_db))
+        new = ~is_matched & ((splice_loss >= new_event_db) | (loss_delta >= new_event_db))
+    severity = np.select([new, grown], [2, 1], default=0)
+
+    table = pd.DataFrame({
+        "Shot_ID": current["Shot_ID"].to_numpy(),
+        "Event_Number": current["Event_Number"].to_numpy(),
+        "Cable": pairs["Cable"].to_numpy()[current_pair],
+        "Fiber_ID": pairs["Fiber_ID"].to_numpy()[current_pair],
+        "Direction": pairs["Direction"].to_numpy()[current_pair],
+        "Shift_KM": shift_km[current_pair],
+        "Fiber_Loss_Delta": fiber_delta[current_pair],
+        "Event": current["Event"].to_numpy(),
+        "Event_Distance": current_distance,
+        "Splice_Loss": splice_loss,
+        "Baseline_Event": baseline_event,
+        "Baseline_Splice_Loss": baseline_loss,
+        "Loss_Delta": loss_delta,
+        "Comments": np.asarray(CHANGE_COMMENTS, dtype=object)[severity],
+    })
+    return pairs, table[["Shot_ID", "Event_Number"] + CHANGE_COLUMNS]
+
+def flag_changes(events, table):
+    """
+    Adds the New event / Grown event labels of a compare_shots table to the Comments of the
+    matching events, after the tolerance label given by report.classify_events (for example
+    "Pass; New event"), so the report itself shows what changed since the baseline.
+    Returns the number of events flagged.
+    """
+    flagged = table[table["Comments"] != ""]
+    labels = dict(zip(zip(flagged["Shot_ID"], flagged["Event_Number"]), flagged["Comments"]))
+    changes = [labels.get(key) for key in zip(events["Shot_ID"], events["Event_Number"])]
+    mask = np.array([change is not None for change in changes], dtype=bool)
+    if mask.any():
+        events.loc[mask, "Comments"] = [
+            f"{comment}; {change}" if comment else change
+            for comment, change in zip(events["Comments"][mask], np.asarray(changes, dtype=object)[mask])
+        ]
+    return int(mask.sum())
+
+def write_changes_report(table, save_path, split_by_cable=False, changed_only=True):
+    """
+    Writes the comparison table to .csv, or streams it to .xlsx with the New/Grown events
+    highlighted (one sheet per cable with split_by_cable). With changed_only, only the
+    flagged events are written.
+    """
+    if changed_only:
+        table = table[table["Comments"] != ""]
+    rows = zip(*(column_values(table[column]) for column in CHANGE_COLUMNS))
+    if save_path.lower().endswith(".csv"):
+        with open(save_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CHANGE_COLUMNS)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+        return
+
+    with StreamingReportWriter(save_path, CHANGE_COLUMNS, ["Comments"]) as writer:
+        for row in rows:
+            writer.write_row(row, group=row[0] if split_by_cable else None)
+        return writer.close()
@@ -114,11 +114,8 @@ module Datapts
     # .....................................
     # adjusted resolution
     dx = results['FxdParams']['resolution']
-    dlist = []
-    1.upto(xN) { |i|
-      val = Parts::get_uint(fh, 2)
-      dlist.push(val)
-    }
+    # all samples in one read, decoded as 16-bit unsigned little-endian
+    dlist = fh.read(2*xN).unpack('S<*')
     
     ymax = dlist.max
     ymin = dlist.min
@@ -146,10 +143,19 @@ module Datapts
       nlist = dlist.map { |x| -x*fs }
     end
     
-    0.upto(xN-1) do |i|
-      # more work but (maybe) less rounding issues
-      x = dx*i*xscaling / 1000.0 # output in kkm
-      tracedata.push( "%f\t%f" % [x, nlist[i]] )
+    if tracedata.is_a?(Hash) then
+      # numeric trace for binary output; distances are implied by the resolution
+      tracedata['samples'] = nlist
+      tracedata['resolution'] = dx
+      tracedata['scaling factor'] = scaling_factor
+      tracedata['xscaling'] = xscaling
+      tracedata['offset'] = offset
+    else
+      0.upto(xN-1) do |i|
+	# more work but (maybe) less rounding issues
+	x = dx*i*xscaling / 1000.0 # output in kkm
+	tracedata.push( "%f\t%f" % [x, nlist[i]] )
+      end
     end
 
     # .........................................
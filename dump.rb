@@ -1,5 +1,6 @@
 #!/usr/bin/ruby
 require 'json'
+require 'zlib'
 
 module Dump
   def self.jsonfile(results, opfile, format='JSON')
@@ -10,6 +11,17 @@ module Dump
     }
   end
   
+  # compact dump: the whole results hash minified on a single line, so
+  # dumps concatenated together form NDJSON; compress writes it gzipped
+  def self.compactfile(results, opfile, compress=false)
+    line = JSON.generate( results ) + "\n"
+    if compress then
+      Zlib::GzipWriter.open(opfile) { |gz| gz.write(line) }
+    else
+      File.write(opfile, line)
+    end
+  end
+  
   def self.tracefile(trace, opfile, format='JSON')
     
     File.open(opfile,"w") { |file|
@@ -19,5 +31,31 @@ module Dump
     }
   end
   
+  # binary trace: 48-byte little-endian header followed by float32 samples (dB)
+  #   0  char[8]  magic "SORTRACE"
+  #   8  uint16   format version
+  #  10  uint16   header size in bytes (offset of the first sample)
+  #  12  uint32   number of samples
+  #  16  double   resolution, meters per sample
+  #  24  double   DataPts scaling factor
+  #  32  double   distance scaling (xscaling)
+  #  40  char[4]  offset mode ('STV', 'AFL', ...)
+  #  44  4 bytes  reserved
+  @@trace_magic = "SORTRACE"
+  @@trace_version = 1
+  @@trace_header_size = 48
+  
+  def self.binary_tracefile(trace, opfile)
+    samples = trace['samples']
+    header = [ @@trace_magic, @@trace_version, @@trace_header_size, samples.length,
+	       trace['resolution'].to_f, trace['scaling factor'].to_f, trace['xscaling'].to_f,
+	       trace['offset'].to_s ].pack('a8S<S<L<EEEa4x4')
+    
+    File.open(opfile,"wb") { |file|
+      file.write header
+      file.write samples.pack('e*')
+    }
+  end
+  
   
 end
@@ -0,0 +1,253 @@
+import datetime
+import os
+import re
+import sqlite3
+
+import report
+
+STORE_NAME = "events.sqlite"
+STORE_VERSION = 1
+
+# Dumps decoded and inserted per transaction
+STORE_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shots (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,   -- path of the -dump.json
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    filename TEXT,                 -- original .sor file name
+    cable TEXT,
+    fiber_id TEXT,
+    direction TEXT,
+    range_km,
+    distance_km,
+    acquired INTEGER               -- FxdParams date/time, Unix seconds
+);
+CREATE INDEX IF NOT EXISTS shots_cable ON shots (cable);
+CREATE INDEX IF NOT EXISTS shots_fiber ON shots (fiber_id);
+CREATE INDEX IF NOT EXISTS shots_direction ON shots (direction);
+CREATE INDEX IF NOT EXISTS shots_acquired ON shots (acquired);
+
+CREATE TABLE IF NOT EXISTS params (
+    shot_id INTEGER NOT NULL REFERENCES shots (id) ON DELETE CASCADE,
+    block TEXT NOT NULL,           -- GenParams or FxdParams
+    name TEXT NOT NULL,
+    value,
+    PRIMARY KEY (shot_id, block, name)
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    shot_id INTEGER NOT NULL REFERENCES shots (id) ON DELETE CASCADE,
+    number INTEGER NOT NULL,
+    name TEXT,
+    distance REAL,
+    splice_loss REAL,
+    refl_loss REAL,
+    slope REAL,
+    type TEXT,
+    comments TEXT,
+    PRIMARY KEY (shot_id, number)
+);
+CREATE INDEX IF NOT EXISTS events_distance ON events (distance);
+CREATE INDEX IF NOT EXISTS events_splice_loss ON events (splice_loss);
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def _number(value):
+    """
+    Converts a dump value such as "0.123" to a float, or None if it is not numeric.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _acquired(fxd_params):
+    """
+    Returns the acquisition time in Unix seconds from FxdParams "date/time", e.g.
+    "Mon Sep 14 12:26:40 2020 (1600086400 sec)".
+    """
+    match = re.search(r"\((\d+) sec\)", str(fxd_params.get("date/time", "")))
+    return int(match.group(1)) if match else None
+
+def _store_chunk(file_paths):
+    """
+    Loads a chunk of dumps and converts each to the rows of the store; runs inside an
+    ingestion worker. Returns (file_path, (shot, params, events), error) per file, in order.
+    """
+    results = []
+    for file_path in file_paths:
+        try:
+            st = os.stat(file_path)
+            json_data = report.load_dump(file_path)
+            (direction, fiber_id, range_value, distance_km, cable), _ = report.extract_shot(json_data)
+            gen_params = json_data.get("GenParams", {})
+            fxd_params = json_data.get("FxdParams", {})
+            shot = (
+                os.path.abspath(file_path), st.st_size, st.st_mtime_ns, json_data.get("filename", ""),
+                cable, fiber_id, direction, range_value, distance_km, _acquired(fxd_params),
+            )
+            params = [("GenParams", name, str(value)) for name, value in gen_params.items()] + \
+                [("FxdParams", name, str(value)) for name, value in fxd_params.items()]
+            key_events = report.key_events(json_data)
+            events = [
+                (
+                    number, key, _number(info.get("distance")), _number(info.get("splice loss")),
+                    _number(info.get("refl loss")), _number(info.get("slope")),
+                    info.get("type", ""), info.get("comments", ""),
+                )
+                for number, (key, info) in enumerate(key_events, start=1)
+            ]
+            results.append((file_path, (shot, params, events), None))
+        except Exception as e:
+            results.append((file_path, None, {"file": file_path, "error": type(e).__name__, "message": str(e)}))
+    return results
+
+class EventStore:
+    """
+    A local SQLite store of shots, their GenParams/FxdParams metadata and KeyEvents,
+    indexed on cable, fiber ID, direction, acquisition time, event distance and splice loss,
+    so fibers can be queried across jobs without re-reading the JSON dumps.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        self.db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_version', ?)", (str(STORE_VERSION),))
+        self.db.commit()
+
+    def add_dumps(self, file_paths, errors=None, workers=None, force=False):
+        """
+        Adds or replaces the shots of the given -dump.json files. Dumps whose size and mtime
+        match the stored copy are skipped unless force is set. Dumps are decoded across worker
+        processes and inserted in batched transactions of STORE_BATCH files.
+
+        Files that fail are skipped; if errors is a list, a dict with the file, error type and
+        message is appended to it for each of them. Returns the number of shots written.
+        """
+        file_paths = list(file_paths)
+        if not force:
+            known = {source: (size, mtime_ns) for source, size, mtime_ns in
+                     self.db.execute("SELECT source, size, mtime_ns FROM shots")}
+
+            def changed(file_path):
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    return True  # reported as an error when it is loaded
+                return known.get(os.path.abspath(file_path)) != (st.st_size, st.st_mtime_ns)
+
+            file_paths = [file_path for file_path in file_paths if changed(file_path)]
+
+        written = 0
+        for start in range(0, len(file_paths), STORE_BATCH):
+            batch = file_paths[start:start + STORE_BATCH]
+            with self.db:  # one transaction per batch
+                for file_path, rows, error in report.extract_all(batch, workers, _store_chunk):
+                    if error:
+                        if errors is not None:
+                            errors.append(error)
+                        continue
+                    shot, params, events = rows
+                    self.db.execute("DELETE FROM shots WHERE source = ?", (shot[0],))
+                    shot_id = self.db.execute("""
+                        INSERT INTO shots (source, size, mtime_ns, filename, cable, fiber_id, direction,
+                                           range_km, distance_km, acquired)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, shot).lastrowid
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO params (shot_id, block, name, value) VALUES (?, ?, ?, ?)",
+                        [(shot_id,) + param for param in params]
+                    )
+                    self.db.executemany("""
+                        INSERT OR REPLACE INTO events (shot_id, number, name, distance, splice_loss, refl_loss,
+                                                       slope, type, comments)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [(shot_id,) + event for event in events])
+                    written += 1
+        return written
+
+    def remove_missing(self):
+        """
+        Drops shots whose -dump.json no longer exists. Returns the number removed.
+        """
+        missing = [(source,) for (source,) in self.db.execute("SELECT source FROM shots")
+                   if not os.path.exists(source)]
+        with self.db:
+            self.db.executemany("DELETE FROM shots WHERE source = ?", missing)
+        return len(missing)
+
+    def query(self, cable=None, fiber_id=None, direction=None, since=None, until=None,
+              min_splice_loss=None, min_distance=None, max_distance=None):
+        """
+        Selects shots and events and returns them as the (shots, events) tables used by the
+        report, so classify_events and the report writers work on them unchanged.
+
+        Shot filters: cable, fiber_id, direction, and since/until (datetime.date or
+        datetime.datetime, on the acquisition time). Event filters: min_splice_loss and
+        min_distance/max_distance in km; when any is given, only the matching events and the
+        shots that have at least one of them are returned.
+        """
+        shot_where, shot_args = ["1"], []
+        for column, value in (("cable", cable), ("fiber_id", fiber_id), ("direction", direction)):
+            if value is not None:
+                shot_where.append(f"s.{column} = ?")
+                shot_args.append(value)
+        if since is not None:
+            shot_where.append("s.acquired >= ?")
+            shot_args.append(_timestamp(since))
+        if until is not None:
+            shot_where.append("s.acquired < ?")
+            shot_args.append(_timestamp(until))
+
+        event_where, event_args = ["1"], []
+        for condition, value in (("e.splice_loss >= ?", min_splice_loss), ("e.distance >= ?", min_distance),
+                                 ("e.distance <= ?", max_distance)):
+            if value is not None:
+                event_where.append(condition)
+                event_args.append(value)
+
+        shot_sql = " AND ".join(shot_where)
+        event_sql = " AND ".join(event_where)
+        filter_shots = ""
+        if len(event_where) > 1:
+            filter_shots = f" AND s.id IN (SELECT e.shot_id FROM events e WHERE {event_sql})"
+
+        shot_rows = self.db.execute(f"""
+            SELECT s.id, s.direction, s.fiber_id, s.range_km, s.distance_km, s.cable, s.source
+            FROM shots s WHERE {shot_sql}{filter_shots} ORDER BY s.source
+        """, shot_args + (event_args if filter_shots else [])).fetchall()
+        event_rows = self.db.execute(f"""
+            SELECT e.shot_id, e.number, e.name, e.distance, e.splice_loss, e.refl_loss, e.comments
+            FROM events e JOIN shots s ON s.id = e.shot_id
+            WHERE {shot_sql} AND {event_sql} ORDER BY s.source, e.number
+        """, shot_args + event_args).fetchall()
+
+        shot_names = ["Shot_ID"] + report.SHOT_COLUMNS + report.SHOT_KEYS
+        event_names = ["Shot_ID", "Event_Number"] + report.EVENT_COLUMNS
+        shot_columns = {name: [row[i] for row in shot_rows] for i, name in enumerate(shot_names)}
+        event_columns = {name: [row[i] for row in event_rows] for i, name in enumerate(event_names)}
+        return report.shots_and_events(shot_columns, event_columns)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _timestamp(value):
+    """
+    Converts a date or datetime to Unix seconds (local time, like the OTDR clock).
+    """
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return int(value.timestamp())
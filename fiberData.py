@@ -1,7 +1,329 @@
+import argparse
+import datetime
+import multiprocessing
 import os
-import subprocess
+import sys
+from contextlib import nullcontext
 
-def main():
+import metrics
+import sorbatch
+
+# Exit codes for headless runs
+EXIT_OK = 0
+EXIT_PARTIAL = 1   # some files failed to parse or load; any requested report was still written
+EXIT_USAGE = 2     # bad arguments (also used by argparse)
+EXIT_FATAL = 3     # nothing usable was produced
+
+DEFAULT_RBOTDR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rbOTDR.rb")
+
+def build_parser():
+    """
+    Builds the command-line parser for headless batch runs.
+    """
+    parser = argparse.ArgumentParser(
+        description="Parse .sor files and write a fiber report without any user interaction. "
+                    "Run without arguments for the interactive prompts."
+    )
+    parser.add_argument("-i", "--input", help="folder containing .sor files (omit to report on existing dumps)")
+    parser.add_argument("-o", "--output", required=True, help="folder for the parsed -dump.json files")
+    parser.add_argument("-r", "--report", help="report file to write (.xlsx or .csv)")
+    parser.add_argument("--layout", choices=["stacked", "wide"], default="stacked", help="report layout")
+    parser.add_argument("--split-by-cable", action="store_true", help="write each cable to its own sheet(s)")
+    parser.add_argument("--pass-tolerance", type=float, default=0.3,
+                        help="maximum splice loss for Pass in dB (default 0.3)")
+    parser.add_argument("--warning-tolerance", type=float, default=0.6,
+                        help="maximum splice loss for Warning in dB (default 0.6)")
+    parser.add_argument("-j", "--workers", type=int, default=sorbatch.default_workers(),
+                        help="number of parallel parse workers (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-parse every file, ignoring the manifest")
+    parser.add_argument("--traces", action="store_true",
+                        help="also write each trace as little-endian float32 (-trace.bin)")
+    parser.add_argument("--dump-format", choices=list(sorbatch.DUMP_FORMATS), default="pretty",
+                        help="format of the -dump.json files: pretty-printed (default), compact (single-line JSON "
+                             "with numeric events, faster to load) or compact-gz (compact, gzipped as -dump.json.gz)")
+    parser.add_argument("--events", choices=["keyevents", "trace", "both"], default="keyevents",
+                        help="report the OTDR's KeyEvents, events found by analysing the -trace.bin "
+                             "files, or both (default keyevents)")
+    parser.add_argument("--bidirectional",
+                        help="also write the bidirectional average splice loss of paired A->B / B->A shots "
+                             "to this file (.xlsx or .csv)")
+    parser.add_argument("--match-tolerance", type=float, default=0.05,
+                        help="maximum distance in km between paired events from opposite ends (default 0.05)")
+    parser.add_argument("--stats", action="store_true",
+                        help="also write fleet statistics (splice-loss distribution, events per km, worst and "
+                             "longest fibers per cable and per contractor) next to the report as REPORT-stats.xlsx")
+    parser.add_argument("--baseline",
+                        help="folder of baseline (acceptance) -dump.json files to compare the shots against; new "
+                             "and grown events are flagged in the report's comments, and traces are aligned when "
+                             "both sides have -trace.bin files")
+    parser.add_argument("--changes",
+                        help="with --baseline: also write only the new and grown events to this file (.xlsx or .csv)")
+    parser.add_argument("--new-event-db", type=float, default=0.1,
+                        help="with --baseline: loss in dB from which an event missing in the baseline is "
+                             "flagged (default 0.1)")
+    parser.add_argument("--growth-db", type=float, default=0.1,
+                        help="with --baseline: loss growth in dB from which a baseline event is flagged (default 0.1)")
+    parser.add_argument("--max-shift", type=float, default=0.5,
+                        help="with --baseline: largest launch offset in km searched when aligning traces (default 0.5)")
+    parser.add_argument("--store",
+                        help="SQLite event store to add the parsed dumps to; with --report, the report is "
+                             "built from a query against the store instead of the JSON files")
+    parser.add_argument("--cable", help="with --store: only report this cable ID")
+    parser.add_argument("--fiber", help="with --store: only report this fiber ID")
+    parser.add_argument("--direction", help="with --store: only report this shot direction")
+    parser.add_argument("--since", type=datetime.date.fromisoformat,
+                        help="with --store: only report shots acquired on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--min-splice-loss", type=float,
+                        help="with --store: only report events with at least this splice loss in dB")
+    parser.add_argument("--from-km", type=float, help="with --store: only report events at or beyond this distance")
+    parser.add_argument("--to-km", type=float, help="with --store: only report events up to this distance")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running: parse .sor files as they arrive in --input and keep a report "
+                             "per cable up to date (stop with Ctrl+C)")
+    parser.add_argument("--report-dir", help="folder for the per-cable reports in --watch mode "
+                                             "(default: OUTPUT/reports)")
+    parser.add_argument("--poll-interval", type=float, default=5.0,
+                        help="seconds between scans of the input folder in --watch mode (default 5)")
+    parser.add_argument("--settle", type=float, default=10.0,
+                        help="seconds a file must stop changing before it is parsed in --watch mode (default 10)")
+    parser.add_argument("--metrics", nargs="?", const="",
+                        help="write per-stage and per-file timings, bytes read, event counts and peak memory to "
+                             "this JSON file (default OUTPUT/metrics.json) and print a short summary")
+    parser.add_argument("--profile",
+                        help="record a cProfile of the run to this file (read it with pstats); only the main thread "
+                             "of this process is profiled, not the Ruby parse workers or the decode processes")
+    parser.add_argument("--rbotdr", default=DEFAULT_RBOTDR, help="path to rbOTDR.rb")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the final summary")
+    return parser
+
+def report_module():
+    """
+    Imports the report module on first use, so a parse-only run does not pay for loading pandas.
+    """
+    import report
+    return report
+
+def run_batch(args, run_metrics=None):
+    """
+    Runs parse, extract, tolerance classification and report writing end to end.
+    run_metrics, if given, collects a span per stage and a record per parsed and decoded file.
+    Returns one of the EXIT_* codes.
+    """
+    def stage(name):
+        return run_metrics.span(name) if run_metrics is not None else nullcontext()
+
+    if args.bidirectional is not None and args.report is None:
+        print("--bidirectional needs --report.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.stats and args.report is None:
+        print("--stats needs --report.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.baseline is not None and args.report is None:
+        print("--baseline needs --report.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.changes is not None and args.baseline is None:
+        print("--changes needs --baseline.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.baseline is not None and not os.path.isdir(args.baseline):
+        print(f"Baseline folder not found: {args.baseline}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.input is None and args.report is None and args.store is None:
+        print("Nothing to do: give --input to parse, --store to index and/or --report to write a report.",
+              file=sys.stderr)
+        return EXIT_USAGE
+    if args.input is not None and not os.path.isdir(args.input):
+        print(f"Input folder not found: {args.input}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.pass_tolerance > args.warning_tolerance:
+        print("--pass-tolerance must not exceed --warning-tolerance.", file=sys.stderr)
+        return EXIT_USAGE
+    os.makedirs(args.output, exist_ok=True)
+
+    partial = False
+
+    if args.input is not None:
+        def progress(done, total, sor_file_path, error):
+            if error:
+                print(f"[{done}/{total}] Error processing {sor_file_path}: {error}", file=sys.stderr)
+            elif not args.quiet:
+                print(f"[{done}/{total}] Parsed {sor_file_path}")
+
+        try:
+            with stage("parse"):
+                summary = sorbatch.parse_sor_incremental(
+                    args.input, args.output, args.rbotdr, workers=max(1, args.workers), progress=progress,
+                    force=args.force, traces=args.traces, metrics=run_metrics, dump_format=args.dump_format
+                )
+        except sorbatch.RubyNotFoundError as e:
+            print(e, file=sys.stderr)
+            return EXIT_FATAL
+
+        print(f"{summary['parsed']} parsed, {summary['skipped']} unchanged, {summary['removed']} removed, "
+              f"{len(summary['errors'])} failed.")
+        if summary["errors"]:
+            error_log_path = sorbatch.write_error_log(summary["errors"], args.output)
+            print(f"See log at: {error_log_path}", file=sys.stderr)
+            partial = True
+
+    store = None
+    if args.store is not None:
+        import eventstore
+
+        store = eventstore.EventStore(args.store)
+        store_errors = []
+        with stage("store"):
+            removed = store.remove_missing()
+            added = store.add_dumps(
+                report_module().find_dump_files(args.output), errors=store_errors, workers=max(1, args.workers)
+            )
+        for error in store_errors:
+            print(f"Error processing {error['file']}: {error['error']}: {error['message']}", file=sys.stderr)
+        if store_errors:
+            partial = True
+        if not args.quiet:
+            print(f"{added} shot(s) added to and {removed} removed from the event store {args.store}.")
+        if args.report is None:
+            store.close()
+
+    if args.report is not None:
+        report = report_module()
+
+        load_errors = []
+        if store is not None:
+            with stage("store query"):
+                shots, events = store.query(
+                    cable=args.cable, fiber_id=args.fiber, direction=args.direction, since=args.since,
+                    min_splice_loss=args.min_splice_loss, min_distance=args.from_km, max_distance=args.to_km
+                )
+            store.close()
+        else:
+            with stage("decode"):
+                file_paths = report.find_dump_files(args.output)
+                shots, events = report.process_json_and_extract(
+                    file_paths, errors=load_errors, workers=max(1, args.workers), metrics=run_metrics
+                )
+        if run_metrics is not None:
+            run_metrics.count("shots", len(shots))
+            run_metrics.count("events", len(events))
+        for error in load_errors:
+            print(f"Error processing {error['file']}: {error['error']}: {error['message']}", file=sys.stderr)
+        if shots.empty:
+            print("No valid data extracted.", file=sys.stderr)
+            return EXIT_FATAL
+        if load_errors:
+            partial = True
+
+        if args.events != "keyevents":
+            with stage("trace analysis"):
+                events, trace_summary = report.trace_events(shots, events, mode=args.events)
+            if trace_summary.empty:
+                print("No -trace.bin files found; reporting KeyEvents only (parse with --traces).",
+                      file=sys.stderr)
+            elif not args.quiet:
+                print(f"Analysed {len(trace_summary)} trace(s).")
+
+        with stage("classify"):
+            report.classify_events(shots, events, args.pass_tolerance, args.warning_tolerance)
+
+        if args.baseline is not None:
+            import compare
+
+            baseline_errors = []
+            with stage("baseline compare"):
+                baseline_shots, baseline_events = report.process_json_and_extract(
+                    report.find_dump_files(args.baseline), errors=baseline_errors, workers=max(1, args.workers)
+                )
+                pairs, changes = compare.compare_shots(
+                    shots, events, baseline_shots, baseline_events, max_shift_km=args.max_shift,
+                    tolerance_km=args.match_tolerance, new_event_db=args.new_event_db, growth_db=args.growth_db,
+                    errors=baseline_errors, workers=max(1, args.workers)
+                )
+                compare.flag_changes(events, changes)
+            for error in baseline_errors:
+                print(f"Error processing {error['file']}: {error['error']}: {error['message']}", file=sys.stderr)
+            if baseline_errors:
+                partial = True
+            flagged = changes["Comments"].value_counts()
+            print(f"{len(pairs)} shot(s) compared with the baseline: {flagged.get('New event', 0)} new and "
+                  f"{flagged.get('Grown event', 0)} grown event(s).")
+            if args.changes is not None:
+                with stage("write changes"):
+                    compare.write_changes_report(changes, args.changes, split_by_cable=args.split_by_cable)
+                print(f"Changes saved to: {args.changes}")
+
+        wide = args.layout == "wide"
+        if args.report.lower().endswith(".csv"):
+            report.write_csv_report(shots, events, args.report, wide=wide, metrics=run_metrics)
+        else:
+            report.write_xlsx_report(shots, events, args.report, wide=wide, split_by_cable=args.split_by_cable,
+                                     metrics=run_metrics)
+        print(f"Report saved to: {args.report}")
+
+        if args.stats:
+            import fleetstats
+
+            stats_errors = []
+            with stage("fleet statistics"):
+                stats = fleetstats.collect_stats(
+                    report.find_dump_files(args.output), args.pass_tolerance, args.warning_tolerance,
+                    errors=stats_errors, workers=max(1, args.workers)
+                )
+                save_path = fleetstats.stats_path(args.report)
+                fleetstats.write_stats(stats, save_path)
+            if stats_errors:
+                partial = True
+            print(f"Fleet statistics saved to: {save_path}")
+
+        if args.bidirectional is not None:
+            import pairing
+
+            with stage("bidirectional"):
+                pairs, table = pairing.bidirectional_events(
+                    shots, events, tolerance_km=args.match_tolerance,
+                    pass_tolerance=args.pass_tolerance, warning_tolerance=args.warning_tolerance
+                )
+                pairing.write_bidirectional_report(table, args.bidirectional, split_by_cable=args.split_by_cable)
+            print(f"{len(pairs)} fiber(s) paired. Bidirectional report saved to: {args.bidirectional}")
+
+    return EXIT_PARTIAL if partial else EXIT_OK
+
+def run_watch(args):
+    """
+    Runs the watch-folder service until interrupted. Returns one of the EXIT_* codes.
+    """
+    if args.input is None or not os.path.isdir(args.input):
+        print("--watch needs an existing --input folder.", file=sys.stderr)
+        return EXIT_USAGE
+    if args.pass_tolerance > args.warning_tolerance:
+        print("--pass-tolerance must not exceed --warning-tolerance.", file=sys.stderr)
+        return EXIT_USAGE
+
+    # Imported here so batch runs do not pay for loading pandas up front
+    import watcher
+
+    def log(message):
+        if message.startswith(("Error", "Could not")):
+            print(message, file=sys.stderr)
+        elif not args.quiet:
+            print(message)
+
+    service = watcher.Watcher(
+        args.input, args.output, args.rbotdr, report_folder=args.report_dir, workers=max(1, args.workers),
+        poll_interval=args.poll_interval, settle_seconds=args.settle, traces=args.traces,
+        dump_format=args.dump_format, pass_tolerance=args.pass_tolerance, warning_tolerance=args.warning_tolerance,
+        wide=args.layout == "wide", log=log
+    )
+    print(f"Watching {args.input}; press Ctrl+C to stop.")
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("Stopped; queued files will be picked up on the next run.")
+    except sorbatch.RubyNotFoundError as e:
+        print(e, file=sys.stderr)
+        return EXIT_FATAL
+    return EXIT_OK
+
+def interactive():
     # Ask the user for the folder containing .sor files
     input_folder = input("Enter the path to the folder containing .sor files: ").strip()
     while not os.path.isdir(input_folder):
@@ -14,31 +336,54 @@ def main():
         os.makedirs(output_folder)
         print(f"Created output folder: {output_folder}")
 
-    # Ask the user for the path to the rbOTDR executable
-    rbOTDR_path = input("Enter the path to the rbOTDR executable: ").strip()
-    while not os.path.isfile(rbOTDR_path) or not os.access(rbOTDR_path, os.X_OK):
-        print("The provided rbOTDR path does not exist or is not executable. Please try again.")
-        rbOTDR_path = input("Enter the path to the rbOTDR executable: ").strip()
-
-    # Process each .sor file in the input folder
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.sor'):
-                input_file_path = os.path.join(root, file)
-                output_file_path = os.path.join(output_folder, file)
-
-                print(f"Processing {input_file_path}...")
-                try:
-                    # Run the rbOTDR command and save output
-                    with open(output_file_path, 'w') as output_file:
-                        subprocess.run([rbOTDR_path, input_file_path], stdout=output_file, check=True)
-                    print(f"Saved parsed data to {output_file_path}")
-                except subprocess.CalledProcessError as e:
-                    print(f"Error processing {input_file_path}: {e}")
-                except Exception as e:
-                    print(f"Unexpected error: {e}")
+    # Ask the user for the path to rbOTDR.rb (defaults to the copy next to this script)
+    rbOTDR_path = input(f"Enter the path to rbOTDR.rb [{DEFAULT_RBOTDR}]: ").strip() or DEFAULT_RBOTDR
+    while not os.path.isfile(rbOTDR_path):
+        print("The provided rbOTDR path does not exist. Please try again.")
+        rbOTDR_path = input(f"Enter the path to rbOTDR.rb [{DEFAULT_RBOTDR}]: ").strip() or DEFAULT_RBOTDR
+
+    def progress(done, total, sor_file_path, error):
+        if error:
+            print(f"[{done}/{total}] Error processing {sor_file_path}: {error}")
+        else:
+            print(f"[{done}/{total}] Parsed {sor_file_path}")
+
+    # Parse new or changed .sor files on a pool of persistent Ruby workers
+    try:
+        summary = sorbatch.parse_sor_incremental(input_folder, output_folder, rbOTDR_path, progress=progress)
+    except sorbatch.RubyNotFoundError as e:
+        print(e)
+        return
+
+    print(f"{summary['parsed']} parsed, {summary['skipped']} unchanged, {summary['removed']} removed.")
+    error_log = summary["errors"]
+    if error_log:
+        error_log_path = sorbatch.write_error_log(error_log, output_folder)
+        print(f"{len(error_log)} file(s) failed to parse. See log at: {error_log_path}")
 
     print("All files processed.")
 
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        interactive()
+        return EXIT_OK
+    args = build_parser().parse_args(argv)
+    if args.watch:
+        return run_watch(args)
+
+    run_metrics = metrics.Metrics() if args.metrics is not None else None
+    with metrics.profile(args.profile):
+        code = run_batch(args, run_metrics)
+    if args.profile is not None:
+        print(f"Profile saved to: {args.profile}")
+    if run_metrics is not None and code != EXIT_USAGE:
+        metrics_path = args.metrics or os.path.join(args.output, metrics.METRICS_NAME)
+        run_metrics.write(metrics_path)
+        print(run_metrics.summary())
+        print(f"Metrics saved to: {metrics_path}")
+    return code
+
 if __name__ == "__main__":
-    main()
+    multiprocessing.freeze_support()
+    sys.exit(main())
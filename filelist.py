@@ -0,0 +1,222 @@
+import gzip
+import json
+import os
+import re
+import tkinter as tk
+from tkinter import Scrollbar, font
+
+from report import DUMP_SUFFIXES, load_dump
+
+# Columns a FileSet can be filtered on
+FILTER_FIELDS = ["Any", "Cable", "Fiber ID"]
+
+# Bytes of a dump searched for the cable ID before falling back to decoding all of it
+KEY_READ_BYTES = 16 * 1024
+CABLE_ID_PATTERN = re.compile(rb'"cable ID"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+def scan_dump_files(folder):
+    """
+    Walks a folder with os.scandir and yields the path of every -dump.json(.gz) file,
+    without building the whole listing first. Unreadable folders are skipped.
+    """
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.endswith(DUMP_SUFFIXES):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def file_keys(path):
+    """
+    Returns the (cable, fiber ID) of a dump, as used for filtering, without decoding it:
+    the fiber ID from the file name, as in the report, and the cable from the "cable ID"
+    of GenParams, which rbOTDR.rb writes near the start of the dump. Only the first
+    KEY_READ_BYTES are read unless the cable is not found there.
+    Files that cannot be read get an empty cable; their error is reported with the report.
+    """
+    fiber_id = re.search(r"\s(\d{3})\s", os.path.basename(path))
+    fiber_id = fiber_id.group(1) if fiber_id else ""
+    try:
+        with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as file:
+            head = file.read(KEY_READ_BYTES)
+        cable = CABLE_ID_PATTERN.search(head)
+        if cable:
+            return json.loads(cable.group(1)), fiber_id
+        json_data = load_dump(path)
+    except Exception:
+        return "", fiber_id
+    return str(json_data.get("GenParams", {}).get("cable ID", "")), fiber_id
+
+class FileSet:
+    """
+    The files chosen for the report, kept in memory rather than in the list widget:
+    a dict of path -> (name, cable, fiber ID) in the order added, plus the list of
+    paths that pass the current filter.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.view = []
+        self.field = "Any"
+        self.text = ""
+
+    def __len__(self):
+        return len(self.records)
+
+    def _matches(self, record):
+        if not self.text:
+            return True
+        name, cable, fiber_id = record
+        if self.field == "Cable":
+            values = (cable,)
+        elif self.field == "Fiber ID":
+            values = (fiber_id,)
+        else:
+            values = (name, cable, fiber_id)
+        return any(self.text in value.lower() for value in values)
+
+    def add(self, records):
+        """
+        Adds (path, cable, fiber ID) records; paths already present are updated in place.
+        """
+        for path, cable, fiber_id in records:
+            new = path not in self.records
+            record = self.records[path] = (os.path.basename(path), cable, fiber_id)
+            if new and self._matches(record):
+                self.view.append(path)
+
+    def remove(self, paths):
+        """
+        Removes the given paths that are in the current view; files hidden by the filter
+        are kept even if they are among paths.
+        """
+        paths = set(paths).intersection(self.view)
+        for path in paths:
+            self.records.pop(path, None)
+        self.view = [path for path in self.view if path not in paths]
+
+    def clear(self):
+        self.records.clear()
+        self.view = []
+
+    def set_filter(self, field, text):
+        """
+        Filters the view on one field (see FILTER_FIELDS) by case-insensitive substring.
+        """
+        self.field = field
+        self.text = text.strip().lower()
+        self.view = [path for path, record in self.records.items() if self._matches(record)]
+
+    def row(self, path):
+        """
+        Returns the text shown for a file in the list.
+        """
+        name, cable, fiber_id = self.records[path]
+        return f"{name}    [cable {cable or '-'}, fiber {fiber_id or '-'}]"
+
+class VirtualList(tk.Frame):
+    """
+    A list that only renders the rows currently visible: a Listbox of the window height
+    is refilled from the item sequence as it scrolls, so showing a hundred thousand items
+    costs the same as showing a screenful. The selection is kept as a set of items.
+    """
+
+    def __init__(self, master, height=15, width=80, format_row=str):
+        super().__init__(master)
+        self.items = []
+        self.format_row = format_row
+        self.first = 0
+        self.selected = set()
+        self.listbox = tk.Listbox(self, height=height, width=width, selectmode=tk.EXTENDED,
+                                  exportselection=False, activestyle="none")
+        self.scrollbar = Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<Configure>", lambda event: self.refresh())
+        for sequence, step in (("<MouseWheel>", None), ("<Button-4>", -3), ("<Button-5>", 3)):
+            self.listbox.bind(sequence, lambda event, step=step: self._on_wheel(event, step))
+        self.listbox.bind("<Up>", lambda event: self._on_key(-1))
+        self.listbox.bind("<Down>", lambda event: self._on_key(1))
+        self.listbox.bind("<Prior>", lambda event: self._on_key(-self._rows()))
+        self.listbox.bind("<Next>", lambda event: self._on_key(self._rows()))
+
+    def _rows(self):
+        """
+        Number of rows that fit in the widget.
+        """
+        height = self.listbox.winfo_height()
+        if height <= 1:  # not drawn yet
+            return int(self.listbox.cget("height"))
+        line = font.Font(self.listbox, font=self.listbox.cget("font")).metrics("linespace") + \
+            1 + 2 * int(self.listbox.cget("selectborderwidth"))
+        return max(1, (height - 2 * int(self.listbox.cget("borderwidth"))) // line)
+
+    def set_items(self, items):
+        """
+        Shows a sequence of items; the sequence is referenced, not copied.
+        """
+        self.items = items
+        self.scroll_to(self.first)
+
+    def scroll_to(self, first):
+        self.first = max(0, min(first, len(self.items) - self._rows()))
+        self.refresh()
+
+    def refresh(self):
+        """
+        Redraws the visible rows and the scrollbar.
+        """
+        rows = self._rows()
+        visible = self.items[self.first:self.first + rows]
+        self.listbox.delete(0, tk.END)
+        if visible:
+            self.listbox.insert(0, *(self.format_row(item) for item in visible))
+        for row, item in enumerate(visible):
+            if item in self.selected:
+                self.listbox.selection_set(row)
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.items)))
+        elif action == "scroll":
+            step = self._rows() if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def _on_wheel(self, event, step):
+        if step is None:
+            step = -3 if event.delta > 0 else 3
+        self.scroll_to(self.first + step)
+        return "break"
+
+    def _on_key(self, step):
+        self.scroll_to(self.first + step)
+        return "break"
+
+    def _on_select(self, event):
+        visible = self.items[self.first:self.first + self.listbox.size()]
+        chosen = set(self.listbox.curselection())
+        for row, item in enumerate(visible):
+            if row in chosen:
+                self.selected.add(item)
+            else:
+                self.selected.discard(item)
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.refresh()
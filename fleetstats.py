@@ -0,0 +1,369 @@
+import csv
+import heapq
+import os
+from functools import partial
+
+import numpy as np
+import xlsxwriter
+
+import report
+
+# Fixed splice-loss histogram bins (dB); values outside land in the first/last bin
+HIST_MIN, HIST_MAX, HIST_BIN = -1.0, 3.0, 0.05
+# Values kept per level of a quantile sketch; more is more accurate
+SKETCH_K = 512
+# Fibers kept in each ranking
+TOP_K = 25
+
+QUANTILES = [0.5, 0.9, 0.99]
+GROUPINGS = ["Fleet", "Cable", "Contractor"]
+
+SUMMARY_COLUMNS = [
+    "Group", "Name", "Shots", "Events", "Fiber_KM", "Events_per_KM", "Mean_Splice_Loss",
+    "P50_Splice_Loss", "P90_Splice_Loss", "P99_Splice_Loss", "Max_Splice_Loss",
+    "Pass", "Possible microbend", "Possible break",
+]
+RANKING_COLUMNS = ["Group", "Name", "Rank", "Cable", "Fiber_ID", "Direction", "Contractor",
+                   "Distance_KM", "Worst_Splice_Loss", "File"]
+
+class Histogram:
+    """
+    Counts of values in fixed bins; two histograms with the same bins merge by adding counts.
+    """
+
+    def __init__(self, low=HIST_MIN, high=HIST_MAX, width=HIST_BIN):
+        self.low, self.high, self.width = low, high, width
+        self.counts = np.zeros(int(round((high - low) / width)), dtype=np.int64)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        bins = np.clip(((values - self.low) / self.width).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def edges(self):
+        return self.low + np.arange(len(self.counts) + 1) * self.width
+
+class QuantileSketch:
+    """
+    A mergeable approximate quantile summary (a KLL-style compactor stack). Values are added
+    to level 0; a level holding more than k values is sorted and every other value moves up
+    a level with twice the weight, so memory stays around k per level, with one level per
+    doubling of the stream. Sketches from different workers merge level by level.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.levels = [np.zeros(0)]
+        self.count = 0
+        self.total = 0.0
+        self.maximum = -np.inf
+        self._offset = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.maximum = max(self.maximum, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.zeros(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.k:
+                values = np.sort(self.levels[level])
+                kept = values[len(values) - len(values) % 2:]  # an odd value out stays here
+                promoted = values[self._offset:len(values) - len(values) % 2:2]
+                self._offset ^= 1  # alternate which half is kept, so the error does not drift
+                self.levels[level] = kept
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs):
+        """
+        Returns the approximate value at each quantile in qs (NaN for an empty sketch).
+        """
+        if not self.count:
+            return [np.nan] * len(qs)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side="left")
+        return values[order][np.minimum(positions, len(values) - 1)].tolist()
+
+class TopK:
+    """
+    The k records with the highest scores, kept in a min-heap. Batches are pre-filtered
+    with argpartition so only candidates that can enter the heap are pushed.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.heap = []
+        self._seq = 0
+
+    def add(self, scores, records):
+        scores = np.asarray(scores, dtype=np.float64)
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if len(candidates) > self.k:
+            candidates = candidates[np.argpartition(-scores[candidates], self.k - 1)[:self.k]]
+        for i in candidates:
+            self._push(float(scores[i]), records[i])
+
+    def _push(self, score, record):
+        self._seq += 1
+        item = (score, -self._seq, record)  # earlier records win ties
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif score > self.heap[0][0]:
+            heapq.heapreplace(self.heap, item)
+
+    def merge(self, other):
+        for score, _, record in other.heap:
+            self._push(score, record)
+
+    def items(self):
+        """
+        Returns (score, record) pairs, highest score first.
+        """
+        return [(score, record) for score, _, record in sorted(self.heap, reverse=True)]
+
+class LossSummary:
+    """
+    Bounded-memory statistics of one group of shots: counts, fiber length, a splice-loss
+    histogram and quantile sketch, counts per tolerance class, and the worst and longest fibers.
+    """
+
+    def __init__(self):
+        self.shots = 0
+        self.fiber_km = 0.0
+        self.histogram = Histogram()
+        self.sketch = QuantileSketch()
+        self.classes = np.zeros(len(report.EVENT_COMMENTS), dtype=np.int64)
+        self.worst = TopK()
+        self.longest = TopK()
+
+    def add(self, distance_km, worst_loss, fibers, splice_loss, severity):
+        """
+        Adds a batch of shots (their Distance_KM, worst splice loss and fiber records) and
+        the splice loss and tolerance class of all their events.
+        """
+        self.shots += len(fibers)
+        self.fiber_km += float(np.nansum(distance_km))
+        self.histogram.add(splice_loss)
+        self.sketch.add(splice_loss)
+        self.classes += np.bincount(severity, minlength=len(self.classes))
+        self.worst.add(worst_loss, fibers)
+        self.longest.add(distance_km, fibers)
+
+    def merge(self, other):
+        self.shots += other.shots
+        self.fiber_km += other.fiber_km
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+        self.classes += other.classes
+        self.worst.merge(other.worst)
+        self.longest.merge(other.longest)
+
+class FleetStats:
+    """
+    LossSummary per (grouping, name): the whole fleet, every cable and every contractor
+    (the GenParams operator). Shots are added in batches and partial FleetStats, for example
+    from different workers, merge into one.
+    """
+
+    def __init__(self, pass_tolerance=0.3, warning_tolerance=0.6):
+        self.pass_tolerance = pass_tolerance
+        self.warning_tolerance = warning_tolerance
+        self.groups = {}
+
+    def add_shots(self, shots, events):
+        """
+        Adds shots given as a list of (cable, contractor, fiber ID, direction, Distance_KM,
+        file) and events as (shot position, splice loss) arrays.
+        """
+        if not shots:
+            return
+        shot_of_event, splice_loss = events
+        cables, contractors, _, _, distance_km, _ = (np.asarray(column, dtype=object) for column in zip(*shots))
+        distance_km = np.array([_number(value) for value in distance_km])
+        loss = np.nan_to_num(splice_loss, nan=0.0)
+        severity = np.select([loss > self.warning_tolerance, loss > self.pass_tolerance], [2, 1], default=0)
+        worst_loss = np.full(len(shots), np.nan)
+        if len(splice_loss):
+            np.fmax.at(worst_loss, shot_of_event, splice_loss)
+        fibers = [shot[:4] + (_cell(distance), shot[5], _cell(worst))
+                  for shot, distance, worst in zip(shots, distance_km, worst_loss)]
+
+        for grouping, names in (("Fleet", np.full(len(shots), "All", dtype=object)), ("Cable", cables),
+                                ("Contractor", contractors)):
+            names = np.array([str(name) if name not in (None, "") else "(none)" for name in names], dtype=object)
+            for name in np.unique(names):
+                in_group = names == name
+                event_mask = in_group[shot_of_event] if len(shot_of_event) else np.zeros(0, dtype=bool)
+                positions = np.flatnonzero(in_group)
+                summary = self.groups.setdefault((grouping, name), LossSummary())
+                summary.add(distance_km[positions], worst_loss[positions], [fibers[i] for i in positions],
+                            splice_loss[event_mask], severity[event_mask])
+
+    def merge(self, other):
+        for key, summary in other.groups.items():
+            if key in self.groups:
+                self.groups[key].merge(summary)
+            else:
+                self.groups[key] = summary
+
+    def _sorted_groups(self):
+        return sorted(self.groups.items(), key=lambda item: (GROUPINGS.index(item[0][0]), item[0][1]))
+
+    def summary_rows(self):
+        """
+        Yields one SUMMARY_COLUMNS row per group.
+        """
+        for (grouping, name), summary in self._sorted_groups():
+            count = summary.sketch.count
+            quantiles = summary.sketch.quantiles(QUANTILES)
+            yield [
+                grouping, name, summary.shots, count, round(summary.fiber_km, 3),
+                round(count / summary.fiber_km, 4) if summary.fiber_km > 0 else None,
+                round(summary.sketch.total / count, 4) if count else None,
+            ] + [_cell(value) for value in quantiles] + [_cell(summary.sketch.maximum if count else None)] + \
+                summary.classes.tolist()
+
+    def ranking_rows(self, ranking):
+        """
+        Yields RANKING_COLUMNS rows of the "worst" or "longest" fibers of every group.
+        """
+        for (grouping, name), summary in self._sorted_groups():
+            for rank, (_, fiber) in enumerate(getattr(summary, ranking).items(), start=1):
+                cable, contractor, fiber_id, direction, distance_km, file_path, worst = fiber
+                yield [grouping, name, rank, cable, fiber_id, direction, contractor, distance_km, worst, file_path]
+
+    def histogram_rows(self):
+        """
+        Yields one row per histogram bin: its lower edge and the count of every group.
+        """
+        groups = self._sorted_groups()
+        edges = Histogram().edges()
+        for i in range(len(edges) - 1):
+            yield [round(edges[i], 4)] + [int(summary.histogram.counts[i]) for _, summary in groups]
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _cell(value):
+    """
+    Rounds a statistic for the sheet; NaN and None become blank cells.
+    """
+    if value is None or value != value:
+        return None
+    return round(float(value), 4)
+
+def _stats_chunk(file_paths, pass_tolerance=0.3, warning_tolerance=0.6):
+    """
+    Builds the partial FleetStats of a chunk of dumps; runs inside a worker so only the
+    summary, not the events, travels back. Returns (file_path, None, error) for every file
+    that failed, followed by (None, stats, None).
+    """
+    results = []
+    shots, shot_of_event, splice_loss = [], [], []
+    for file_path in file_paths:
+        try:
+            json_data = report.load_dump(file_path)
+            (direction, fiber_id, _, distance_km, cable), event_rows = report.extract_shot(json_data)
+            contractor = json_data.get("GenParams", {}).get("operator", "")
+        except Exception as e:
+            results.append((file_path, None, {"file": file_path, "error": type(e).__name__, "message": str(e)}))
+            continue
+        shot_of_event.extend([len(shots)] * len(event_rows))
+        splice_loss.extend(_number(row[2]) for row in event_rows)
+        shots.append((cable, contractor, fiber_id, direction, distance_km, file_path))
+
+    stats = FleetStats(pass_tolerance, warning_tolerance)
+    stats.add_shots(shots, (np.array(shot_of_event, dtype=np.int64), np.array(splice_loss, dtype=np.float64)))
+    results.append((None, stats, None))
+    return results
+
+def collect_stats(file_paths, pass_tolerance=0.3, warning_tolerance=0.6, errors=None, workers=None):
+    """
+    Streams dumps through the fleet statistics: each chunk of files is summarised in a worker
+    and the partial summaries are merged as they arrive, so memory does not grow with the
+    number of shots. Files that fail are skipped; if errors is a list, a dict with the file,
+    error type and message is appended to it for each of them. Returns a FleetStats.
+    """
+    stats = FleetStats(pass_tolerance, warning_tolerance)
+    chunk = partial(_stats_chunk, pass_tolerance=pass_tolerance, warning_tolerance=warning_tolerance)
+    for file_path, partial_stats, error in report.extract_all(list(file_paths), workers, chunk):
+        if error:
+            if errors is not None:
+                errors.append(error)
+        elif partial_stats is not None:
+            stats.merge(partial_stats)
+    return stats
+
+def stats_path(report_path):
+    """
+    Returns the path of the statistics written next to a report: report-stats.xlsx (or .csv).
+    """
+    base, ext = os.path.splitext(report_path)
+    return base + "-stats" + (ext if ext.lower() == ".csv" else ".xlsx")
+
+def write_stats(stats, save_path):
+    """
+    Writes the statistics to .xlsx with Summary, Worst Fibers, Longest Fibers and Histogram
+    sheets, or only the summary table to .csv.
+    """
+    if save_path.lower().endswith(".csv"):
+        with open(save_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(SUMMARY_COLUMNS)
+            for row in stats.summary_rows():
+                writer.writerow(["" if value is None else value for value in row])
+        return
+
+    workbook = xlsxwriter.Workbook(save_path)
+    bold = workbook.add_format({'bold': True})
+    groups = [f"{grouping}: {name}" for (grouping, name), _ in stats._sorted_groups()]
+    sheets = [
+        ("Summary", SUMMARY_COLUMNS, stats.summary_rows()),
+        ("Worst Fibers", RANKING_COLUMNS, stats.ranking_rows("worst")),
+        ("Longest Fibers", RANKING_COLUMNS, stats.ranking_rows("longest")),
+        ("Histogram", ["Splice_Loss_From"] + groups, stats.histogram_rows()),
+    ]
+    for name, columns, rows in sheets:
+        worksheet = workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, columns, bold)
+        widths = [len(str(column)) for column in columns]
+        for row_number, row in enumerate(rows, start=1):
+            for col, value in enumerate(row):
+                if value is None or value == "":
+                    continue
+                worksheet.write(row_number, col, value)
+                widths[col] = max(widths[col], len(str(value)))
+        for col, width in enumerate(widths):
+            worksheet.set_column(col, col, min(width * 1.25, 60))
+        worksheet.freeze_panes(1, 0)
+    workbook.close()
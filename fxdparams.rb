@@ -23,6 +23,16 @@ module Fxdparams
     'RF' => "[reference]",
   };
   
+  # unpack directives for (type, size); anything else is kept as raw bytes
+  @@unpack_codes = \
+  {
+    ['v', 2] => 'S<',
+    ['v', 4] => 'L<',
+    ['i', 2] => 's<',
+    ['i', 4] => 'l<',
+    ['i', 8] => 'q<',
+  };
+  
   def self.process(fh, results, debug=false)
     
     if $logger == nil then
@@ -152,6 +162,11 @@ module Fxdparams
     # 'i': get_signed
     count = 0
     
+    # the fields are contiguous: decode them all with a single read and unpack
+    template = plist.map { |field| @@unpack_codes.fetch( [field[3], field[2]], "a%d" % field[2] ) }.join
+    nbytes = plist.map { |field| field[2] }.sum
+    values = fh.read( nbytes ).unpack( template )
+    
     plist.each do |field|
       name  = field[0]
       fsize = field[2]
@@ -160,12 +175,11 @@ module Fxdparams
       dgt   = field[5]
       unit  = field[6]
       xstr  = ""
+      val   = values[count]
       
       if ftype == 'i' then
-	val = Parts::get_signed(fh, fsize)
 	xstr = val
       elsif ftype == 'v' then
-	val = Parts::get_uint(fh, fsize)
 	if scale != '' then
 	  val *= scale
 	end
@@ -176,11 +190,8 @@ module Fxdparams
 	  xstr = val
 	end
       elsif ftype == 'h' then
-	xstr = Parts::get_hex(fh, fsize)
-      elsif ftype == 's' then
-	xstr = fh.read( fsize )
-      else
-	val = fh.read(fsize)
+	xstr = val.bytes.map { |b| "%02X " % b }.join
+      else # 's' and raw bytes
 	xstr = val
       end
       
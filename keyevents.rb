@@ -5,7 +5,9 @@ require 'parts'
 module Keyevents
   @@sep = "    :"
   
-  def self.process(fh, results, debug=false)
+  # compact: keep native numbers at full precision and the events
+  # as an array under 'events' instead of "event N" keys
+  def self.process(fh, results, debug=false, compact=false)
     
     if $logger == nil then
       $logger = Logger.new(STDOUT)
@@ -39,7 +41,7 @@ module Keyevents
     results[bname] = {}
     xref = results[bname]
     
-    status = Keyevents::_process_keyevents(fh, format, results, debug=debug)
+    status = Keyevents::_process_keyevents(fh, format, results, debug=debug, compact=compact)
     
     # read the rest of the block (just in case)
     endpos = (results['blocks'][bname][:pos].to_i) + (results['blocks'][bname][:size].to_i)
@@ -50,7 +52,7 @@ module Keyevents
   end
   
   # ================================================================
-  def self._process_keyevents(fh, format, results, debug=False)
+  def self._process_keyevents(fh, format, results, debug=false, compact=false)
     bname = "KeyEvents"
     xref  = results[bname]
     
@@ -63,17 +65,28 @@ module Keyevents
     
     pat = /(.)(.)9999LS/
     
+    # compact values are kept as numbers; otherwise formatted as "%.3f" strings
+    fmt = compact ? proc { |v| v } : proc { |v| "%.3f" % v }
+    if compact then
+      xref['events'] = []
+    end
+    
     1.upto(nev) do |j|
-      x2ref = xref[ ('event %d' % [j] )] = {};
-      
-      xid  = Parts::get_uint(fh, 2)             # 00-01: event number
-      dist = Parts::get_uint(fh, 4) * factor    # 02-05: time-of-travel; need to convert to distance
-      
-      slope  = Parts::get_signed(fh, 2) * 0.001 # 06-07: slope
-      splice = Parts::get_signed(fh, 2) * 0.001 # 08-09: splice loss
-      refl   = Parts::get_signed(fh, 4) * 0.001 # 10-13: reflection loss
+      x2ref = {}
+      if compact then
+        xref['events'] << x2ref
+      else
+        xref[ ('event %d' % [j] )] = x2ref
+      end
       
-      xtype = fh.read(8)                       # 14-21: event type
+      # fixed part of the event in one read and unpack
+      xid, dist, slope, splice, refl, xtype = fh.read(22).unpack('S<L<s<s<l<a8')
+      # 00-01: event number
+      dist   = dist * factor   # 02-05: time-of-travel; need to convert to distance
+      slope  = slope * 0.001   # 06-07: slope
+      splice = splice * 0.001  # 08-09: splice loss
+      refl   = refl * 0.001    # 10-13: reflection loss
+      # 14-21: event type
       
       if pat.match( xtype ) then
 	subtype = $1
@@ -99,28 +112,26 @@ module Keyevents
       end
       
       if format == 2 then
-        end_prev = Parts::get_uint(fh, 4) * factor    # 22-25: end of previous event
-	start_curr = Parts::get_uint(fh, 4) * factor    # 26-29: start of current event
-        end_curr   = Parts::get_uint(fh, 4) * factor    # 30-33: end of current event
-	start_next = Parts::get_uint(fh, 4) * factor    # 34-37: start of next event
-	pkpos      = Parts::get_uint(fh, 4) * factor    # 38-41: peak point of event
+        # 22-25: end of previous event, 26-29: start of current event,
+        # 30-33: end of current event, 34-37: start of next event, 38-41: peak point of event
+        end_prev, start_curr, end_curr, start_next, pkpos = fh.read(20).unpack('L<5').map { |v| v * factor }
       end
       
       comments = Parts::get_string(fh)
       
       x2ref['type'] = xtype
-      x2ref['distance'] = ("%.3f" % dist)
-      x2ref['slope'] = ("%.3f" % slope)
-      x2ref['splice loss'] = ("%.3f" % splice)
-      x2ref['refl loss'] = ("%.3f" % refl)
+      x2ref['distance'] = fmt.call(dist)
+      x2ref['slope'] = fmt.call(slope)
+      x2ref['splice loss'] = fmt.call(splice)
+      x2ref['refl loss'] = fmt.call(refl)
       x2ref['comments'] = comments
 
       if format == 2 then
-        x2ref['end of prev'] = ("%.3f" % end_prev)
-        x2ref['start of curr'] = ("%.3f" % start_curr)
-        x2ref['end of curr'] = ("%.3f" % end_curr)
-        x2ref['start of next'] = ("%.3f" % start_next)
-        x2ref['peak'] = ("%.3f" % pkpos)
+        x2ref['end of prev'] = fmt.call(end_prev)
+        x2ref['start of curr'] = fmt.call(start_curr)
+        x2ref['end of curr'] = fmt.call(end_curr)
+        x2ref['start of next'] = fmt.call(start_next)
+        x2ref['peak'] = fmt.call(pkpos)
       end
 
       if debug then
@@ -145,12 +156,13 @@ module Keyevents
     end
     
     # ...................................................
-    total      = Parts::get_signed(fh, 4) * 0.001  # 00-03: total loss
-    loss_start = Parts::get_signed(fh, 4) * factor # 04-07: loss start position
-    loss_finish= Parts::get_uint(fh, 4) * factor   # 08-11: loss finish position
-    orl        = Parts::get_uint(fh, 2) * 0.001    # 12-13: optical return loss (ORL)
-    orl_start  = Parts::get_signed(fh, 4) * factor # 14-17: ORL start position
-    orl_finish = Parts::get_uint(fh, 4) * factor   # 18-21: ORL finish position
+    total, loss_start, loss_finish, orl, orl_start, orl_finish = fh.read(22).unpack('l<l<L<S<l<L<')
+    total      = total * 0.001        # 00-03: total loss
+    loss_start = loss_start * factor  # 04-07: loss start position
+    loss_finish= loss_finish * factor # 08-11: loss finish position
+    orl        = orl * 0.001          # 12-13: optical return loss (ORL)
+    orl_start  = orl_start * factor   # 14-17: ORL start position
+    orl_finish = orl_finish * factor  # 18-21: ORL finish position
     
     if debug then
       $logger.info("%s Summary:" % @@sep)
@@ -163,12 +175,21 @@ module Keyevents
     end
     
     x3ref = xref["Summary"] = {}
-    x3ref["total loss"] = ( "%.3f" % total).to_f
-    x3ref["ORL"]        = ( "%.3f" % orl ).to_f
-    x3ref["loss start"] = ( "%.6f" % loss_start ).to_f
-    x3ref["loss end"]   = ( "%.6f" % loss_finish ).to_f
-    x3ref["ORL start"]  = ( "%.6f" % orl_start ).to_f
-    x3ref["ORL finish"] = ( "%.6f" % orl_finish ).to_f
+    if compact then
+      x3ref["total loss"] = total
+      x3ref["ORL"]        = orl
+      x3ref["loss start"] = loss_start
+      x3ref["loss end"]   = loss_finish
+      x3ref["ORL start"]  = orl_start
+      x3ref["ORL finish"] = orl_finish
+    else
+      x3ref["total loss"] = ( "%.3f" % total).to_f
+      x3ref["ORL"]        = ( "%.3f" % orl ).to_f
+      x3ref["loss start"] = ( "%.6f" % loss_start ).to_f
+      x3ref["loss end"]   = ( "%.6f" % loss_finish ).to_f
+      x3ref["ORL start"]  = ( "%.6f" % orl_start ).to_f
+      x3ref["ORL finish"] = ( "%.6f" % orl_finish ).to_f
+    end
     
     # ................
     status = 'ok'
@@ -0,0 +1,172 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+METRICS_NAME = "metrics.json"
+METRICS_VERSION = 1
+
+# Slowest files listed in the summary and kept in the metrics file
+SLOWEST_FILES = 10
+
+def peak_memory_mb(children=False):
+    """
+    Returns the peak resident memory in MB of this process, or with children=True of its
+    largest finished child process (for example a Ruby worker). None where unsupported.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+def metrics_path(report_path):
+    """
+    Returns the path of the metrics written next to a report: report-metrics.json.
+    """
+    return os.path.splitext(report_path)[0] + "-metrics.json"
+
+class Metrics:
+    """
+    Collects timings for one pipeline run: spans around stages, per-file records (latency,
+    bytes, events, errors) and counters. Safe to use from several threads. Written as a
+    JSON metrics file and summarised in a few lines at the end of the run.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        self.spans = {}     # name -> [count, total seconds, max seconds]
+        self.counters = {}
+        self.files = []     # per-file records
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """
+        Times the enclosed block as one occurrence of the named span.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_file(self, stage, path, seconds, bytes_read=None, events=None, error=None, **details):
+        """
+        Records one file processed by a stage, e.g. ("parse", path, 0.12, bytes_read=81234).
+        """
+        record = {"stage": stage, "file": path, "seconds": round(seconds, 6)}
+        if bytes_read is not None:
+            record["bytes"] = bytes_read
+        if events is not None:
+            record["events"] = events
+        if error:
+            record["error"] = error
+        record.update(details)
+        with self._lock:
+            self.files.append(record)
+
+    def slowest(self, stage=None, top=SLOWEST_FILES):
+        with self._lock:
+            records = [record for record in self.files if stage is None or record["stage"] == stage]
+        return sorted(records, key=lambda record: record["seconds"], reverse=True)[:top]
+
+    def to_dict(self):
+        with self._lock:
+            spans = {
+                name: {"count": count, "total": round(total, 6), "mean": round(total / count, 6),
+                       "max": round(longest, 6)}
+                for name, (count, total, longest) in self.spans.items()
+            }
+            counters = dict(self.counters)
+            files = list(self.files)
+        return {
+            "metrics_version": METRICS_VERSION,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.perf_counter() - self._clock, 6),
+            "peak_memory_mb": peak_memory_mb(),
+            "peak_child_memory_mb": peak_memory_mb(children=True),
+            "spans": spans,
+            "counters": counters,
+            "slowest": {stage: self.slowest(stage) for stage in sorted({record["stage"] for record in files})},
+            "files": files,
+        }
+
+    def write(self, path):
+        """
+        Writes the metrics file atomically and returns its path.
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp_path, path)
+        return path
+
+    def summary(self, top=5):
+        """
+        Returns a short text summary: wall time, peak memory (where the platform reports it),
+        each span and the slowest files.
+        """
+        data = self.to_dict()
+        line = f"Run took {data['wall_seconds']:.2f} s"
+        if data["peak_memory_mb"] is not None:
+            line += f", peak memory {data['peak_memory_mb']} MB"
+            if data["peak_child_memory_mb"]:
+                line += f" (largest child {data['peak_child_memory_mb']} MB)"
+        lines = [line]
+        for name, span in data["spans"].items():
+            line = f"  {name:<22} {span['total']:9.3f} s"
+            if span["count"] > 1:
+                line += f"  ({span['count']} x, mean {span['mean'] * 1000:.1f} ms, max {span['max'] * 1000:.1f} ms)"
+            lines.append(line)
+        if data["counters"]:
+            lines.append("  " + ", ".join(f"{name}: {value}" for name, value in data["counters"].items()))
+        for stage, records in data["slowest"].items():
+            if records:
+                lines.append(f"  Slowest {stage}:")
+                for record in records[:top]:
+                    size = f", {record['bytes'] / 1024:.0f} KB" if "bytes" in record else ""
+                    lines.append(f"    {record['seconds'] * 1000:8.1f} ms{size}  {record['file']}")
+        return "\n".join(lines)
+
+@contextmanager
+def profile(path=None):
+    """
+    Records a cProfile of the enclosed block into path (read it with pstats or snakeviz).
+    Does nothing when path is None, so callers can wrap a run unconditionally.
+
+    cProfile only sees the calling thread: time spent in the Ruby parse workers, the decode
+    processes and other threads shows up as waits on their results. Use the per-file
+    records of Metrics for those stages.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,196 @@
+import csv
+
+import numpy as np
+import pandas as pd
+
+from report import EVENT_COMMENTS, column_values
+from reportwriter import StreamingReportWriter
+
+# Events from opposite directions closer than this (km, after mirroring) are the same event
+DEFAULT_MATCH_TOLERANCE_KM = 0.05
+
+PAIR_COLUMNS = ["Cable", "Fiber_ID", "Direction", "A_Shot_ID", "B_Shot_ID", "Length_KM"]
+BIDIRECTIONAL_COLUMNS = [
+    "Cable", "Fiber_ID", "Direction", "Event_Distance",
+    "A_Event", "A_Splice_Loss", "B_Event", "B_Splice_Loss", "Bidirectional_Loss", "Comments",
+]
+
+def reverse_direction(direction):
+    """
+    Returns the opposite shot direction: "SiteA SiteB" becomes "SiteB SiteA".
+    Directions that are not two site tokens have no opposite and give None.
+    """
+    tokens = str(direction).split()
+    if len(tokens) != 2:
+        return None
+    return " ".join(reversed(tokens))
+
+def pair_shots(shots, events):
+    """
+    Matches every shot with the shot of the same cable and fiber taken from the other end,
+    using a hash index keyed by (cable, fiber ID, direction), so file order does not matter.
+    When a key occurs more than once (a fiber re-shot), the last shot wins.
+
+    Length_KM is the fiber length seen from the B end (its farthest event), used to mirror
+    B-end distances onto the A end. Returns one row per pair, in the order of the A shots.
+    """
+    cables = shots["Cable"] if "Cable" in shots.columns else pd.Series([""] * len(shots), index=shots.index)
+    index = {}
+    for shot_id, cable, fiber_id, direction in zip(shots["Shot_ID"], cables, shots["Fiber_ID"],
+                                                   shots["Shot_Direction"]):
+        index[(cable, fiber_id, direction)] = shot_id
+
+    lengths = events.groupby("Shot_ID")["Event_Distance"].max()
+    rows = []
+    for (cable, fiber_id, direction), shot_id in index.items():
+        reverse = reverse_direction(direction)
+        if reverse is None or direction > reverse:
+            continue  # each pair is listed once, from the direction that sorts first
+        other = index.get((cable, fiber_id, reverse))
+        if other is None:
+            continue
+        rows.append((cable, fiber_id, direction, shot_id, other, lengths.get(other, np.nan)))
+
+    pairs = pd.DataFrame(rows, columns=PAIR_COLUMNS)
+    pairs["A_Shot_ID"] = pairs["A_Shot_ID"].astype("int64")
+    pairs["B_Shot_ID"] = pairs["B_Shot_ID"].astype("int64")
+    pairs["Length_KM"] = pairs["Length_KM"].astype("float64")
+    return pairs
+
+def match_nearest(a_key, b_key, tolerance):
+    """
+    Matches each key of a_key to the nearest key of b_key within tolerance, using one sort
+    and a binary search. Each b key is used at most once; when several a keys claim it, the
+    closest one wins. Returns (matched_a, matched_b) arrays of positions into a_key and b_key.
+    """
+    b_order = np.argsort(b_key, kind="stable")
+    b_sorted = b_key[b_order]
+    if not len(b_sorted) or not len(a_key):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    pos = np.searchsorted(b_sorted, a_key)
+    left = np.clip(pos - 1, 0, len(b_sorted) - 1)
+    right = np.clip(pos, 0, len(b_sorted) - 1)
+    left_gap = np.abs(a_key - b_sorted[left])
+    right_gap = np.abs(b_sorted[right] - a_key)
+    nearest = np.where(right_gap < left_gap, right, left)
+    gap = np.minimum(left_gap, right_gap)
+    candidates = pd.DataFrame({"a": np.arange(len(a_key)), "b": b_order[nearest], "gap": gap})
+    candidates = candidates[candidates["gap"] <= tolerance]
+    candidates = candidates.sort_values("gap", kind="stable").drop_duplicates("b")
+    return candidates["a"].to_numpy(), candidates["b"].to_numpy()
+
+def _side_events(pairs, events, shot_column):
+    """
+    Selects the events of one side of every pair, tagged with the pair's row number.
+    """
+    pair_of_shot = pd.Series(np.arange(len(pairs)), index=pairs[shot_column].to_numpy())
+    side = events[events["Shot_ID"].isin(pair_of_shot.index)]
+    return pd.DataFrame({
+        "Pair": pair_of_shot.loc[side["Shot_ID"]].to_numpy(),
+        "Event": side["Event"].to_numpy(),
+        "Distance": side["Event_Distance"].to_numpy(dtype=np.float64),
+        "Splice_Loss": side["Splice_Loss"].to_numpy(dtype=np.float64),
+    })
+
+def align_events(pairs, events, tolerance_km=DEFAULT_MATCH_TOLERANCE_KM):
+    """
+    Aligns the events of both directions of every pair at once. B-end distances d are
+    mirrored onto the A end as Length_KM - d; each A event is matched to the nearest
+    mirrored B event of the same pair within tolerance_km, and each B event is used at
+    most once. Unmatched events from either side are kept with the other side empty.
+
+    Returns one row per aligned event with the pair's row number, the distance from the
+    A end, and the event name and splice loss from each side.
+    """
+    a_side = _side_events(pairs, events, "A_Shot_ID")
+    b_side = _side_events(pairs, events, "B_Shot_ID")
+    b_side["Distance"] = pairs["Length_KM"].to_numpy()[b_side["Pair"].to_numpy()] - b_side["Distance"].to_numpy()
+
+    # One sorted key space for all pairs: pairs are spaced further apart than any match
+    reach = np.nanmax(np.abs(np.concatenate([a_side["Distance"], b_side["Distance"], [0.0]])))
+    span = np.ceil(reach) + 2 * tolerance_km + 1
+    a_key = a_side["Pair"].to_numpy() * span + np.nan_to_num(a_side["Distance"].to_numpy())
+    b_key = b_side["Pair"].to_numpy() * span + np.nan_to_num(b_side["Distance"].to_numpy())
+    matched_a, matched_b = match_nearest(a_key, b_key, tolerance_km)
+
+    only_a = np.setdiff1d(np.arange(len(a_side)), matched_a)
+    only_b = np.setdiff1d(np.arange(len(b_side)), matched_b)
+
+    parts = []
+    for a_rows, b_rows in [(matched_a, matched_b), (only_a, None), (None, only_b)]:
+        anchor_side, anchor_rows = (a_side, a_rows) if a_rows is not None else (b_side, b_rows)
+        part = {
+            "Pair": anchor_side["Pair"].to_numpy()[anchor_rows],
+            "Event_Distance": anchor_side["Distance"].to_numpy()[anchor_rows],
+        }
+        for side, rows, prefix in [(a_side, a_rows, "A_"), (b_side, b_rows, "B_")]:
+            if rows is None:
+                part[prefix + "Event"] = np.full(len(anchor_rows), "", dtype=object)
+                part[prefix + "Splice_Loss"] = np.full(len(anchor_rows), np.nan)
+            else:
+                part[prefix + "Event"] = side["Event"].to_numpy()[rows]
+                part[prefix + "Splice_Loss"] = side["Splice_Loss"].to_numpy()[rows]
+        parts.append(pd.DataFrame(part))
+
+    aligned = pd.concat(parts, ignore_index=True)
+    return aligned.sort_values(["Pair", "Event_Distance"], kind="stable", ignore_index=True)
+
+def bidirectional_events(shots, events, tolerance_km=DEFAULT_MATCH_TOLERANCE_KM,
+                         pass_tolerance=None, warning_tolerance=None):
+    """
+    Pairs opposite-direction shots, aligns their events and computes the bidirectional
+    average splice loss, (A + B) / 2, for every matched event of every pair in one pass.
+    Events seen from only one end keep an empty average.
+
+    If both tolerances are given, the Comments column classifies the averaged loss with
+    the same Pass/microbend/break labels as the report.
+    Returns (pairs, table) DataFrames.
+    """
+    pairs = pair_shots(shots, events)
+    aligned = align_events(pairs, events, tolerance_km)
+
+    pair_rows = aligned["Pair"].to_numpy()
+    table = pd.DataFrame({
+        "Cable": pairs["Cable"].to_numpy()[pair_rows],
+        "Fiber_ID": pairs["Fiber_ID"].to_numpy()[pair_rows],
+        "Direction": pairs["Direction"].to_numpy()[pair_rows],
+        "Event_Distance": aligned["Event_Distance"],
+        "A_Event": aligned["A_Event"],
+        "A_Splice_Loss": aligned["A_Splice_Loss"],
+        "B_Event": aligned["B_Event"],
+        "B_Splice_Loss": aligned["B_Splice_Loss"],
+        "Bidirectional_Loss": (aligned["A_Splice_Loss"] + aligned["B_Splice_Loss"]) / 2.0,
+        "Comments": "",
+    })
+
+    if pass_tolerance is not None and warning_tolerance is not None:
+        average = table["Bidirectional_Loss"].to_numpy()
+        severity = np.select(
+            [average > warning_tolerance, average > pass_tolerance],  # Critical, Warning
+            [2, 1],
+            default=0  # Pass; one-sided events are left blank below
+        )
+        comments = np.asarray(EVENT_COMMENTS, dtype=object)[severity]
+        table["Comments"] = np.where(np.isnan(average), "", comments)
+
+    return pairs, table[BIDIRECTIONAL_COLUMNS]
+
+def write_bidirectional_report(table, save_path, split_by_cable=False):
+    """
+    Writes the bidirectional table to .csv, or streams it to .xlsx with the comment
+    colouring of the main report (one sheet per cable with split_by_cable).
+    """
+    rows = zip(*(column_values(table[column]) for column in BIDIRECTIONAL_COLUMNS))
+    if save_path.lower().endswith(".csv"):
+        with open(save_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(BIDIRECTIONAL_COLUMNS)
+            for row in rows:
+                writer.writerow(["" if value is None else value for value in row])
+        return
+
+    with StreamingReportWriter(save_path, BIDIRECTIONAL_COLUMNS, ["Comments"]) as writer:
+        for row in rows:
+            writer.write_row(row, group=row[0] if split_by_cable else None)
+        return writer.close()
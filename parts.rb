@@ -17,8 +17,14 @@ module Parts
     attr_reader :fh, :buffer, :cksum
     
     def digest
-      # return @@cksum.hexdigest
-      return @@cksum.crc
+      # the checksum covers every byte read since the last rewind, in the
+      # order read (blocks that were skipped are not included); computed
+      # once over the spans of the buffer instead of per read
+      crc = CRC.crc16_ccitt_false.new
+      @spans.each do |start, length|
+	crc.update(@buffer.byteslice(start, length))
+      end
+      return crc.crc
     end
     
     def initialize(filename)
@@ -26,46 +32,72 @@ module Parts
 	$logger = Logger.new(STDOUT)
       end
       
-      @fh0 = File.open(filename,"rb")
-      @buffer = ""
-      
-      # for calculating crc-sum
-      @@crc = CRC.crc16_ccitt_false.new
-      @@cksum = 0xFFFF # initial
+      # load the whole file in one read; blocks are decoded from the buffer
+      @buffer = File.binread(filename)
+      @pos = 0
+      @spans = [] # [start, length] of the bytes read, for the checksum
+    end
+    
+    def add_span(start, length)
+      # consecutive reads extend the last span
+      last = @spans[-1]
+      if last != nil and last[0] + last[1] == start then
+	last[1] += length
+      elsif length > 0 then
+	@spans.push([start, length])
+      end
     end
     
     def read(size)
-      buf = @fh0.read(size)
-      @@cksum = @@crc.update buf
+      if size < 0 then
+	raise ArgumentError, "negative length #{size} given"
+      end
+      buf = @buffer.byteslice(@pos, size)
+      if buf == nil or (buf.empty? and size > 0) then
+	# end of file, as with IO#read
+	return nil
+      end
+      add_span(@pos, buf.bytesize)
+      @pos += buf.bytesize
       return buf
     end
     
+    def get_string()
+      # up to (not including) the next '\0'; the terminator is consumed
+      stop = @buffer.index("\0", @pos)
+      if stop == nil then
+	stop = @buffer.bytesize
+      end
+      mystr = @buffer.byteslice(@pos, stop - @pos)
+      nextpos = [stop + 1, @buffer.bytesize].min
+      add_span(@pos, nextpos - @pos)
+      @pos = nextpos
+      return mystr
+    end
+    
     def seek(pos)
-      @fh0.seek(pos)
+      @pos = pos
       if pos == 0 then
-	# rewind occurred; reset
-	@@crc = CRC.crc16_ccitt_false.new
+	# rewind occurred; reset the checksum
+	@spans = []
       end
     end
     
     def tell()
-      return @fh0.tell()
+      return @pos
+    end
+    
+    def close()
+      @buffer = ""
+      @pos = 0
+      @spans = []
     end
   end
   
   # -------------------------------------------------
   def self.get_string(fh)
-    mystr = ""
-    byte = fh.read(1)
-    while byte != '' do
-      if byte.ord() == 0 then
-	break
-      end
-      mystr += byte
-      byte = fh.read(1)
-    end
-    
-    return mystr
+    # index search for the terminating '\0' instead of byte-at-a-time reads
+    return fh.get_string()
   end
   
   # -------------------------------------------------
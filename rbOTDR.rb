@@ -1,44 +1,138 @@
 #!/usr/bin/ruby
 require 'logger'
 require 'json' # Ensure JSON module is available
+require 'stringio'
 
 $:.push File.dirname(__FILE__)
 require 'read'
 require 'dump'
 
-# ============== main ===========================
-if __FILE__ == $0
-  if ARGV.length < 2 then
-    puts "USAGE: #{__FILE__} SOR-file output-directory"
-    exit
-  end
+# dump formats: 'pretty' (the default pretty-printed JSON), 'compact'
+# (minified single-line JSON with numeric KeyEvents in an array) and
+# 'compact-gz' (the same, gzipped, as -dump.json.gz)
+DUMP_FORMATS = ['pretty', 'compact', 'compact-gz']
 
-  otdrfile = ARGV[0]
-  output_dir = ARGV[1]
+# ---------------------------------------------
+# parse one SOR file and write its JSON dump into output_dir;
+# with binary_trace, also write the trace samples as -trace.bin;
+# returns the dump filename and the parse status
+def parse_sor(otdrfile, output_dir, binary_trace=false, dump_format='pretty')
+  unless DUMP_FORMATS.include?(dump_format)
+    raise ArgumentError, "unknown dump format '#{dump_format}'"
+  end
 
   # Ensure the output directory exists
   unless Dir.exist?(output_dir)
     Dir.mkdir(output_dir)
   end
 
-  $logger = Logger.new(STDOUT)
-  $logger.formatter = proc { |severity, datetime, progname, msg| "#{severity}: #{msg}\n" }
-
   sorparse = SORparse.new(otdrfile)
   results = {}
-  trace = []
+  trace = {}
 
   begin
-    sorparse.run(results, trace, debug=false)
+    compact = dump_format != 'pretty'
+    status = sorparse.run(results, trace, debug=false, compact=compact)
 
     # Write results to JSON file in the specified output directory
     resultsfile = File.join(output_dir, File.basename(otdrfile, ".*") + "-dump.json")
-    Dump::jsonfile(results, resultsfile)
+    if dump_format == 'compact-gz' then
+      resultsfile += ".gz"
+    end
+    if compact then
+      Dump::compactfile(results, resultsfile, dump_format == 'compact-gz')
+    else
+      Dump::jsonfile(results, resultsfile)
+    end
+
+    if binary_trace and trace.has_key?('samples') then
+      tracefile = File.join(output_dir, File.basename(otdrfile, ".*") + "-trace.bin")
+      Dump::binary_tracefile(trace, tracefile)
+    end
+  ensure
+    sorparse.close()
+  end
+
+  return resultsfile, status
+end
+
+# ---------------------------------------------
+# worker mode: read one request per line from stdin, either a bare
+# SOR file path or a JSON object {"file": ..., "output": ..., "trace": bool,
+# "format": one of DUMP_FORMATS},
+# and answer each with exactly one JSON line on stdout; the reply
+# carries the parse time in seconds and the size of the SOR file
+def worker(output_dir, binary_trace=false, dump_format='pretty')
+  $stdout.sync = true
+
+  STDIN.each_line { |line|
+    line = line.strip
+    if line.empty? then
+      next
+    end
+
+    otdrfile = line
+    dir = output_dir
+    want_trace = binary_trace
+    want_format = dump_format
+    log = StringIO.new
+    $logger = Logger.new(log)
+    $logger.formatter = proc { |severity, datetime, progname, msg| "#{severity}: #{msg}\n" }
+
+    started = Process.clock_gettime(Process::CLOCK_MONOTONIC)
+    begin
+      if line.start_with?('{') then
+        request = JSON.parse(line)
+        otdrfile = request['file']
+        dir = request['output'] || output_dir
+        want_trace = request.fetch('trace', binary_trace)
+        want_format = request.fetch('format', dump_format)
+      end
 
-    # Comment out trace file generation
-    # tracefile = File.join(output_dir, File.basename(otdrfile, ".*") + "-trace.dat")
-    # Dump::tracefile(trace, tracefile)
+      resultsfile, status = parse_sor(otdrfile, dir, want_trace, want_format)
+      reply = { 'file' => otdrfile, 'status' => 'ok', 'output' => resultsfile, 'parse status' => status }
+    rescue SystemExit, StandardError => e
+      # abort() in the block modules raises SystemExit; keep the worker alive
+      reply = { 'file' => otdrfile, 'status' => 'error', 'error' => e.message, 'log' => log.string }
+    end
+    reply['seconds'] = Process.clock_gettime(Process::CLOCK_MONOTONIC) - started
+    reply['bytes'] = File.size?(otdrfile.to_s)
 
+    puts reply.to_json
+  }
+end
+
+# ============== main ===========================
+if __FILE__ == $0
+  # --trace: also write the trace as little-endian float32 (-trace.bin)
+  binary_trace = ARGV.delete('--trace') != nil
+  # --compact / --compact-gz: compact dump instead of pretty-printed JSON
+  dump_format = 'pretty'
+  if ARGV.delete('--compact-gz') then
+    dump_format = 'compact-gz'
+  elsif ARGV.delete('--compact') then
+    dump_format = 'compact'
+  end
+  
+  if ARGV.length < 2 then
+    puts "USAGE: #{__FILE__} [--trace] [--compact|--compact-gz] SOR-file output-directory"
+    puts "       #{__FILE__} [--trace] [--compact|--compact-gz] --worker output-directory"
+    exit
+  end
+
+  if ARGV[0] == '--worker' then
+    worker(ARGV[1], binary_trace, dump_format)
+    exit
+  end
+
+  otdrfile = ARGV[0]
+  output_dir = ARGV[1]
+
+  $logger = Logger.new(STDOUT)
+  $logger.formatter = proc { |severity, datetime, progname, msg| "#{severity}: #{msg}\n" }
+
+  begin
+    parse_sor(otdrfile, output_dir, binary_trace, dump_format)
   rescue => e
     $logger.error("Error processing file: #{e.message}")
     exit(1)
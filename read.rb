@@ -32,10 +32,18 @@ class SORparse
     # $logger.info "* init done"
   end
   
+  # ---------------------------------------------
+  # release the file handle now instead of waiting for the finalizer
+  def close()
+    @fh.close()
+  end
+  
   # ---------------------------------------------
   # process the SOR file; results go into the results hash,
-  # trace data go into the array trace[]
-  def run(results,trace, debug=false)
+  # trace data go into the array trace[] as "distance<TAB>dB" strings,
+  # or, if trace is a Hash, as numeric samples (see Datapts);
+  # compact keeps the KeyEvents as numbers in an array (see Keyevents)
+  def run(results,trace, debug=false, compact=false)
     # trace[0] = 123
     results['filename'] = File.basename @filename
     status = mapblock(@fh,results,debug=debug)
@@ -65,7 +73,7 @@ class SORparse
       elsif bname == 'DataPts' then
 	status = Datapts::process(fh, results, trace, debug=debug)
       elsif bname == 'KeyEvents' then
-	status = Keyevents::process(fh, results, debug=debug)
+	status = Keyevents::process(fh, results, debug=debug, compact=compact)
       elsif bname == 'Cksum' then
 	status = Cksum::process(fh, results, debug=debug)
       else
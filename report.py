@@ -0,0 +1,423 @@
+import csv
+import gzip
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import traceanalysis
+import traces
+from reportwriter import StreamingReportWriter
+
+try:
+    import orjson  # optional, much faster decoding
+except ImportError:
+    orjson = None
+
+SHOT_COLUMNS = ["Shot_Direction", "Fiber_ID", "Range", "Distance_KM"]
+# Shot table columns kept for grouping and lookups but not shown in the report layouts
+SHOT_KEYS = ["Cable", "File"]
+EVENT_COLUMNS = ["Event", "Event_Distance", "Splice_Loss", "Refl_Loss", "Comments"]
+
+# File name endings of the dumps rbOTDR.rb writes: JSON (pretty or compact) and gzipped compact JSON
+DUMP_SUFFIXES = ("-dump.json", "-dump.json.gz")
+
+# Top-level dump sections the report reads; everything else is dropped right after decoding
+INGEST_SECTIONS = ("filename", "GenParams", "FxdParams", "KeyEvents")
+
+# Batches smaller than this are decoded in-process; larger ones are split into chunks
+PARALLEL_MIN_FILES = 64
+INGEST_CHUNK_SIZE = 64
+
+# Shots converted to Python values at a time while streaming report rows
+REPORT_CHUNK_SHOTS = 2048
+
+# Classification labels, in increasing order of severity
+EVENT_COMMENTS = ["Pass", "Possible microbend", "Possible break"]
+SHOT_COMMENTS = ["Pass", "Warnings detected (Possible microbend)", "Critical issues detected (Possible break)"]
+
+def find_dump_files(folder):
+    """
+    Walks a folder and returns the paths of all -dump.json (and -dump.json.gz) files written
+    by rbOTDR.rb, sorted.
+    """
+    dump_files = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.endswith(DUMP_SUFFIXES):
+                dump_files.append(os.path.join(root, file))
+    dump_files.sort()
+    return dump_files
+
+def load_dump(file_path):
+    """
+    Reads and decodes one -dump.json file, keeping only the sections the report needs.
+    Gzipped (-dump.json.gz) dumps are decompressed first.
+    Uses orjson when it is installed and the standard library otherwise.
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if file_path.endswith(".gz"):
+        data = gzip.decompress(data)
+    json_data = orjson.loads(data) if orjson else json.loads(data)
+    return {key: json_data[key] for key in INGEST_SECTIONS if key in json_data}
+
+def key_events(json_data):
+    """
+    Returns the KeyEvents of a decoded dump as (name, info) pairs named "event N", from either
+    the default layout ("event N" keys, values as strings) or the compact one (an "events"
+    array with numeric values).
+    """
+    key_events = json_data.get("KeyEvents", {})
+    if "events" in key_events:
+        return [(f"event {number}", info) for number, info in enumerate(key_events["events"], start=1)]
+    return [(key, info) for key, info in key_events.items() if key.startswith("event")]
+
+def extract_shot(json_data):
+    """
+    Extracts one shot from a decoded dump.
+    Returns the shot row (Shot_Direction, Fiber_ID, Range, Distance_KM, Cable) and a list of
+    event rows (Event, Event_Distance, Splice_Loss, Refl_Loss, Comments).
+    """
+    # Extract shot direction and fiber ID from filename
+    filename = json_data.get("filename", "")
+    shot_direction = " ".join(filename.split(" ")[:2])  # First two parts of the filename
+    fiber_id = re.search(r"\s(\d{3})\s", filename)
+    fiber_id = fiber_id.group(1) if fiber_id else ""
+
+    # Extract fields from JSON
+    cable = json_data.get("GenParams", {}).get("cable ID", "")
+    distance_km = json_data.get("GenParams", {}).get("distance_km", "")
+    range_value = json_data.get("FxdParams", {}).get("range", "")  # Extract range value
+
+    # Get all events
+    event_rows = [
+        (
+            event_key,
+            float(event_info.get("distance", 0)),
+            event_info.get("splice loss", ""),
+            event_info.get("refl loss", ""),
+            event_info.get("comments", ""),
+        )
+        for event_key, event_info in key_events(json_data)
+    ]
+
+    # Total shot distance (highest distance found in the events)
+    distance_km = max((row[1] for row in event_rows), default=0) if not distance_km else distance_km
+
+    # Range will be on the left side, alongside Fiber_ID
+    return (shot_direction, fiber_id, range_value, distance_km, cable), event_rows
+
+def _extract_chunk(file_paths, timed=False):
+    """
+    Loads and extracts a chunk of files; runs inside an ingestion worker.
+    Returns (file_path, extracted, error) per file, in order; timed=True appends the
+    decode time in seconds and the file size in bytes to each result.
+    """
+    results = []
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            result = (file_path, extract_shot(load_dump(file_path)), None)
+        except Exception as e:
+            result = (file_path, None, {"file": file_path, "error": type(e).__name__, "message": str(e)})
+        if timed:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                size = None
+            result += (time.perf_counter() - start, size)
+        results.append(result)
+    return results
+
+def extract_all(file_paths, workers, extract_chunk=_extract_chunk):
+    """
+    Yields the per-file results of extract_chunk (by default _extract_chunk) in file order,
+    decoding across worker processes when the batch is large enough to be worth it.
+    extract_chunk must be a module-level function so it can be sent to the workers; it is
+    called with lists of file_paths, which may be any picklable items (see compare.py).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(file_paths) < PARALLEL_MIN_FILES:
+        yield from extract_chunk(file_paths)
+        return
+
+    chunk_size = max(1, min(INGEST_CHUNK_SIZE, len(file_paths) // (workers * 4) or 1))
+    chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(extract_chunk, chunks):
+                done += 1
+                yield from results
+    except (OSError, BrokenProcessPool):
+        # Process pools are unavailable in some frozen or sandboxed environments, and a pool
+        # can break partway through; decode only the chunks not yielded yet
+        for chunk in chunks[done:]:
+            yield from extract_chunk(chunk)
+
+def process_json_and_extract(file_paths, errors=None, workers=None, metrics=None):
+    """
+    Processes JSON files into the tables behind both the stacked and wide report formats:
+    a shot table with one row per file, and a long-form event table with one row per
+    KeyEvent, linked by Shot_ID. Numeric event columns are typed as float64.
+
+    Files are read and decoded concurrently across worker processes. Files that fail are
+    skipped; if errors is a list, a dict with the file, error type and message is appended
+    to it for each of them. metrics, if given, gets a "decode" record per file.
+    Returns (shots, events) as DataFrames.
+    """
+    def extracted():
+        if metrics is None:
+            results = extract_all(list(file_paths), workers)
+        else:
+            results = record_decodes(extract_all(list(file_paths), workers, partial(_extract_chunk, timed=True)),
+                                     metrics)
+        for file_path, shot, error in results:
+            if error:
+                if errors is not None:
+                    errors.append(error)
+                continue
+            yield file_path, shot
+
+    return tables_from_extracted(extracted())
+
+def record_decodes(results, metrics):
+    """
+    Passes timed _extract_chunk results through as (file_path, extracted, error),
+    recording each file's decode time, size and event count in metrics.
+    """
+    for file_path, shot, error, seconds, size in results:
+        metrics.record_file("decode", file_path, seconds, bytes_read=size,
+                            events=len(shot[1]) if shot else None, error=error and error["message"])
+        yield file_path, shot, error
+
+def tables_from_extracted(extracted):
+    """
+    Builds the (shots, events) DataFrames from (file_path, (shot_row, event_rows)) pairs
+    as returned by extract_shot, numbering shots in the order given.
+    """
+    shot_columns = {name: [] for name in ["Shot_ID"] + SHOT_COLUMNS + SHOT_KEYS}
+    event_columns = {name: [] for name in ["Shot_ID", "Event_Number"] + EVENT_COLUMNS}
+
+    for file_path, (shot_row, event_rows) in extracted:
+        shot_id = len(shot_columns["Shot_ID"])
+        shot_columns["Shot_ID"].append(shot_id)
+        for column, value in zip(SHOT_COLUMNS + SHOT_KEYS, tuple(shot_row) + (file_path,)):
+            shot_columns[column].append(value)
+
+        event_columns["Shot_ID"].extend([shot_id] * len(event_rows))
+        event_columns["Event_Number"].extend(range(1, len(event_rows) + 1))
+        for column, values in zip(EVENT_COLUMNS, zip(*event_rows)):
+            event_columns[column].extend(values)
+
+    return shots_and_events(shot_columns, event_columns)
+
+def shots_and_events(shot_columns, event_columns):
+    """
+    Builds the typed shot and event DataFrames from dicts of column lists.
+    """
+    shots = pd.DataFrame(shot_columns)
+    events = pd.DataFrame(event_columns)
+    events["Shot_ID"] = events["Shot_ID"].astype("int64")
+    events["Event_Number"] = events["Event_Number"].astype("int64")
+    for column in ["Event_Distance", "Splice_Loss", "Refl_Loss"]:
+        events[column] = pd.to_numeric(events[column], errors="coerce").astype("float64")
+    return shots, events
+
+def dump_trace_path(file_path):
+    """
+    Returns the path of the -trace.bin that rbOTDR.rb --trace writes next to a -dump.json.
+    """
+    return re.sub(r"-dump\.json(\.gz)?$", "", file_path) + "-trace.bin"
+
+def _leading_number(value):
+    """
+    Returns the number at the start of a dump value such as "100 ns" or "-80.00 dB", or NaN.
+    """
+    try:
+        return float(str(value).split()[0])
+    except (IndexError, ValueError):
+        return np.nan
+
+def reflectance_params(file_path):
+    """
+    Returns (backscatter coefficient in dB, pulse width in ns) from the FxdParams of a dump,
+    with NaN for values that are missing or when the dump cannot be read.
+    """
+    try:
+        fxd_params = load_dump(file_path).get("FxdParams", {})
+    except Exception:
+        return np.nan, np.nan
+    return _leading_number(fxd_params.get("BC")), _leading_number(fxd_params.get("pulse width"))
+
+def trace_events(shots, events, mode="trace", **analysis_options):
+    """
+    Runs the trace analysis over the binary traces of the shots that have one and merges
+    its events into the event table: mode "trace" replaces the KeyEvents of those shots,
+    "both" keeps them and adds the trace events after them. Shots without a trace keep
+    their KeyEvents. Events are renumbered per shot. The backscatter coefficient and pulse
+    width of each traced shot are read from its dump's FxdParams to estimate reflectances.
+    Returns (events, summary) where summary has the fiber end and attenuation per shot.
+    """
+    shot_ids, loaded, backscatter_db, pulse_width_ns = [], [], [], []
+    for shot_id, file_path in zip(shots["Shot_ID"], shots["File"]):
+        trace_path = dump_trace_path(file_path)
+        if os.path.exists(trace_path):
+            shot_ids.append(shot_id)
+            loaded.append(traces.load_trace(trace_path))
+            backscatter, pulse_width = reflectance_params(file_path)
+            backscatter_db.append(backscatter)
+            pulse_width_ns.append(pulse_width)
+    if not loaded:
+        return events, pd.DataFrame(columns=["Shot_ID", "Fiber_End_KM", "Attenuation_dB_km", "Noise_Floor_dB"])
+
+    analysis_options.setdefault("backscatter_db", backscatter_db)
+    analysis_options.setdefault("pulse_width_ns", pulse_width_ns)
+    found, _, summary = traceanalysis.analyze_traces(loaded, shot_ids=shot_ids, **analysis_options)
+    if mode == "trace":
+        events = events[~events["Shot_ID"].isin(shot_ids)]
+    events = pd.concat([events, found[["Shot_ID", "Event_Number"] + EVENT_COLUMNS]], ignore_index=True)
+    events = events.sort_values("Shot_ID", kind="stable", ignore_index=True)
+    events["Event_Number"] = events.groupby("Shot_ID").cumcount().astype("int64") + 1
+    return events, summary
+
+def classify_events(shots, events, pass_tolerance, warning_tolerance):
+    """
+    Classifies every event by splice loss against the tolerances in one vectorized pass,
+    and consolidates an overall comment per shot direction from its worst event.
+    The Comments columns of both tables are updated in place.
+    """
+    splice_loss = events["Splice_Loss"].fillna(0).to_numpy()
+    severity = np.select(
+        [splice_loss > warning_tolerance, splice_loss > pass_tolerance],  # Critical, Warning
+        [2, 1],
+        default=0  # Pass
+    )
+    events["Comments"] = np.asarray(EVENT_COMMENTS, dtype=object)[severity]
+
+    worst = pd.Series(severity, index=events.index).groupby(events["Shot_ID"]).max()
+    worst = shots["Shot_ID"].map(worst).fillna(0).astype("int64").to_numpy()
+    shots["Comments"] = np.asarray(SHOT_COMMENTS, dtype=object)[worst]
+
+    return shots, events
+
+def column_values(series):
+    """
+    Converts a column to a list of Python values with NaN as None, for writing cells.
+    """
+    values = series.to_numpy(dtype=object)
+    return [None if isinstance(value, float) and value != value else value for value in values]
+
+def iter_report_rows(shots, events, wide=False, by_cable=False, chunk_shots=REPORT_CHUNK_SHOTS):
+    """
+    Yields (group, row) for every row of the wide or stacked layout straight from the
+    shot and event tables, converting only chunk_shots shots at a time to Python values.
+    group is the shot's cable ID when by_cable is set and None otherwise.
+    The stacked layout includes the blank separator rows between Fiber IDs of a group.
+    In the wide layout, event N always fills the Event_N columns (see report_columns), so
+    events missing from a shot leave their columns blank.
+    """
+    order = np.lexsort((events["Event_Number"].to_numpy(), events["Shot_ID"].to_numpy()))
+    sorted_events = events.iloc[order]
+    sorted_ids = sorted_events["Shot_ID"].to_numpy()
+    shot_ids = shots["Shot_ID"].to_numpy()
+    starts = np.searchsorted(sorted_ids, shot_ids, side="left")
+    ends = np.searchsorted(sorted_ids, shot_ids, side="right")
+    cables = shots["Cable"] if "Cable" in shots.columns else pd.Series([None] * len(shots))
+    blank = [""] * (len(SHOT_COLUMNS) + len(EVENT_COLUMNS))
+    last_fiber_ids = {}
+
+    for start in range(0, len(shots), chunk_shots):
+        stop = min(start + chunk_shots, len(shots))
+        shot_rows = list(zip(*(column_values(shots[column].iloc[start:stop]) for column in SHOT_COLUMNS)))
+        shot_cables = cables.iloc[start:stop].tolist()
+
+        # Gather this chunk's events in shot order, remembering where each shot's events end
+        counts = ends[start:stop] - starts[start:stop]
+        ranges = [np.arange(first, last) for first, last in zip(starts[start:stop], ends[start:stop])]
+        chunk = sorted_events.iloc[np.concatenate(ranges).astype("int64")]
+        event_rows = list(zip(*(column_values(chunk[column]) for column in EVENT_COLUMNS)))
+        event_numbers = chunk["Event_Number"].tolist()
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        for offset, (shot_row, cable) in enumerate(zip(shot_rows, shot_cables)):
+            group = (cable or "No cable ID") if by_cable else None
+            rows = event_rows[offsets[offset]:offsets[offset + 1]]
+            if wide:
+                row = list(shot_row)
+                numbers = event_numbers[offsets[offset]:offsets[offset + 1]]
+                for number, event_row in zip(numbers, rows):
+                    row.extend([None] * (len(SHOT_COLUMNS) + (number - 1) * len(EVENT_COLUMNS) - len(row)))
+                    row.extend(event_row)
+                yield group, row
+                continue
+
+            # If fiber ID changes, add a blank row to separate fibers
+            fiber_id = shot_row[1]
+            last_fiber_id = last_fiber_ids.get(group)
+            if fiber_id != last_fiber_id:
+                if group in last_fiber_ids:  # Skip the blank row before the first fiber
+                    yield group, blank
+                last_fiber_ids[group] = fiber_id
+            for event_row in rows:
+                yield group, list(shot_row) + list(event_row)
+
+def report_columns(events, wide=False):
+    """
+    Returns the column names of the wide or stacked layout for an event table. The wide
+    layout has Event_1 to Event_N columns for the highest Event_Number N.
+    """
+    if not wide:
+        return SHOT_COLUMNS + EVENT_COLUMNS
+    max_events = int(events["Event_Number"].max()) if not events.empty else 0
+    columns = list(SHOT_COLUMNS)
+    for n in range(1, max_events + 1):
+        columns += [f"Event_{n}", f"Event_{n}_Distance", f"Event_{n}_Splice_Loss",
+                    f"Event_{n}_Refl_Loss", f"Event_{n}_Comments"]
+    return columns
+
+def _report_span(metrics):
+    return metrics.span("write report") if metrics is not None else nullcontext()
+
+def write_xlsx_report(shots, events, save_path, wide=False, split_by_cable=False, metrics=None):
+    """
+    Streams the report to an Excel file with sized columns and conditional formatting on
+    the comment columns. With split_by_cable, each cable gets its own sheet(s).
+    Returns the names of the worksheets written. metrics, if given, gets a "write report"
+    span and a "report rows" count.
+    """
+    with _report_span(metrics):
+        columns = report_columns(events, wide)
+        comment_columns = [column for column in columns if column.endswith("Comments")]
+        with StreamingReportWriter(save_path, columns, comment_columns, key_columns=len(SHOT_COLUMNS)) as writer:
+            rows = 0
+            for group, row in iter_report_rows(shots, events, wide, by_cable=split_by_cable):
+                writer.write_row(row, group=group)
+                rows += 1
+            if metrics is not None:
+                metrics.count("report rows", rows)
+            return writer.close()
+
+def write_csv_report(shots, events, save_path, wide=False, metrics=None):
+    """
+    Streams the report to a CSV file. metrics is as for write_xlsx_report.
+    """
+    with _report_span(metrics):
+        columns = report_columns(events, wide)
+        with open(save_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            rows = 0
+            for _, row in iter_report_rows(shots, events, wide):
+                writer.writerow(["" if value is None else value for value in row])
+                rows += 1
+        if metrics is not None:
+            metrics.count("report rows", rows)
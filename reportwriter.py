@@ -0,0 +1,155 @@
+import re
+
+import xlsxwriter
+from xlsxwriter.utility import xl_range
+
+# Excel worksheet limits
+MAX_ROWS = 1048576
+MAX_COLS = 16384
+
+# Conditional formats applied to the comment columns: (text, format). Earlier rules win,
+# so a comment such as "Pass; New event" takes the colour of its most severe label.
+COMMENT_FORMATS = [
+    ("Possible break", {'bg_color': '#FF0000', 'align': 'left', 'bold': True}),  # Red
+    ("New event", {'bg_color': '#FF0000', 'align': 'left', 'bold': True}),  # Red, baseline comparison
+    ("Possible microbend", {'bg_color': '#FFA500', 'align': 'left', 'bold': True}),  # Orange
+    ("Grown event", {'bg_color': '#FFA500', 'align': 'left', 'bold': True}),  # Orange, baseline comparison
+    ("Pass", {'bg_color': '#D9EAD3', 'align': 'left', 'bold': True}),  # Green
+]
+
+class StreamingReportWriter:
+    """
+    Writes a report to XLSX one row at a time using xlsxwriter's constant-memory mode,
+    so memory use does not grow with the number of rows.
+
+    Column widths are tracked as rows are written and applied when the workbook is closed,
+    and the comment columns get one conditional format range rule per label covering the
+    whole column block. A sheet that reaches the Excel row limit continues on a new sheet;
+    rows wider than the column limit are split across sheets that repeat the first
+    key_columns columns. Rows written with a group (for example, a cable ID) go to that
+    group's own sheets.
+    """
+
+    def __init__(self, save_path, columns, comment_columns=(), key_columns=0,
+                 max_rows=MAX_ROWS, max_cols=MAX_COLS):
+        self.workbook = xlsxwriter.Workbook(save_path, {'constant_memory': True})
+        self.columns = list(columns)
+        self.comment_columns = set(comment_columns)
+        self.max_rows = max_rows
+        self.left_format = self.workbook.add_format({'align': 'left'})
+        self.comment_formats = [(text, self.workbook.add_format(fmt)) for text, fmt in COMMENT_FORMATS]
+        self.sheet_names = set()
+        self.sheets = {}  # (group, column block) -> current sheet state
+        self.finished = []
+        self.closed = False
+
+        # Split the columns into blocks that each fit on one sheet
+        if len(self.columns) <= max_cols:
+            self.blocks = [list(range(len(self.columns)))]
+        else:
+            keys = list(range(key_columns))
+            per_block = max_cols - key_columns
+            rest = range(key_columns, len(self.columns))
+            self.blocks = [keys + list(rest[i:i + per_block]) for i in range(0, len(rest), per_block)]
+
+    def _sheet_name(self, group, block, part):
+        """
+        Builds a unique, valid worksheet name for a group, column block and continuation part.
+        """
+        base = re.sub(r"[\[\]:*?/\\]", "_", str(group)) if group is not None else "Sheet1"
+        suffix = ""
+        if block:
+            suffix += f" c{block + 1}"
+        if part:
+            suffix += f" ({part + 1})"
+        name = base[:31 - len(suffix)] + suffix
+        counter = 2
+        while name.lower() in self.sheet_names:
+            tag = f"~{counter}"
+            name = base[:31 - len(suffix) - len(tag)] + tag + suffix
+            counter += 1
+        self.sheet_names.add(name.lower())
+        return name
+
+    def _new_sheet(self, group, block, part):
+        """
+        Adds a worksheet with the header row for a column block.
+        """
+        indices = self.blocks[block]
+        worksheet = self.workbook.add_worksheet(self._sheet_name(group, block, part))
+        header = [self.columns[i] for i in indices]
+        worksheet.write_row(0, 0, header)
+        return {
+            "worksheet": worksheet,
+            "indices": indices,
+            "part": part,
+            "row": 1,
+            "widths": [len(name) for name in header],
+            "comments": [pos for pos, i in enumerate(indices) if self.columns[i] in self.comment_columns],
+        }
+
+    def write_row(self, values, group=None):
+        """
+        Writes one report row. None and empty strings are left blank.
+        """
+        for block in range(len(self.blocks)):
+            key = (group, block)
+            sheet = self.sheets.get(key)
+            if sheet is None:
+                sheet = self.sheets[key] = self._new_sheet(group, block, 0)
+            elif sheet["row"] >= self.max_rows:
+                self._finish(sheet)
+                sheet = self.sheets[key] = self._new_sheet(group, block, sheet["part"] + 1)
+
+            worksheet = sheet["worksheet"]
+            widths = sheet["widths"]
+            row = sheet["row"]
+            for col, i in enumerate(sheet["indices"]):
+                value = values[i] if i < len(values) else None
+                if value is None or value == "":
+                    continue
+                worksheet.write(row, col, value)
+                length = len(str(value))
+                if length > widths[col]:
+                    widths[col] = length
+            sheet["row"] = row + 1
+
+    def _finish(self, sheet):
+        """
+        Applies the tracked column widths and the comment column range rules to a sheet.
+        """
+        worksheet = sheet["worksheet"]
+        for col, width in enumerate(sheet["widths"]):
+            worksheet.set_column(col, col, width * 1.25, self.left_format)
+
+        last_row = sheet["row"] - 1
+        if sheet["comments"] and last_row >= 1:
+            ranges = [xl_range(1, col, last_row, col) for col in sheet["comments"]]
+            first = sheet["comments"][0]
+            for text, cell_format in self.comment_formats:
+                worksheet.conditional_format(
+                    1, first, last_row, first,  # First data row to last data row
+                    {'type': 'text', 'criteria': 'containing', 'value': text, 'format': cell_format,
+                     'multi_range': " ".join(ranges)}
+                )
+        self.finished.append(worksheet.get_name())
+
+    def close(self):
+        """
+        Finishes every open sheet and writes the workbook.
+        Returns the names of the worksheets written.
+        """
+        if not self.sheets:
+            self.sheets[(None, 0)] = self._new_sheet(None, 0, 0)
+        for sheet in self.sheets.values():
+            self._finish(sheet)
+        self.workbook.close()
+        self.closed = True
+        return self.finished
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.closed:
+            self.close()
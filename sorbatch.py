@@ -0,0 +1,519 @@
+import glob
+import hashlib
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+MANIFEST_NAME = "sor_manifest.json"
+MANIFEST_VERSION = 1
+
+# Dump formats written by rbOTDR.rb: pretty-printed JSON (the default), compact single-line
+# JSON with numeric KeyEvents in an array, and the compact dump gzipped as -dump.json.gz
+DUMP_FORMATS = ("pretty", "compact", "compact-gz")
+
+# Returned by parse_sor_batch's workers for files skipped after a cancel
+CANCELLED = object()
+
+
+class RubyNotFoundError(Exception):
+    """ Raised when the Ruby interpreter cannot be started. """
+
+
+def default_workers():
+    """
+    Returns the default size of the parse worker pool (one per CPU core).
+    """
+    return os.cpu_count() or 1
+
+
+def find_sor_files(input_folder):
+    """
+    Walks the input folder and returns the paths of all .sor files in a stable order.
+    """
+    sor_files = []
+    for root, _, files in os.walk(input_folder):
+        for file in files:
+            if file.lower().endswith(".sor"):
+                sor_files.append(os.path.join(root, file))
+    sor_files.sort()
+    return sor_files
+
+
+def parse_sor_file(sor_file_path, output_folder, rbOTDR_path, traces=False, dump_format="pretty"):
+    """
+    Parses a single .sor file with the Ruby script; traces=True also writes the binary trace.
+    dump_format is one of DUMP_FORMATS.
+    Returns None on success or an error message on failure.
+    """
+    options = (["--trace"] if traces else []) + ([f"--{dump_format}"] if dump_format != "pretty" else [])
+    try:
+        subprocess.run(
+            ["ruby", rbOTDR_path] + options + [sor_file_path, output_folder],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+    except FileNotFoundError:
+        raise RubyNotFoundError("Ruby interpreter not found. Ensure Ruby is installed and added to PATH.")
+    except subprocess.CalledProcessError as e:
+        return (
+            f"Failed to parse {sor_file_path}.\n"
+            f"Exit Code: {e.returncode}\n"
+            f"Output: {e.stdout}\n"
+            f"Error: {e.stderr}"
+        )
+    except Exception as e:
+        return f"Unexpected error with {sor_file_path}: {e}"
+    return None
+
+
+class RubyWorker:
+    """
+    A long-lived `rbOTDR.rb --worker` process that parses one file per request.
+    The interpreter and block modules are loaded once and reused for every file;
+    a worker that crashes or exceeds the timeout is restarted on the next request.
+    """
+
+    def __init__(self, rbOTDR_path, output_folder, timeout=300):
+        self.rbOTDR_path = rbOTDR_path
+        self.output_folder = output_folder
+        self.timeout = timeout
+        self.process = None
+
+    def start(self):
+        """
+        Starts the Ruby worker process.
+        """
+        try:
+            self.process = subprocess.Popen(
+                ["ruby", self.rbOTDR_path, "--worker", self.output_folder],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1
+            )
+        except FileNotFoundError:
+            raise RubyNotFoundError("Ruby interpreter not found. Ensure Ruby is installed and added to PATH.")
+
+    def parse(self, sor_file_path, output_folder=None, traces=False, metrics=None, dump_format="pretty"):
+        """
+        Parses a single .sor file in the worker; traces=True also writes the binary trace.
+        dump_format is one of DUMP_FORMATS.
+        Returns None on success or an error message on failure.
+        metrics, if given, gets a "parse" record with the round trip and Ruby parse time.
+        """
+        started = self.process is None or self.process.poll() is not None
+        if started:
+            self.start()
+        start = time.perf_counter()
+
+        request = json.dumps({"file": sor_file_path, "output": output_folder or self.output_folder, "trace": traces,
+                              "format": dump_format})
+        reply = None
+
+        # Kill the worker if a single file takes too long; the read below then sees EOF
+        watchdog = threading.Timer(self.timeout, self.process.kill)
+        watchdog.start()
+        try:
+            self.process.stdin.write(request + "\n")
+            self.process.stdin.flush()
+            for line in self.process.stdout:
+                # Skip anything the parser printed that is not a reply
+                if line.startswith("{"):
+                    reply = json.loads(line)
+                    break
+        except (OSError, ValueError):
+            reply = None
+        finally:
+            watchdog.cancel()
+
+        seconds = time.perf_counter() - start
+
+        if reply is None:
+            self.process.kill()
+            returncode = self.process.wait()
+            self.process = None
+            error = (
+                f"Failed to parse {sor_file_path}.\n"
+                f"Worker exited with code {returncode}; it will be restarted."
+            )
+        elif reply.get("status") == "ok":
+            error = None
+        else:
+            error = (
+                f"Failed to parse {sor_file_path}.\n"
+                f"Output: {reply.get('log', '')}\n"
+                f"Error: {reply.get('error', '')}"
+            )
+
+        if metrics is not None:
+            reply = reply or {}
+            ruby_seconds = reply.get("seconds")
+            if started:
+                metrics.count("ruby workers started")
+                if ruby_seconds is not None:
+                    # The first round trip also pays for loading the interpreter and block modules;
+                    # keep that out of the file's own latency
+                    startup = max(seconds - ruby_seconds, 0.0)
+                    metrics.add_span("ruby startup", startup)
+                    seconds -= startup
+            metrics.record_file("parse", sor_file_path, seconds, bytes_read=reply.get("bytes"),
+                                error=error and (reply.get("error") or error.splitlines()[-1]),
+                                ruby_seconds=ruby_seconds and round(ruby_seconds, 6))
+        return error
+
+    def close(self):
+        """
+        Asks the worker to exit by closing its input, killing it if it does not.
+        """
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class WorkerPool:
+    """
+    A fixed-size pool of RubyWorker processes shared by the threads of a batch.
+    Workers are started lazily, so a pool larger than the batch costs nothing.
+    """
+
+    def __init__(self, rbOTDR_path, output_folder, size=None, timeout=300):
+        self.workers = [RubyWorker(rbOTDR_path, output_folder, timeout) for _ in range(size or default_workers())]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def parse(self, sor_file_path, output_folder=None, traces=False, metrics=None, dump_format="pretty"):
+        """
+        Parses a file on the next idle worker; see RubyWorker.parse.
+        """
+        worker = self._idle.get()
+        try:
+            return worker.parse(sor_file_path, output_folder, traces, metrics, dump_format)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_sor_batch(sor_files, output_folder, rbOTDR_path, workers=None, progress=None, cancel_event=None,
+                    persistent=True, traces=False, metrics=None, dump_format="pretty"):
+    """
+    Parses .sor files concurrently across a pool of workers.
+    With persistent=True each worker is a long-lived Ruby process (see WorkerPool);
+    otherwise a fresh interpreter is started per file. traces=True also writes each
+    file's binary trace (see traces.py); dump_format is one of DUMP_FORMATS.
+
+    progress, if given, is called as progress(done, total, sor_file_path, error) after each file;
+    it runs on a worker thread, so UI callers must hand the update over to their own thread.
+    Setting cancel_event stops queued files from starting; files already running are finished
+    and reported. Files that were never started are not reported to progress and are not in
+    the error log.
+    metrics, if given, gets a "parse" record per file (see metrics.Metrics).
+    Returns the list of error messages for the files that failed.
+    """
+    workers = workers or default_workers()
+    cancel_event = cancel_event or threading.Event()
+    total = len(sor_files)
+    error_log = []
+    done = 0
+
+    pool = WorkerPool(rbOTDR_path, output_folder, size=workers) if persistent else None
+
+    def run_one(sor_file_path):
+        if cancel_event.is_set():
+            return CANCELLED
+        if pool:
+            return pool.parse(sor_file_path, traces=traces, metrics=metrics, dump_format=dump_format)
+        start = time.perf_counter()
+        error = parse_sor_file(sor_file_path, output_folder, rbOTDR_path, traces=traces, dump_format=dump_format)
+        if metrics is not None:
+            metrics.record_file("parse", sor_file_path, time.perf_counter() - start,
+                                bytes_read=os.path.getsize(sor_file_path),
+                                error=error and error.strip().splitlines()[-1])
+        return error
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(run_one, path): path for path in sor_files}
+        for future in as_completed(futures):
+            sor_file_path = futures[future]
+            try:
+                error = future.result()
+            except RubyNotFoundError:
+                cancel_event.set()
+                raise
+            if error is CANCELLED:
+                continue  # never started: neither parsed nor failed
+            done += 1
+            if error:
+                error_log.append(error)
+            if progress:
+                progress(done, total, sor_file_path, error)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if pool:
+            pool.close()
+
+    return error_log
+
+
+def write_error_log(error_log, output_folder):
+    """
+    Writes the collected parse errors to error_log.txt in the output folder and returns its path.
+    """
+    error_log_path = os.path.join(output_folder, "error_log.txt")
+    with open(error_log_path, "w") as log_file:
+        log_file.write("\n".join(error_log))
+    return error_log_path
+
+
+def output_path(sor_file_path, output_folder, dump_format="pretty"):
+    """
+    Returns the path of the JSON dump rbOTDR.rb writes for a .sor file in the given format.
+    """
+    suffix = "-dump.json.gz" if dump_format == "compact-gz" else "-dump.json"
+    return os.path.join(output_folder, os.path.splitext(os.path.basename(sor_file_path))[0] + suffix)
+
+
+def trace_path(sor_file_path, output_folder):
+    """
+    Returns the path of the binary trace rbOTDR.rb --trace writes for a .sor file (see traces.py).
+    """
+    return os.path.join(output_folder, os.path.splitext(os.path.basename(sor_file_path))[0] + "-trace.bin")
+
+
+def remove_trace(sor_file_path, output_folder):
+    """
+    Deletes the binary trace of a .sor file and the pyramid the trace viewer caches next to
+    it (traces.pyramid_path), if they exist.
+    """
+    trace = trace_path(sor_file_path, output_folder)
+    for path in (trace, os.path.splitext(trace)[0] + "-pyramid.npz"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def file_digest(path):
+    """
+    Returns the BLAKE2b content digest of a file, read in 1 MB chunks.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_state(path):
+    """
+    Returns the (size, mtime_ns, digest) of a source file, for Manifest.record. Taken before
+    a parse, it describes the content the dump was made from even if the file changes later.
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, file_digest(path)
+
+
+def parser_version(rbOTDR_path):
+    """
+    Identifies the parser build by hashing rbOTDR.rb and the block modules next to it,
+    so that any change to the Ruby sources invalidates previously cached outputs.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(rbOTDR_path)), "*.rb"))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Records, per source .sor file, the size, mtime and content digest it had when its
+    JSON dump in the output folder was written, along with the parser version.
+    Stored as sor_manifest.json in the output folder.
+    """
+
+    def __init__(self, output_folder, version):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self.version = version
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Loads the manifest; entries written by another parser version are discarded.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if data.get("manifest_version") == MANIFEST_VERSION and data.get("parser_version") == self.version:
+            self.files = data.get("files", {})
+        return self
+
+    def save(self):
+        """
+        Writes the manifest atomically so an interrupted run never leaves it half written.
+        """
+        with self._lock:
+            data = {
+                "manifest_version": MANIFEST_VERSION,
+                "parser_version": self.version,
+                "files": self.files,
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def is_current(self, sor_file_path, output_folder, traces=False, dump_format="pretty"):
+        """
+        Returns True if the output for this file is up to date and in the wanted dump format,
+        including its binary trace when traces are wanted. Size and mtime are checked first;
+        the content is hashed only when they differ, so a touched but unchanged file is not re-parsed.
+        """
+        entry = self.files.get(os.path.abspath(sor_file_path))
+        if not entry or not os.path.exists(output_path(sor_file_path, output_folder, dump_format)):
+            return False
+        if entry.get("format", "pretty") != dump_format:
+            return False
+        if traces and not (entry.get("trace") and os.path.exists(entry["trace"])):
+            return False
+        st = os.stat(sor_file_path)
+        if entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            return True
+        if entry["size"] != st.st_size or entry["digest"] != file_digest(sor_file_path):
+            return False
+        self.record(sor_file_path, output_folder, entry["digest"], traces=bool(entry.get("trace")),
+                    dump_format=dump_format)
+        return True
+
+    def record(self, sor_file_path, output_folder, digest=None, traces=False, dump_format="pretty", state=None):
+        """
+        Marks a file as parsed with its current size, mtime and digest, or with state, the
+        (size, mtime_ns, digest) taken before the parse (see file_state). A dump left over from
+        an earlier run in another format is deleted, so the folder holds one dump per file, and
+        without traces so is any trace left from an earlier parse, as it no longer matches.
+        """
+        if state is None:
+            st = os.stat(sor_file_path)
+            state = st.st_size, st.st_mtime_ns, digest or file_digest(sor_file_path)
+        entry = {
+            "size": state[0],
+            "mtime": state[1],
+            "digest": state[2],
+            "output": output_path(sor_file_path, output_folder, dump_format),
+            "format": dump_format,
+        }
+        if traces:
+            entry["trace"] = trace_path(sor_file_path, output_folder)
+        with self._lock:
+            previous = self.files.get(os.path.abspath(sor_file_path))
+            self.files[os.path.abspath(sor_file_path)] = entry
+        if previous and previous["output"] != entry["output"]:
+            try:
+                os.remove(previous["output"])
+            except OSError:
+                pass
+        if not traces:
+            remove_trace(sor_file_path, output_folder)
+
+    def prune(self, input_folder, sor_files):
+        """
+        Forgets files under input_folder that no longer exist and deletes their outputs.
+        Entries from other input folders are left alone. Returns the number removed.
+        """
+        root = os.path.join(os.path.abspath(input_folder), "")
+        present = {os.path.abspath(path) for path in sor_files}
+        removed = 0
+        for source in list(self.files):
+            if source.startswith(root) and source not in present:
+                self.forget(source)
+                removed += 1
+        return removed
+
+    def forget(self, sor_file_path):
+        """
+        Forgets one source file and deletes its outputs, including any trace and pyramid
+        whether or not the entry lists them. Returns False if it was not recorded.
+        """
+        with self._lock:
+            entry = self.files.pop(os.path.abspath(sor_file_path), None)
+        if entry is None:
+            return False
+        try:
+            os.remove(entry["output"])
+        except OSError:
+            pass
+        remove_trace(sor_file_path, os.path.dirname(entry["output"]))
+        return True
+
+
+def parse_sor_incremental(input_folder, output_folder, rbOTDR_path, workers=None, progress=None,
+                          cancel_event=None, force=False, traces=False, metrics=None, dump_format="pretty"):
+    """
+    Parses only the .sor files in input_folder whose output is missing or out of date,
+    and removes outputs whose source was deleted. force=True re-parses everything in
+    input_folder, keeping the manifest entries of other input folders sharing output_folder;
+    traces=True also requires (and writes) each file's binary trace; dump_format is one of
+    DUMP_FORMATS, and files dumped in another format are parsed again.
+
+    progress and metrics are passed on as for parse_sor_batch, with total counting only the files to parse.
+    Returns a summary dict with the parsed, skipped and removed counts and the error log.
+    """
+    sor_files = find_sor_files(input_folder)
+    manifest = Manifest(output_folder, parser_version(rbOTDR_path)).load()
+
+    removed = manifest.prune(input_folder, sor_files)
+    to_parse = [path for path in sor_files
+                if force or not manifest.is_current(path, output_folder, traces, dump_format)]
+    parsed = []
+
+    def on_progress(done, total, sor_file_path, error):
+        if not error:
+            manifest.record(sor_file_path, output_folder, traces=traces, dump_format=dump_format)
+            parsed.append(sor_file_path)
+        if progress:
+            progress(done, total, sor_file_path, error)
+
+    try:
+        error_log = parse_sor_batch(
+            to_parse, output_folder, rbOTDR_path,
+            workers=workers, progress=on_progress, cancel_event=cancel_event, traces=traces,
+            metrics=metrics, dump_format=dump_format
+        )
+    finally:
+        # Keep whatever was parsed before a cancel or failure
+        manifest.save()
+
+    return {
+        "parsed": len(parsed),
+        "skipped": len(sor_files) - len(to_parse),
+        "removed": removed,
+        "errors": error_log,
+    }
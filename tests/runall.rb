@@ -4,4 +4,5 @@ require __dir__+"/test_map"
 require __dir__+"/test_parts"
 require __dir__+"/test_cksum"
 require __dir__+"/test_read"
+require __dir__+"/test_dump"
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import os
+import sys
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import compare  # noqa: E402
+import report  # noqa: E402
+
+def tables(shots, events):
+    """
+    Builds (shots, events) tables as report.process_json_and_extract does, from
+    (cable, fiber ID, direction) shots and (shot, distance, splice loss) events.
+    """
+    shot_columns = {name: [] for name in ["Shot_ID"] + report.SHOT_COLUMNS + report.SHOT_KEYS}
+    for shot_id, (cable, fiber_id, direction) in enumerate(shots):
+        for column, value in zip(["Shot_ID"] + report.SHOT_COLUMNS + report.SHOT_KEYS,
+                                 (shot_id, direction, fiber_id, 10.0, 10.0, cable, "")):
+            shot_columns[column].append(value)
+    event_columns = {name: [] for name in ["Shot_ID", "Event_Number"] + report.EVENT_COLUMNS}
+    numbers = {}
+    for shot_id, distance, splice_loss in events:
+        numbers[shot_id] = numbers.get(shot_id, 0) + 1
+        for column, value in zip(["Shot_ID", "Event_Number"] + report.EVENT_COLUMNS,
+                                 (shot_id, numbers[shot_id], f"event {numbers[shot_id]}", distance, splice_loss,
+                                  0.0, "")):
+            event_columns[column].append(value)
+    return report.shots_and_events(shot_columns, event_columns)
+
+class TestCompareShots(unittest.TestCase):
+
+    def test_repeated_fiber(self):
+        # Two shots of one fiber (a re-shot, or two wavelengths) against one baseline shot
+        shots, events = tables([("C", "1", "A B"), ("C", "1", "A B")],
+                               [(0, 1.0, 0.05), (0, 2.0, 0.05), (1, 1.0, 0.05), (1, 2.0, 0.5)])
+        baseline_shots, baseline_events = tables([("C", "1", "A B")], [(0, 1.0, 0.05), (0, 2.0, 0.05)])
+
+        pairs, table = compare.compare_shots(shots, events, baseline_shots, baseline_events, workers=1)
+
+        # The last shot wins, as in pairing.pair_shots
+        self.assertEqual(pairs["Shot_ID"].tolist(), [1])
+        self.assertEqual(pairs["Baseline_Shot_ID"].tolist(), [0])
+        self.assertEqual(table["Shot_ID"].tolist(), [1, 1])
+        self.assertEqual(table["Baseline_Event"].tolist(), ["event 1", "event 2"])
+        self.assertEqual(table["Comments"].tolist(), ["", "Grown event"])
+
+    def test_each_pair_uses_its_own_baseline(self):
+        shots, events = tables([("C", "1", "A B"), ("C", "2", "A B")],
+                               [(0, 1.0, 0.05), (1, 1.0, 0.05), (1, 3.0, 0.3)])
+        baseline_shots, baseline_events = tables([("C", "2", "A B"), ("C", "1", "A B")],
+                                                 [(0, 1.0, 0.05), (1, 1.0, 0.05), (1, 3.0, 0.3)])
+
+        _, table = compare.compare_shots(shots, events, baseline_shots, baseline_events, workers=1)
+
+        # Fiber 2's event at 3 km is not in its own baseline, only in fiber 1's
+        self.assertEqual(table["Comments"].tolist(), ["", "", "New event"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/ruby
+require 'test/unit'
+require 'tmpdir'
+
+$:.push File.dirname(__FILE__)+"/.."
+
+require 'dump'
+
+class CB_test_dump < Test::Unit::TestCase
+  # def setup
+  # end
+  
+  # def teardown
+  # end
+  
+  def test_binary_tracefile
+    trace = { 'samples' => [0.0, 1.5, -2.25, 30.125], 'resolution' => 2.5,
+	      'scaling factor' => 1.0, 'xscaling' => 1, 'offset' => 'STV' }
+    
+    Dir.mktmpdir { |dir|
+      opfile = File.join(dir, "demo-trace.bin")
+      Dump::binary_tracefile(trace, opfile)
+      data = IO.binread(opfile)
+      
+      assert data.length == 48 + 4*4
+      
+      magic, version, hsize, npts, res, sf, xs, offset = data[0,48].unpack('a8S<S<L<EEEa4')
+      assert magic == "SORTRACE"
+      assert version == 1
+      assert hsize == 48
+      assert npts == 4
+      assert res == 2.5
+      assert sf == 1.0
+      assert xs == 1.0
+      assert offset.delete("\0") == 'STV'
+      
+      assert data[hsize..-1].unpack('e*') == trace['samples']
+    }
+    return
+  end
+  
+  def test_compactfile
+    results = { 'filename' => 'demo.sor',
+		'KeyEvents' => { 'num events' => 1,
+				 'events' => [ { 'distance' => 1.2345678, 'splice loss' => 0.0125 } ] } }
+    
+    Dir.mktmpdir { |dir|
+      opfile = File.join(dir, "demo-dump.json")
+      Dump::compactfile(results, opfile)
+      text = IO.read(opfile)
+      
+      assert text.lines.length == 1
+      assert JSON.parse(text) == results
+      
+      gzfile = opfile + ".gz"
+      Dump::compactfile(results, gzfile, true)
+      assert Zlib::GzipReader.open(gzfile) { |gz| gz.read } == text
+    }
+    return
+  end
+end
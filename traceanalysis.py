@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Detection defaults; windows are in samples, thresholds in dB
+DEFAULT_WINDOW = 16              # samples averaged on each side of a candidate event
+DEFAULT_LOSS_THRESHOLD = 0.05    # smallest non-reflective step reported
+DEFAULT_REFLECTION_THRESHOLD = 0.5  # smallest reflective peak height reported
+DEFAULT_END_THRESHOLD = 3.0      # fiber end is the last point this far above the noise floor
+NOISE_TAIL_FRACTION = 0.02       # tail of each trace used to estimate the noise floor
+# Padded samples (traces x longest trace) analysed per vectorized batch; the batch
+# temporaries take about 150 bytes per sample, so this keeps a batch near 75 MB
+DEFAULT_BATCH_SAMPLES = 500_000
+
+EVENT_TYPES = ["non-reflective", "reflective", "end"]
+
+def stack_traces(traces):
+    """
+    Stacks (header, samples) traces, as returned by traces.load_trace, into one 2D array.
+    Returns (values, lengths, step_km): values is (n, max_len) float64 padded with NaN,
+    lengths the number of samples per trace, step_km the sample spacing per trace in km.
+    """
+    lengths = np.array([len(samples) for _, samples in traces], dtype=np.int64)
+    values = np.full((len(traces), int(lengths.max(initial=0))), np.nan)
+    for row, (_, samples) in enumerate(traces):
+        values[row, :len(samples)] = samples
+    step_km = np.array([header["resolution"] * header["xscaling"] / 1000.0 for header, _ in traces])
+    return values, lengths, step_km
+
+def _batches(lengths, batch_samples):
+    """
+    Yields slices of consecutive traces whose padded size (number of traces times the
+    longest of them) stays within batch_samples; a longer trace gets a batch of its own.
+    """
+    first, longest = 0, 0
+    for row, length in enumerate(lengths):
+        if row > first and max(longest, length) * (row - first + 1) > batch_samples:
+            yield slice(first, row)
+            first, longest = row, 0
+        longest = max(longest, length)
+    if first < len(lengths):
+        yield slice(first, len(lengths))
+
+def _prefix_sums(values):
+    """
+    Returns prefix sums of y and x*y along each trace, with NaN treated as 0
+    and a leading zero column, so any window sum is a difference of two entries.
+    """
+    y = np.nan_to_num(values)
+    x = np.arange(values.shape[1], dtype=np.float64)
+    zeros = np.zeros((values.shape[0], 1))
+    sum_y = np.concatenate([zeros, np.cumsum(y, axis=1)], axis=1)
+    sum_xy = np.concatenate([zeros, np.cumsum(y * x, axis=1)], axis=1)
+    return sum_y, sum_xy
+
+def _window_mean(sum_y, offset, window):
+    """
+    Mean of y[i + offset : i + offset + window] for every sample i of every trace.
+    Windows that run off either end are clamped; callers mask those positions out.
+    """
+    length = sum_y.shape[1] - 1
+    start = np.clip(np.arange(length) + offset, 0, max(length - window, 0))
+    return (sum_y[:, start + window] - sum_y[:, start]) / window
+
+def _local_max(values, window):
+    """
+    True where a value is the maximum of its neighbourhood of +/- window samples;
+    on a plateau only the first sample is kept.
+    """
+    padded = np.pad(values, ((0, 0), (window, window)), constant_values=-np.inf)
+    neighbourhood = sliding_window_view(padded, 2 * window + 1, axis=1)
+    return (values >= neighbourhood.max(axis=-1)) & (values > neighbourhood[..., :window].max(axis=-1))
+
+def _segment_slopes(sum_y, sum_xy, rows, starts, stops):
+    """
+    Least-squares slope (dB per sample) of y over [start, stop) for many segments at once.
+    """
+    n = (stops - starts).astype(np.float64)
+    s_x = (starts + stops - 1) * n / 2.0
+    s_xx = ((stops - 1) * stops * (2 * stops - 1) - (starts - 1) * starts * (2 * starts - 1)) / 6.0
+    s_y = sum_y[rows, stops] - sum_y[rows, starts]
+    s_xy = sum_xy[rows, stops] - sum_xy[rows, starts]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * s_xy - s_x * s_y) / (n * s_xx - s_x * s_x)
+    return np.where(n >= 2, slope, np.nan)
+
+def reflectance(height_db, backscatter_db, pulse_width_ns):
+    """
+    Estimates reflectance (dB) from a reflective peak height above the backscatter level,
+    the fiber backscatter coefficient for a 1 ns pulse and the pulse width.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return backscatter_db + 10.0 * np.log10((10.0 ** (height_db / 5.0) - 1.0) * pulse_width_ns)
+
+def _analyze_batch(values, lengths, step_km, window, loss_threshold, reflection_threshold, end_threshold,
+                   backscatter_db, pulse_width_ns):
+    """
+    Analyses one batch of stacked traces. Returns (events, segments, summary) as dicts of
+    column arrays, with the trace's row in the batch in the "row" column.
+    """
+    n_traces, length = values.shape
+    sum_y, sum_xy = _prefix_sums(values)
+    index = np.arange(length)
+
+    # Noise floor from the tail of each trace, fiber end where the smoothed trace last clears it
+    tail = np.maximum(window, (lengths * NOISE_TAIL_FRACTION).astype(np.int64))
+    tail = np.minimum(tail, lengths)
+    rows = np.arange(n_traces)
+    noise = (sum_y[rows, lengths] - sum_y[rows, lengths - tail]) / np.maximum(tail, 1)
+    smoothed = _window_mean(sum_y, -(window // 2), window)
+    above = (smoothed > (noise + end_threshold)[:, None]) & (index < lengths[:, None])
+    has_signal = above.any(axis=1)
+    end_index = np.where(has_signal, length - 1 - np.argmax(above[:, ::-1], axis=1), 0)
+
+    # Overall attenuation from a fit between the launch dead zone and the fiber end
+    fit_start = np.minimum(window, end_index)
+    fit_stop = np.maximum(end_index - window, fit_start)
+    attenuation = -_segment_slopes(sum_y, sum_xy, rows, fit_start, fit_stop)  # dB per sample, positive
+    attenuation = np.nan_to_num(attenuation)
+
+    # Step across each sample, corrected for the attenuation between the two window centres
+    before = _window_mean(sum_y, -window, window)
+    after = _window_mean(sum_y, 1, window)
+    after_far = _window_mean(sum_y, window, window)
+    step = before - after - attenuation[:, None] * (window + 1)
+    height = np.nan_to_num(values) - before
+
+    valid = (index >= window)[None, :] & (index < (end_index - 2 * window)[:, None])
+    reflective = valid & (height > reflection_threshold) & _local_max(np.where(valid, height, -np.inf), window)
+    near_reflection = sliding_window_view(
+        np.pad(reflective, ((0, 0), (window, window))), 2 * window + 1, axis=1
+    ).any(axis=-1)
+    non_reflective = valid & ~near_reflection & (step > loss_threshold) & \
+        _local_max(np.where(valid, step, -np.inf), window)
+
+    # Losses: a reflective event is measured past its spike
+    reflective_loss = before - after_far - attenuation[:, None] * (2 * window)
+    ev_rows, ev_index = np.nonzero(reflective | non_reflective)
+    is_reflective = reflective[ev_rows, ev_index]
+    loss = np.where(is_reflective, reflective_loss[ev_rows, ev_index], step[ev_rows, ev_index])
+    refl = np.full(len(ev_rows), np.nan)
+    if backscatter_db is not None and pulse_width_ns is not None:
+        refl = np.where(
+            is_reflective,
+            reflectance(height[ev_rows, ev_index], backscatter_db[ev_rows], pulse_width_ns[ev_rows]),
+            np.nan
+        )
+
+    # Fiber end closes every trace that has signal
+    end_rows = rows[has_signal]
+    events = {
+        "row": np.concatenate([ev_rows, end_rows]),
+        "index": np.concatenate([ev_index, end_index[end_rows]]),
+        "type": np.concatenate([np.where(is_reflective, 1, 0), np.full(len(end_rows), 2)]),
+        "loss": np.concatenate([loss, np.full(len(end_rows), np.nan)]),
+        "refl": np.concatenate([refl, np.full(len(end_rows), np.nan)]),
+    }
+    order = np.lexsort((events["index"], events["row"]))
+    events = {key: value[order] for key, value in events.items()}
+
+    # Segments between consecutive events, trimmed by the window on both sides
+    boundaries_row = np.concatenate([rows[has_signal], events["row"]])
+    boundaries_index = np.concatenate([np.zeros(has_signal.sum(), dtype=np.int64), events["index"]])
+    order = np.lexsort((boundaries_index, boundaries_row))
+    boundaries_row, boundaries_index = boundaries_row[order], boundaries_index[order]
+    same_trace = boundaries_row[1:] == boundaries_row[:-1]
+    seg_rows = boundaries_row[1:][same_trace]
+    seg_start = boundaries_index[:-1][same_trace]
+    seg_stop = boundaries_index[1:][same_trace]
+    fit_a = seg_start + window
+    fit_b = np.maximum(seg_stop - window, fit_a)
+    seg_slope = -_segment_slopes(sum_y, sum_xy, seg_rows, fit_a, fit_b)
+    segments = {"row": seg_rows, "start": seg_start, "stop": seg_stop, "attenuation": seg_slope}
+
+    summary = {
+        "row": rows,
+        "end_index": np.where(has_signal, end_index, -1),
+        "attenuation": attenuation,
+        "noise": noise,
+    }
+    return events, segments, summary
+
+def analyze_traces(traces, shot_ids=None, window=DEFAULT_WINDOW, loss_threshold=DEFAULT_LOSS_THRESHOLD,
+                   reflection_threshold=DEFAULT_REFLECTION_THRESHOLD, end_threshold=DEFAULT_END_THRESHOLD,
+                   backscatter_db=None, pulse_width_ns=None, batch_samples=DEFAULT_BATCH_SAMPLES):
+    """
+    Analyses decoded DataPts traces in vectorized batches: detects reflective and
+    non-reflective events with rolling-window and step filters, estimates the fiber end
+    from the noise floor, and fits the attenuation slope of every segment between events.
+
+    traces is a list of (header, samples) as returned by traces.load_trace; shot_ids, if
+    given, labels each trace (default 0..n-1). backscatter_db and pulse_width_ns, if given
+    per trace, are used to estimate the reflectance of reflective events; without them
+    Refl_Loss is NaN. Traces are analysed in batches of at most batch_samples padded samples.
+
+    Returns (events, segments, summary) DataFrames. events uses the report's event table
+    columns (Shot_ID, Event_Number, Event, Event_Distance, Splice_Loss, Refl_Loss, Comments)
+    plus Event_Type, so it can go straight through report.classify_events.
+    """
+    shot_ids = np.arange(len(traces)) if shot_ids is None else np.asarray(shot_ids)
+    if backscatter_db is not None:
+        backscatter_db = np.asarray(backscatter_db, dtype=np.float64)
+    if pulse_width_ns is not None:
+        pulse_width_ns = np.asarray(pulse_width_ns, dtype=np.float64)
+
+    event_parts, segment_parts, summary_parts = [], [], []
+    for batch in _batches([len(samples) for _, samples in traces], batch_samples):
+        values, lengths, step_km = stack_traces(traces[batch])
+        events, segments, summary = _analyze_batch(
+            values, lengths, step_km, window, loss_threshold, reflection_threshold, end_threshold,
+            backscatter_db[batch] if backscatter_db is not None else None,
+            pulse_width_ns[batch] if pulse_width_ns is not None else None,
+        )
+        ids = shot_ids[batch]
+
+        event_parts.append(pd.DataFrame({
+            "Shot_ID": ids[events["row"]],
+            "Event_Type": np.asarray(EVENT_TYPES, dtype=object)[events["type"]],
+            "Event_Distance": events["index"] * step_km[events["row"]],
+            "Splice_Loss": events["loss"],
+            "Refl_Loss": events["refl"],
+        }))
+        segment_parts.append(pd.DataFrame({
+            "Shot_ID": ids[segments["row"]],
+            "Start_KM": segments["start"] * step_km[segments["row"]],
+            "End_KM": segments["stop"] * step_km[segments["row"]],
+            "Attenuation_dB_km": segments["attenuation"] / step_km[segments["row"]],
+        }))
+        summary_parts.append(pd.DataFrame({
+            "Shot_ID": ids,
+            "Fiber_End_KM": np.where(summary["end_index"] >= 0, summary["end_index"] * step_km, np.nan),
+            "Attenuation_dB_km": summary["attenuation"] / step_km,
+            "Noise_Floor_dB": summary["noise"],
+        }))
+
+    events = pd.concat(event_parts, ignore_index=True) if event_parts else pd.DataFrame(
+        columns=["Shot_ID", "Event_Type", "Event_Distance", "Splice_Loss", "Refl_Loss"])
+    segments = pd.concat(segment_parts, ignore_index=True) if segment_parts else pd.DataFrame(
+        columns=["Shot_ID", "Start_KM", "End_KM", "Attenuation_dB_km"])
+    summary = pd.concat(summary_parts, ignore_index=True) if summary_parts else pd.DataFrame(
+        columns=["Shot_ID", "Fiber_End_KM", "Attenuation_dB_km", "Noise_Floor_dB"])
+
+    events["Event_Number"] = events.groupby("Shot_ID").cumcount().astype("int64") + 1
+    events["Event"] = "trace event " + events["Event_Number"].astype(str)
+    events["Comments"] = ""
+    segments["Segment"] = segments.groupby("Shot_ID").cumcount().astype("int64") + 1
+
+    events = events[["Shot_ID", "Event_Number", "Event", "Event_Type", "Event_Distance",
+                     "Splice_Loss", "Refl_Loss", "Comments"]]
+    segments = segments[["Shot_ID", "Segment", "Start_KM", "End_KM", "Attenuation_dB_km"]]
+    return events, segments, summary
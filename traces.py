@@ -0,0 +1,138 @@
+import os
+import re
+import struct
+
+import numpy as np
+
+# Layout of the header written by Dump::binary_tracefile in dump.rb (little-endian):
+# magic, format version, header size, number of samples, resolution (m), scaling factor,
+# xscaling, offset mode, 4 reserved bytes; float32 samples (dB) follow the header.
+TRACE_MAGIC = b"SORTRACE"
+TRACE_HEADER = struct.Struct("<8sHHLddd4s4x")
+
+def read_trace_header(path):
+    """
+    Reads the header of a binary trace file and returns it as a dict.
+    """
+    with open(path, "rb") as f:
+        data = f.read(TRACE_HEADER.size)
+    if len(data) < TRACE_HEADER.size:
+        raise ValueError(f"{path}: file too short for a trace header")
+
+    magic, version, header_size, num_points, resolution, scaling_factor, xscaling, offset = TRACE_HEADER.unpack(data)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path}: not a binary trace file")
+    if version != 1:
+        raise ValueError(f"{path}: unsupported trace format version {version}")
+
+    return {
+        "version": version,
+        "header_size": header_size,
+        "num_points": num_points,
+        "resolution": resolution,  # meters per sample
+        "scaling_factor": scaling_factor,
+        "xscaling": xscaling,
+        "offset": offset.rstrip(b"\0").decode("ascii", "replace"),
+    }
+
+def load_trace(path):
+    """
+    Maps a binary trace file without copying it.
+    Returns (header, samples) where samples is a read-only float32 numpy.memmap in dB;
+    pages are only read from disk when they are touched.
+    """
+    header = read_trace_header(path)
+    if header["num_points"] == 0:
+        return header, np.zeros(0, dtype="<f4")
+    samples = np.memmap(path, dtype="<f4", mode="r", offset=header["header_size"], shape=(header["num_points"],))
+    return header, samples
+
+def trace_distances(header, num_points=None):
+    """
+    Returns the distance in km of every sample of a trace, computed from its header.
+    """
+    num_points = header["num_points"] if num_points is None else num_points
+    step_km = header["resolution"] * header["xscaling"] / 1000.0
+    return np.arange(num_points, dtype=np.float64) * step_km
+
+# Min/max decimation pyramid of a trace: level k holds the minimum and maximum of every block
+# of PYRAMID_FACTOR**k samples, down to the first level shorter than PYRAMID_MIN_SIZE.
+PYRAMID_FACTOR = 4
+PYRAMID_MIN_SIZE = 1024
+
+def pyramid_path(trace_path):
+    """
+    Returns the path of the cached pyramid of a -trace.bin.
+    """
+    return re.sub(r"\.bin$", "", trace_path) + "-pyramid.npz"
+
+def build_pyramid(samples):
+    """
+    Returns the pyramid levels of a trace as a list of (mins, maxs) arrays, level 1 first.
+    Each level is reduced from the previous one, so building it reads the samples once.
+    """
+    levels = []
+    mins = maxs = np.asarray(samples, dtype=np.float32)
+    while len(mins) > PYRAMID_MIN_SIZE:
+        starts = np.arange(0, len(mins), PYRAMID_FACTOR)
+        mins = np.minimum.reduceat(mins, starts)
+        maxs = np.maximum.reduceat(maxs, starts)
+        levels.append((mins, maxs))
+    return levels
+
+def load_pyramid(trace_path, samples=None):
+    """
+    Returns the pyramid of a trace, from its cache file when the cache was built from the
+    current -trace.bin (same size and mtime), otherwise building it and writing the cache.
+    A cache that cannot be written (read-only folder) is not an error.
+    """
+    st = os.stat(trace_path)
+    source = np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+    cache_path = pyramid_path(trace_path)
+    try:
+        with np.load(cache_path) as cache:
+            if np.array_equal(cache["source"], source) and int(cache["factor"]) == PYRAMID_FACTOR:
+                return [(cache[f"mins_{k}"], cache[f"maxs_{k}"]) for k in range(1, int(cache["levels"]) + 1)]
+    except (OSError, KeyError, ValueError):
+        pass
+
+    if samples is None:
+        _, samples = load_trace(trace_path)
+    levels = build_pyramid(samples)
+    arrays = {"source": source, "factor": PYRAMID_FACTOR, "levels": len(levels)}
+    for k, (mins, maxs) in enumerate(levels, start=1):
+        arrays[f"mins_{k}"] = mins
+        arrays[f"maxs_{k}"] = maxs
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return levels
+
+def view_samples(samples, pyramid, start, stop, pixels):
+    """
+    Returns (positions, mins, maxs) covering samples [start, stop) at the coarsest level that
+    still has at least one value per pixel; positions are sample indices (block centres).
+    Only that part of that level is touched, so the cost follows the view width, not the trace.
+    """
+    start = max(0, int(start))
+    stop = min(len(samples), int(stop))
+    if stop <= start:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty.astype(np.float64), empty, empty
+
+    level = 0
+    while level < len(pyramid) and PYRAMID_FACTOR ** (level + 1) * max(pixels, 1) <= stop - start:
+        level += 1
+    if level == 0:
+        values = np.asarray(samples[start:stop])
+        return np.arange(start, stop, dtype=np.float64), values, values
+
+    block = PYRAMID_FACTOR ** level
+    mins, maxs = pyramid[level - 1]
+    first, last = start // block, -(-stop // block)
+    positions = np.arange(first, last, dtype=np.float64) * block + block / 2.0
+    return positions, mins[first:last], maxs[first:last]
@@ -0,0 +1,209 @@
+import os
+import re
+import tkinter as tk
+
+import numpy as np
+
+import traces
+from report import DUMP_SUFFIXES, key_events, load_dump
+
+# Colours of the overlaid traces, in the order they are opened
+TRACE_COLOURS = ["#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd", "#8c564b", "#e377c2", "#17becf"]
+
+# Space around the plot for the axis labels, in pixels
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 60, 15, 15, 30
+
+# Wheel zoom factor per step
+ZOOM_STEP = 1.25
+
+def trace_dump_path(trace_path):
+    """
+    Returns the path of the -dump.json (or -dump.json.gz) written next to a -trace.bin.
+    """
+    base = re.sub(r"-trace\.bin$", "", trace_path)
+    for suffix in DUMP_SUFFIXES:
+        if os.path.exists(base + suffix):
+            return base + suffix
+    return base + DUMP_SUFFIXES[0]
+
+def trace_markers(trace_path):
+    """
+    Returns the KeyEvents of the dump next to a trace as a list of (distance km, label).
+    Traces without a readable dump have no markers.
+    """
+    try:
+        json_data = load_dump(trace_dump_path(trace_path))
+    except Exception:
+        return []
+    markers = []
+    for key, info in key_events(json_data):
+        try:
+            markers.append((float(info.get("distance")), key.split()[-1]))
+        except (TypeError, ValueError):
+            continue
+    return markers
+
+class Trace:
+    """
+    An opened trace: the memory-mapped samples, their pyramid and the KeyEvents markers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.header, self.samples = traces.load_trace(path)
+        self.pyramid = traces.load_pyramid(path, self.samples)
+        self.markers = trace_markers(path)
+        self.step_km = self.header["resolution"] * self.header["xscaling"] / 1000.0 or 1.0
+
+    @property
+    def length_km(self):
+        return len(self.samples) * self.step_km
+
+class TraceView(tk.Frame):
+    """
+    Plots traces on a Canvas with their KeyEvents as markers. Each redraw asks the pyramid for
+    the samples in view at about one min/max pair per pixel, so zooming and panning cost the
+    same on a 250k-sample trace as on a short one, and overlaying many fibers stays smooth.
+    Wheel zooms around the pointer, dragging pans, double-click shows the whole traces.
+    """
+
+    def __init__(self, master, width=800, height=400):
+        super().__init__(master)
+        self.traces = []
+        self.view = (0.0, 1.0)  # km
+        self.drag_x = None
+        self.position_var = tk.StringVar()
+        self.canvas = tk.Canvas(self, width=width, height=height, background="white", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        tk.Label(self, textvariable=self.position_var, anchor=tk.W).pack(fill=tk.X)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<MouseWheel>", lambda event: self._on_wheel(event, 1 if event.delta > 0 else -1))
+        self.canvas.bind("<Button-4>", lambda event: self._on_wheel(event, 1))
+        self.canvas.bind("<Button-5>", lambda event: self._on_wheel(event, -1))
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<Double-Button-1>", lambda event: self.reset_view())
+        self.canvas.bind("<Motion>", self._on_motion)
+
+    def add_trace(self, path):
+        self.traces.append(Trace(path))
+        self.reset_view()
+
+    def clear(self):
+        self.traces = []
+        self.reset_view()
+
+    def reset_view(self):
+        length = max((trace.length_km for trace in self.traces), default=0.0)
+        self.view = (0.0, length or 1.0)
+        self.redraw()
+
+    def _plot_area(self):
+        width = max(self.canvas.winfo_width(), 2 * (MARGIN_LEFT + MARGIN_RIGHT))
+        height = max(self.canvas.winfo_height(), 2 * (MARGIN_TOP + MARGIN_BOTTOM))
+        return MARGIN_LEFT, MARGIN_TOP, width - MARGIN_RIGHT, height - MARGIN_BOTTOM
+
+    def _km_at(self, x):
+        left, _, right, _ = self._plot_area()
+        x0, x1 = self.view
+        return x0 + (x - left) / (right - left) * (x1 - x0)
+
+    def redraw(self):
+        """
+        Redraws the traces, markers and axes for the current view.
+        """
+        canvas = self.canvas
+        canvas.delete("all")
+        left, top, right, bottom = self._plot_area()
+        pixels = right - left
+        x0, x1 = self.view
+
+        # Decimated samples in view, per trace
+        curves = []
+        for trace in self.traces:
+            start = int(np.floor(x0 / trace.step_km))
+            stop = int(np.ceil(x1 / trace.step_km)) + 1
+            positions, mins, maxs = traces.view_samples(trace.samples, trace.pyramid, start, stop, pixels)
+            curves.append((trace, positions * trace.step_km, mins, maxs))
+
+        finite = [values[np.isfinite(values)] for _, _, mins, maxs in curves for values in (mins, maxs)]
+        finite = [values for values in finite if len(values)]
+        if finite:
+            y0 = float(min(values.min() for values in finite))
+            y1 = float(max(values.max() for values in finite))
+        else:
+            y0, y1 = 0.0, 1.0
+        if y1 - y0 < 1e-6:
+            y0, y1 = y0 - 0.5, y1 + 0.5
+        pad = (y1 - y0) * 0.05
+        y0, y1 = y0 - pad, y1 + pad
+
+        def to_x(km):
+            return left + (km - x0) / (x1 - x0) * pixels
+
+        def to_y(db):
+            return bottom - (db - y0) / (y1 - y0) * (bottom - top)
+
+        self._draw_axes(left, top, right, bottom, x0, x1, y0, y1)
+
+        for index, (trace, km, mins, maxs) in enumerate(curves):
+            colour = TRACE_COLOURS[index % len(TRACE_COLOURS)]
+            if len(km) > 1:
+                # Zig-zag through the min and max of each block, which draws the envelope
+                xs = np.repeat(to_x(km), 2)
+                ys = np.column_stack((to_y(mins), to_y(maxs))).ravel()
+                keep = np.isfinite(ys)
+                coords = np.column_stack((xs[keep], ys[keep])).ravel()
+                if len(coords) >= 4:
+                    canvas.create_line(*coords.tolist(), fill=colour)
+            for distance, label in trace.markers:
+                if x0 <= distance <= x1:
+                    x = to_x(distance)
+                    canvas.create_line(x, top, x, bottom, fill=colour, dash=(2, 4))
+                    canvas.create_text(x + 2, top + 2 + 12 * index, text=label, anchor=tk.NW, fill=colour)
+            canvas.create_text(right - 5, top + 5 + 14 * index, text=trace.name, anchor=tk.NE, fill=colour)
+
+    def _draw_axes(self, left, top, right, bottom, x0, x1, y0, y1):
+        canvas = self.canvas
+        canvas.create_rectangle(left, top, right, bottom, outline="grey")
+        for i in range(6):
+            km = x0 + (x1 - x0) * i / 5
+            x = left + (right - left) * i / 5
+            canvas.create_line(x, bottom, x, bottom + 4, fill="grey")
+            canvas.create_text(x, bottom + 6, text=f"{km:.3f}", anchor=tk.N)
+            db = y0 + (y1 - y0) * i / 5
+            y = bottom - (bottom - top) * i / 5
+            canvas.create_line(left - 4, y, left, y, fill="grey")
+            canvas.create_text(left - 6, y, text=f"{db:.2f}", anchor=tk.E)
+        canvas.create_text(right, bottom + 18, text="km", anchor=tk.NE)
+        canvas.create_text(left - 6, top - 2, text="dB", anchor=tk.SE)
+
+    def _on_wheel(self, event, direction):
+        if not self.traces:
+            return
+        km = self._km_at(event.x)
+        scale = 1 / ZOOM_STEP if direction > 0 else ZOOM_STEP
+        x0, x1 = self.view
+        # Stop zooming in below a few samples across the plot
+        min_span = min(trace.step_km for trace in self.traces) * 4
+        if (x1 - x0) * scale < min_span:
+            return
+        self.view = (km - (km - x0) * scale, km + (x1 - km) * scale)
+        self.redraw()
+
+    def _on_press(self, event):
+        self.drag_x = event.x
+
+    def _on_drag(self, event):
+        if self.drag_x is None:
+            return
+        shift = self._km_at(self.drag_x) - self._km_at(event.x)
+        self.drag_x = event.x
+        self.view = (self.view[0] + shift, self.view[1] + shift)
+        self.redraw()
+
+    def _on_motion(self, event):
+        if self.traces:
+            self.position_var.set(f"{self._km_at(event.x):.4f} km")
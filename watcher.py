@@ -0,0 +1,441 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import report
+import sorbatch
+
+
+QUEUE_NAME = "sor_queue.sqlite"
+
+DEFAULT_POLL_INTERVAL = 5.0   # seconds between scans of the input tree
+DEFAULT_SETTLE_SECONDS = 10.0  # a file must keep its size and mtime this long before it is parsed
+DEFAULT_REPORT_INTERVAL = 30.0  # seconds between per-cable report refreshes while busy
+SCAN_BATCH = 500              # scanned files written to the queue per transaction
+MAX_ATTEMPTS = 3              # parse attempts before a file is marked failed until it changes
+RETRY_DELAY = 30.0            # seconds before a failed file is retried, times its failed attempts
+
+
+def scan_sor_files(input_folder):
+    """
+    Walks the input tree with os.scandir and yields (path, size, mtime_ns) for every .sor
+    file, without building the whole listing in memory. Unreadable folders are skipped.
+    """
+    stack = [input_folder]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(".sor") and entry.is_file():
+                            st = entry.stat()
+                            yield entry.path, st.st_size, st.st_mtime_ns
+                    except OSError:
+                        continue  # removed or unreadable while scanning
+        except OSError:
+            continue
+
+
+class IngestQueue:
+    """
+    A persistent queue of .sor files in SQLite, so a burst of files is held on disk rather
+    than in memory and a restart resumes where the previous run stopped.
+
+    Every file moves through the states settling -> pending -> running -> done (or failed).
+    A file is settling until its size and mtime have been unchanged for the settle time;
+    a file that changes in any state goes back to settling, except that a running file is
+    marked changed and only goes back to settling when its parse ends, so it is never
+    parsed twice at once.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                scan_id INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_state ON files (state, seen_at);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        # Files that were being parsed when the previous run stopped are parsed again
+        self.db.execute("UPDATE files SET state = 'pending' WHERE state = 'running'")
+        self.db.execute("UPDATE files SET state = 'settling' WHERE state = 'changed'")
+        self.db.commit()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'scan_id'").fetchone()
+        self.scan_id = int(row[0]) if row else 0
+
+    def scan(self, input_folder, now=None):
+        """
+        Records the current state of the input tree. New or changed files start settling;
+        files that disappeared are dropped. Returns the paths removed since the last scan.
+        """
+        now = time.time() if now is None else now
+        self.scan_id += 1
+        batch = []
+
+        def flush():
+            self.db.executemany("""
+                INSERT INTO files (path, size, mtime_ns, state, seen_at, scan_id)
+                VALUES (?, ?, ?, 'settling', ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    scan_id = excluded.scan_id,
+                    state = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns
+                                 THEN files.state
+                                 WHEN files.state IN ('running', 'changed') THEN 'changed'
+                                 ELSE 'settling' END,
+                    seen_at = CASE WHEN files.size != excluded.size OR files.mtime_ns != excluded.mtime_ns
+                                   THEN excluded.seen_at ELSE files.seen_at END,
+                    attempts = CASE WHEN files.size != excluded.size OR files.mtime_ns != excluded.mtime_ns
+                                    THEN 0 ELSE files.attempts END,
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns
+            """, batch)
+            self.db.commit()
+            batch.clear()
+
+        for path, size, mtime_ns in scan_sor_files(input_folder):
+            batch.append((os.path.abspath(path), size, mtime_ns, now, self.scan_id))
+            if len(batch) >= SCAN_BATCH:
+                flush()
+        flush()
+
+        removed = [row[0] for row in self.db.execute("SELECT path FROM files WHERE scan_id < ?", (self.scan_id,))]
+        self.db.execute("DELETE FROM files WHERE scan_id < ?", (self.scan_id,))
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_id', ?)", (str(self.scan_id),))
+        self.db.commit()
+        return removed
+
+    def promote(self, settle_seconds, now=None):
+        """
+        Moves files whose size and mtime have been stable for settle_seconds to pending.
+        Returns the number promoted.
+        """
+        now = time.time() if now is None else now
+        cursor = self.db.execute(
+            "UPDATE files SET state = 'pending' WHERE state = 'settling' AND seen_at <= ?",
+            (now - settle_seconds,)
+        )
+        self.db.commit()
+        return cursor.rowcount
+
+    def claim(self, limit, now=None):
+        """
+        Marks up to limit pending files as running, oldest first, and returns their paths.
+        Files waiting out a retry delay (see fail) are left pending.
+        """
+        if limit <= 0:
+            return []
+        now = time.time() if now is None else now
+        paths = [row[0] for row in self.db.execute(
+            "SELECT path FROM files WHERE state = 'pending' AND seen_at <= ? ORDER BY seen_at, path LIMIT ?",
+            (now, limit)
+        )]
+        self.db.executemany("UPDATE files SET state = 'running' WHERE path = ?", [(path,) for path in paths])
+        self.db.commit()
+        return paths
+
+    def complete(self, path, now=None):
+        """
+        Marks a running file as done. A file that changed while it was parsed goes back to
+        settling instead; returns False in that case, as its output is already out of date.
+        """
+        cursor = self.db.execute(
+            "UPDATE files SET state = 'done', error = NULL WHERE path = ? AND state = 'running'", (path,)
+        )
+        done = cursor.rowcount > 0
+        if not done:
+            self._resettle(path, now)
+        self.db.commit()
+        return done
+
+    def _resettle(self, path, now=None):
+        """
+        Sends a file that changed while it was parsed back to settling.
+        """
+        now = time.time() if now is None else now
+        self.db.execute("UPDATE files SET state = 'settling', seen_at = ? WHERE path = ? AND state = 'changed'",
+                        (now, path))
+
+    def fail(self, path, error, now=None):
+        """
+        Records a failed parse; the file is retried after RETRY_DELAY seconds per failed
+        attempt, until it has failed MAX_ATTEMPTS times. A file that changed while it was
+        parsed goes back to settling without counting the attempt.
+        """
+        now = time.time() if now is None else now
+        self.db.execute("""
+            UPDATE files SET
+                attempts = attempts + 1,
+                error = ?,
+                seen_at = ? + ? * (attempts + 1),
+                state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+            WHERE path = ? AND state = 'running'
+        """, (error, now, RETRY_DELAY, MAX_ATTEMPTS, path))
+        self._resettle(path, now)
+        self.db.commit()
+
+    def counts(self):
+        """
+        Returns the number of files in each state.
+        """
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM files GROUP BY state"))
+
+    def close(self):
+        self.db.close()
+
+
+class CableReports:
+    """
+    Keeps the extracted rows of every parsed dump in SQLite, grouped by cable, and rewrites
+    only the reports of cables that received new, changed or removed shots.
+    """
+
+    def __init__(self, db_path, report_folder, pass_tolerance=0.3, warning_tolerance=0.6, wide=False):
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS shots (
+                dump TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                cable TEXT NOT NULL,
+                shot TEXT NOT NULL,
+                events TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS shots_cable ON shots (cable);
+            CREATE INDEX IF NOT EXISTS shots_source ON shots (source);
+            CREATE TABLE IF NOT EXISTS dirty (cable TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS stamps (
+                dump TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL
+            );
+        """)
+        self.report_folder = report_folder
+        self.pass_tolerance = pass_tolerance
+        self.warning_tolerance = warning_tolerance
+        self.wide = wide
+
+    def add(self, source, dump_path):
+        """
+        Extracts one dump and stores its rows under its cable; both the old and the new
+        cable of a shot are marked for a report refresh.
+        """
+        st = os.stat(dump_path)
+        shot_row, event_rows = report.extract_shot(report.load_dump(dump_path))
+        cable = str(shot_row[4])
+        previous = self.db.execute("SELECT cable FROM shots WHERE dump = ?", (dump_path,)).fetchone()
+        self.db.execute(
+            "INSERT OR REPLACE INTO shots (dump, source, cable, shot, events) VALUES (?, ?, ?, ?, ?)",
+            (dump_path, source, cable, json.dumps(list(shot_row)), json.dumps(event_rows))
+        )
+        self.db.execute("INSERT OR REPLACE INTO stamps (dump, size, mtime) VALUES (?, ?, ?)",
+                        (dump_path, st.st_size, st.st_mtime_ns))
+        for dirty in {cable, previous[0] if previous else cable}:
+            self.db.execute("INSERT OR IGNORE INTO dirty (cable) VALUES (?)", (dirty,))
+        self.db.commit()
+
+    def is_current(self, dump_path):
+        """
+        Returns True if the rows of this dump are stored and the dump has not changed since.
+        """
+        stamp = self.db.execute("SELECT size, mtime FROM stamps WHERE dump = ?", (dump_path,)).fetchone()
+        try:
+            st = os.stat(dump_path)
+        except OSError:
+            return False
+        return stamp is not None and tuple(stamp) == (st.st_size, st.st_mtime_ns)
+
+    def remove(self, source):
+        """
+        Drops the rows of a deleted source file and marks its cable for a refresh.
+        """
+        for (cable,) in self.db.execute("SELECT cable FROM shots WHERE source = ?", (source,)).fetchall():
+            self.db.execute("INSERT OR IGNORE INTO dirty (cable) VALUES (?)", (cable,))
+        self.db.execute("DELETE FROM stamps WHERE dump IN (SELECT dump FROM shots WHERE source = ?)", (source,))
+        self.db.execute("DELETE FROM shots WHERE source = ?", (source,))
+        self.db.commit()
+
+    def report_path(self, cable):
+        """
+        Returns the report file for a cable.
+        """
+        name = re.sub(r"[^\w.-]+", "_", cable).strip("._") or "no_cable"
+        return os.path.join(self.report_folder, name + ".xlsx")
+
+    def refresh(self):
+        """
+        Rewrites the report of every dirty cable from its stored rows; a cable whose report
+        cannot be written (for example, open in Excel) stays dirty for the next refresh.
+        Returns the list of (cable, error) for the reports that failed.
+        """
+        os.makedirs(self.report_folder, exist_ok=True)
+        failed = []
+        for (cable,) in self.db.execute("SELECT cable FROM dirty").fetchall():
+            rows = self.db.execute(
+                "SELECT dump, shot, events FROM shots WHERE cable = ? ORDER BY dump", (cable,)
+            ).fetchall()
+            save_path = self.report_path(cable)
+            try:
+                if rows:
+                    shots, events = report.tables_from_extracted(
+                        (dump, (json.loads(shot), json.loads(events))) for dump, shot, events in rows
+                    )
+                    report.classify_events(shots, events, self.pass_tolerance, self.warning_tolerance)
+                    tmp_path = save_path + ".tmp.xlsx"
+                    report.write_xlsx_report(shots, events, tmp_path, wide=self.wide)
+                    os.replace(tmp_path, save_path)
+                elif os.path.exists(save_path):
+                    os.remove(save_path)
+            except OSError as e:
+                failed.append((cable, str(e)))
+                continue
+            self.db.execute("DELETE FROM dirty WHERE cable = ?", (cable,))
+            self.db.commit()
+        return failed
+
+    def close(self):
+        self.db.close()
+
+
+class Watcher:
+    """
+    Watches an input tree for .sor files and keeps their JSON dumps and the per-cable
+    reports up to date. Files are debounced until they stop changing, queued persistently,
+    and parsed on a bounded pool of persistent Ruby workers; no more than max_in_flight
+    files are held in memory at once however many are waiting. Dumps are written in
+    dump_format, one of sorbatch.DUMP_FORMATS.
+    """
+
+    def __init__(self, input_folder, output_folder, rbOTDR_path, report_folder=None, workers=None,
+                 poll_interval=DEFAULT_POLL_INTERVAL, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 report_interval=DEFAULT_REPORT_INTERVAL, max_in_flight=None, traces=False,
+                 dump_format="pretty", pass_tolerance=0.3, warning_tolerance=0.6, wide=False, log=print):
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.rbOTDR_path = rbOTDR_path
+        self.report_folder = report_folder or os.path.join(output_folder, "reports")
+        self.workers = workers or sorbatch.default_workers()
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.report_interval = report_interval
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.traces = traces
+        self.dump_format = dump_format
+        self.pass_tolerance = pass_tolerance
+        self.warning_tolerance = warning_tolerance
+        self.wide = wide
+        self.log = log
+
+    def run(self, stop_event=None):
+        """
+        Runs until stop_event is set (or forever). Files already being parsed are finished
+        before returning; anything still queued is picked up by the next run.
+        """
+        stop_event = stop_event or threading.Event()
+        os.makedirs(self.output_folder, exist_ok=True)
+        db_path = os.path.join(self.output_folder, QUEUE_NAME)
+        queue = IngestQueue(db_path)
+        reports = CableReports(db_path, self.report_folder, self.pass_tolerance, self.warning_tolerance, self.wide)
+        manifest = sorbatch.Manifest(self.output_folder, sorbatch.parser_version(self.rbOTDR_path)).load()
+        pool = sorbatch.WorkerPool(self.rbOTDR_path, self.output_folder, size=self.workers)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        in_flight = {}
+        next_scan = 0.0
+        next_report = time.monotonic() + self.report_interval
+        changed = True  # reports left dirty by a previous run are written first
+
+        try:
+            while not stop_event.is_set() or in_flight:
+                now = time.monotonic()
+                if not stop_event.is_set() and now >= next_scan:
+                    for source in queue.scan(self.input_folder):
+                        manifest.forget(source)
+                        reports.remove(source)
+                        self.log(f"Removed {source}")
+                        changed = True
+                    queue.promote(self.settle_seconds)
+                    next_scan = now + self.poll_interval
+
+                # Backpressure: only claim as many files as there are free slots
+                if not stop_event.is_set():
+                    for path in queue.claim(self.max_in_flight - len(in_flight)):
+                        try:
+                            current = manifest.is_current(path, self.output_folder, self.traces, self.dump_format)
+                            # Stat and hash before parsing, so the manifest describes what was parsed
+                            state = None if current else sorbatch.file_state(path)
+                        except OSError as e:  # deleted or renamed since the scan
+                            queue.fail(path, str(e))
+                            self.log(f"Error processing {path}: {type(e).__name__}: {e}")
+                            continue
+                        if current:
+                            # Parsed earlier (for example by a batch run); make sure its rows are in the reports
+                            dump_path = sorbatch.output_path(path, self.output_folder, self.dump_format)
+                            if not reports.is_current(dump_path):
+                                try:
+                                    reports.add(path, dump_path)
+                                    changed = True
+                                except Exception as e:
+                                    self.log(f"Error processing {path}: {type(e).__name__}: {e}")
+                            queue.complete(path)
+                            continue
+                        future = executor.submit(pool.parse, path, None, self.traces, None, self.dump_format)
+                        in_flight[future] = path, state
+
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=min(self.poll_interval, 1.0), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, state = in_flight.pop(future)
+                        error = future.result()
+                        if error:
+                            queue.fail(path, error)
+                            self.log(f"Error processing {path}: {error}")
+                            continue
+                        if not queue.complete(path):
+                            # Changed while it was parsed, so it is parsed again once it settles,
+                            # or deleted, so its output goes too
+                            if not os.path.exists(path):
+                                manifest.record(path, self.output_folder, traces=self.traces,
+                                                dump_format=self.dump_format, state=state)
+                                manifest.forget(path)
+                            continue
+                        manifest.record(path, self.output_folder, traces=self.traces, dump_format=self.dump_format,
+                                        state=state)
+                        try:
+                            reports.add(path, sorbatch.output_path(path, self.output_folder, self.dump_format))
+                        except Exception as e:
+                            self.log(f"Error processing {path}: {type(e).__name__}: {e}")
+                            continue
+                        self.log(f"Parsed {path}")
+                        changed = True
+                else:
+                    stop_event.wait(max(0.0, min(next_scan - time.monotonic(), self.poll_interval)))
+
+                # Refresh the reports when the queue drains, and periodically during a burst
+                if changed and (not in_flight or time.monotonic() >= next_report):
+                    manifest.save()
+                    for cable, error in reports.refresh():
+                        self.log(f"Could not write the report for cable {cable!r}: {error}")
+                    counts = queue.counts()
+                    self.log(f"{counts.get('done', 0)} parsed, {counts.get('pending', 0)} queued, "
+                             f"{counts.get('settling', 0)} settling, {counts.get('failed', 0)} failed.")
+                    next_report = time.monotonic() + self.report_interval
+                    changed = False
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            pool.close()
+            manifest.save()
+            reports.close()
+            queue.close()